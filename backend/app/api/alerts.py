@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from app.services.alert_service import AlertService
+from app.core.dependencies import get_alert_service
+from app.core.security import is_admin_key, issue_device_token, require_admin, verify_device_token
 
 router = APIRouter()
-alert_service = AlertService()
+
+async def require_profile_owner(profile_id: str, x_device_token: Optional[str] = Header(None),
+                                x_admin_key: Optional[str] = Header(None)):
+    """
+    Profile của device chỉ được đọc / sửa bởi chính device đó (header X-Device-Token) hoặc admin (X-Admin-Key)
+    """
+    if is_admin_key(x_admin_key):
+        return
+    device_id = verify_device_token(x_device_token)
+    if device_id is None:
+        raise HTTPException(status_code=401, detail="Thiếu hoặc sai device token (header X-Device-Token)")
+    if device_id != profile_id:
+        raise HTTPException(status_code=403, detail="Không có quyền với profile của thiết bị khác")
 
 class AlertSettings(BaseModel):
     sound_type: str
@@ -14,6 +28,16 @@ class AlertSettings(BaseModel):
     sensitivity: float
     notification_method: List[str]  # ["visual", "vibration", "email"]
 
+class AlertProfileSetting(BaseModel):
+    sound_type: str
+    enabled: bool = True
+    sensitivity: float
+
+class BatchDetection(BaseModel):
+    device_ids: List[str]
+    sound_types: List[str]
+    scores: List[List[float]]  # [số stream, số sound type]
+
 class AlertHistory(BaseModel):
     id: str
     sound_type: str
@@ -22,12 +46,12 @@ class AlertHistory(BaseModel):
     location: Optional[str] = None
 
 @router.post("/configure")
-async def configure_alerts(settings: List[AlertSettings]):
+async def configure_alerts(settings: List[AlertSettings], alert_service: AlertService = Depends(get_alert_service)):
     """
     Cấu hình cài đặt cảnh báo cho các loại âm thanh
     """
     try:
-        result = await alert_service.configure_alerts(settings)
+        result = await alert_service.configure_alerts([setting.model_dump() for setting in settings])
         return JSONResponse({
             "success": True,
             "message": "Cấu hình cảnh báo thành công",
@@ -37,7 +61,7 @@ async def configure_alerts(settings: List[AlertSettings]):
         raise HTTPException(status_code=500, detail=f"Lỗi cấu hình: {str(e)}")
 
 @router.get("/settings")
-async def get_alert_settings():
+async def get_alert_settings(alert_service: AlertService = Depends(get_alert_service)):
     """
     Lấy cài đặt cảnh báo hiện tại
     """
@@ -75,10 +99,73 @@ async def get_alert_settings():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lấy cài đặt: {str(e)}")
 
+@router.put("/profiles/{profile_id}", dependencies=[Depends(require_profile_owner)])
+async def set_alert_profile(profile_id: str, settings: List[AlertProfileSetting], alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Tạo / cập nhật profile cảnh báo riêng cho một user hoặc device
+    """
+    try:
+        alert_service.profiles.set_profile(profile_id, [setting.model_dump() for setting in settings])
+        return {
+            "success": True,
+            "profile_id": profile_id,
+            "profile": alert_service.profiles.get_profile(profile_id)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi cập nhật profile: {str(e)}")
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_profile_owner)])
+async def get_alert_profile(profile_id: str, alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Lấy profile cảnh báo của một user hoặc device
+    """
+    profile = alert_service.profiles.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return {"profile_id": profile_id, "profile": profile}
+
+@router.delete("/profiles/{profile_id}", dependencies=[Depends(require_profile_owner)])
+async def delete_alert_profile(profile_id: str, alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Xóa profile (device quay về dùng profile mặc định)
+    """
+    if not alert_service.profiles.delete_profile(profile_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return {"success": True, "message": "Đã xóa profile"}
+
+@router.post("/devices/{device_id}/token", dependencies=[Depends(require_admin)])
+async def create_device_token(device_id: str):
+    """
+    Cấp token cho thiết bị (admin). Thiết bị gửi token trong header X-Device-Token (HTTP / WebSocket)
+    hoặc trong auth {"device_token": ...} khi kết nối Socket.IO.
+    """
+    try:
+        return {"device_id": device_id, "device_token": issue_device_token(device_id)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/evaluate", dependencies=[Depends(require_admin)])
+async def evaluate_detections(batch: BatchDetection, alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Đánh giá điểm số của nhiều stream với profile của từng device trong một lần
+    (admin - dành cho gateway / dịch vụ nội bộ, vì alert được đẩy tới room của các device trong payload)
+    """
+    try:
+        if len(batch.scores) != len(batch.device_ids):
+            raise ValueError("Số hàng scores phải bằng số device_ids")
+        if any(len(row) != len(batch.sound_types) for row in batch.scores):
+            raise ValueError("Mỗi hàng scores phải có đúng một điểm cho mỗi sound type")
+        return await alert_service.evaluate_batch(batch.device_ids, batch.scores, batch.sound_types)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi đánh giá: {str(e)}")
+
 @router.get("/history")
 async def get_alert_history(
     limit: int = 50,
-    sound_type: Optional[str] = None
+    sound_type: Optional[str] = None,
+    alert_service: AlertService = Depends(get_alert_service)
 ):
     """
     Lấy lịch sử cảnh báo
@@ -94,7 +181,7 @@ async def get_alert_history(
         raise HTTPException(status_code=500, detail=f"Lỗi lấy lịch sử: {str(e)}")
 
 @router.post("/test")
-async def test_alert_system():
+async def test_alert_system(alert_service: AlertService = Depends(get_alert_service)):
     """
     Test hệ thống cảnh báo
     """
@@ -110,7 +197,7 @@ async def test_alert_system():
         raise HTTPException(status_code=500, detail=f"Lỗi test hệ thống: {str(e)}")
 
 @router.delete("/history/{alert_id}")
-async def delete_alert(alert_id: str):
+async def delete_alert(alert_id: str, alert_service: AlertService = Depends(get_alert_service)):
     """
     Xóa một cảnh báo khỏi lịch sử
     """
@@ -124,7 +211,7 @@ async def delete_alert(alert_id: str):
         raise HTTPException(status_code=500, detail=f"Lỗi xóa cảnh báo: {str(e)}")
 
 @router.get("/statistics")
-async def get_alert_statistics():
+async def get_alert_statistics(alert_service: AlertService = Depends(get_alert_service)):
     """
     Thống kê cảnh báo theo ngày/tuần/tháng
     """
@@ -137,4 +224,42 @@ async def get_alert_statistics():
             "most_common_alerts": stats["common_types"]
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi lấy thống kê: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi lấy thống kê: {str(e)}") 
+
+@router.get("/dispatch/stats")
+async def get_dispatch_stats(alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Trạng thái hàng đợi phân phối và histogram độ trễ từ lúc phát hiện tới lúc gửi
+    """
+    try:
+        return alert_service.dispatcher.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi lấy thống kê phân phối: {str(e)}")
+
+@router.get("/events/stats")
+async def get_event_stats(alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Thống kê gộp sự kiện: số phát hiện, số alert thực sự được tạo và tỉ lệ gộp
+    """
+    try:
+        return alert_service.debouncer.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi lấy thống kê sự kiện: {str(e)}")
+
+@router.get("/bus/stats")
+async def get_bus_stats(alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Trạng thái đồng bộ lịch sử cảnh báo giữa các worker
+    """
+    if alert_service.bus is None:
+        return {"backend": "none"}
+    return alert_service.bus.get_stats()
+
+@router.get("/log/stats")
+async def get_log_stats(alert_service: AlertService = Depends(get_alert_service)):
+    """
+    Trạng thái write-ahead log của lịch sử cảnh báo
+    """
+    if alert_service.log is None:
+        return {"enabled": False}
+    return {"enabled": True, **alert_service.log.get_stats()}
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
+from typing import List, Optional
 import tempfile
 import os
-from app.services.audio_classifier_service import AudioClassifierService
+from app.services.alert_service import AlertService
+from app.services.alert_dispatcher import PRIORITY_RANK
+from app.services.audio_classifier_service import AudioClassifierService, CRITICAL_SOUND_CLASSES
+from app.services.custom_sounds import CustomSoundStore, sound_type_for
+from app.core.dependencies import get_alert_service, get_audio_classifier, get_custom_sounds
+from app.core.deadline import DeadlineExceeded
+from app.core.security import require_device
 
 router = APIRouter()
-audio_classifier = AudioClassifierService()
 
 @router.post("/classify")
 async def classify_audio(
     file: UploadFile = File(...),
-    top_k: int = 5
+    top_k: int = 5,
+    audio_classifier: AudioClassifierService = Depends(get_audio_classifier)
 ):
     """
     Phân loại âm thanh sử dụng YAMNet
@@ -43,22 +51,38 @@ async def classify_audio(
             if os.path.exists(tmp_file_path):
                 os.unlink(tmp_file_path)
                 
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi phân loại âm thanh: {str(e)}")
 
 @router.get("/sound-classes")
-async def get_sound_classes():
+async def get_sound_classes(
+    q: Optional[str] = None,
+    parent: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50,
+    audio_classifier: AudioClassifierService = Depends(get_audio_classifier)
+):
     """
-    Lấy danh sách các loại âm thanh YAMNet có thể nhận diện
+    Lấy danh sách các loại âm thanh YAMNet có thể nhận diện, có phân trang.
+    q: tìm theo tiền tố các từ trong tên ("fire al"); parent: chỉ các class thuộc một nhóm ("Alarm")
     """
     try:
-        classes = await audio_classifier.get_available_classes()
+        if offset < 0 or not 1 <= limit <= 200:
+            raise HTTPException(status_code=400, detail="offset phải >= 0 và limit trong khoảng 1-200")
+        page = await audio_classifier.search_classes(q, parent, offset, limit)
         return {
-            "total_classes": len(classes),
-            "classes": classes[:50],  # Trả về 50 class đầu tiên
+            "total_classes": audio_classifier.ontology.num_classes,
+            "total": page["total"],
+            "offset": offset,
+            "limit": limit,
+            "classes": page["items"],
             "model": "YAMNet",
             "accuracy": "85%"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lấy danh sách: {str(e)}")
 
@@ -74,34 +98,34 @@ async def get_critical_sounds():
                 "name": "Báo cháy",
                 "description": "Tiếng báo cháy, khói",
                 "priority": "high",
-                "yamnet_classes": ["Smoke detector, smoke alarm", "Fire alarm"]
+                "yamnet_classes": CRITICAL_SOUND_CLASSES["fire_alarm"]
             },
             {
                 "id": "doorbell",
                 "name": "Chuông cửa",
                 "description": "Tiếng chuông cửa, gõ cửa",
                 "priority": "medium",
-                "yamnet_classes": ["Doorbell", "Knock"]
+                "yamnet_classes": CRITICAL_SOUND_CLASSES["doorbell"]
             },
             {
                 "id": "baby_cry",
                 "name": "Tiếng khóc trẻ em",
                 "description": "Tiếng khóc của trẻ em, trẻ sơ sinh",
                 "priority": "high",
-                "yamnet_classes": ["Baby cry, infant cry", "Child speech, kid speaking"]
+                "yamnet_classes": CRITICAL_SOUND_CLASSES["baby_cry"]
             },
             {
                 "id": "phone_ring",
                 "name": "Chuông điện thoại",
                 "description": "Tiếng chuông điện thoại",
                 "priority": "medium",
-                "yamnet_classes": ["Telephone bell ringing", "Ringtone"]
+                "yamnet_classes": CRITICAL_SOUND_CLASSES["phone_ring"]
             }
         ]
     }
 
 @router.get("/status")
-async def get_classifier_status():
+async def get_classifier_status(audio_classifier: AudioClassifierService = Depends(get_audio_classifier)):
     """
     Kiểm tra trạng thái dịch vụ Audio Classification
     """
@@ -119,4 +143,134 @@ async def get_classifier_status():
             "service": "YAMNet Audio Classifier",
             "status": "error",
             "error": str(e)
-        } 
\ No newline at end of file
+        }
+
+async def _embed_uploads(files: List[UploadFile], audio_classifier: AudioClassifierService) -> list:
+    """Embedding của từng file upload (file tạm được xóa ngay sau khi tính)"""
+    embeddings = []
+    for file in files:
+        if not file.content_type or not file.content_type.startswith('audio/'):
+            raise HTTPException(status_code=400, detail=f"File phải là định dạng âm thanh: {file.filename}")
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
+            tmp_file.write(await file.read())
+            tmp_file_path = tmp_file.name
+        try:
+            embeddings.append(await audio_classifier.embed_audio_file(tmp_file_path))
+        finally:
+            if os.path.exists(tmp_file_path):
+                os.unlink(tmp_file_path)
+    return embeddings
+
+@router.post("/custom-sounds")
+async def enroll_custom_sound(
+    name: str = Form(...),
+    files: List[UploadFile] = File(...),
+    threshold: Optional[float] = Form(None),
+    priority: str = Form("medium"),
+    audio_classifier: AudioClassifierService = Depends(get_audio_classifier),
+    custom_sounds: CustomSoundStore = Depends(get_custom_sounds),
+    alert_service: AlertService = Depends(get_alert_service),
+    device_id: str = Depends(require_device)
+):
+    """
+    Đăng ký âm thanh riêng của hộ gia đình từ vài clip mẫu.
+    Âm thanh thuộc thiết bị trong header X-Device-Token (cùng token với auth của phiên live).
+    """
+    try:
+        if threshold is not None and not 0 < threshold <= 1:
+            raise HTTPException(status_code=400, detail="threshold phải trong khoảng (0, 1]")
+        if priority not in PRIORITY_RANK:
+            raise HTTPException(status_code=400, detail=f"priority phải là một trong: {', '.join(PRIORITY_RANK)}")
+        embeddings = await _embed_uploads(files, audio_classifier)
+        sound = await asyncio.to_thread(custom_sounds.enroll, device_id, name, embeddings, threshold, priority)
+        alert_service.register_sound_type(sound["sound_type"], sound["threshold"], sound["priority"])
+        return {"success": True, "sound": sound}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi đăng ký custom sound: {str(e)}")
+
+@router.get("/custom-sounds")
+async def list_custom_sounds(
+    custom_sounds: CustomSoundStore = Depends(get_custom_sounds),
+    device_id: str = Depends(require_device)
+):
+    """
+    Danh sách custom sound của thiết bị
+    """
+    sounds = custom_sounds.list_sounds(device_id)
+    return {"tenant": device_id, "total": len(sounds), "sounds": sounds}
+
+@router.post("/custom-sounds/match")
+async def match_custom_sounds(
+    file: UploadFile = File(...),
+    top_k: int = 3,
+    audio_classifier: AudioClassifierService = Depends(get_audio_classifier),
+    custom_sounds: CustomSoundStore = Depends(get_custom_sounds),
+    device_id: str = Depends(require_device)
+):
+    """
+    So khớp một file với custom sound của thiết bị (để thử ngưỡng sau khi đăng ký)
+    """
+    try:
+        embeddings = (await _embed_uploads([file], audio_classifier))[0]
+        results = await asyncio.to_thread(custom_sounds.search, device_id, embeddings, top_k)
+        return {
+            "matches": [{**result, "matched": result["score"] >= result["threshold"]} for result in results]
+        }
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi so khớp custom sound: {str(e)}")
+
+@router.post("/custom-sounds/{sound_id}/examples")
+async def add_custom_sound_examples(
+    sound_id: str,
+    files: List[UploadFile] = File(...),
+    audio_classifier: AudioClassifierService = Depends(get_audio_classifier),
+    custom_sounds: CustomSoundStore = Depends(get_custom_sounds),
+    device_id: str = Depends(require_device)
+):
+    """
+    Thêm clip mẫu cho custom sound đã đăng ký
+    """
+    try:
+        embeddings = await _embed_uploads(files, audio_classifier)
+        sound = await asyncio.to_thread(custom_sounds.add_examples, device_id, sound_id, embeddings)
+        if sound is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy custom sound")
+        return {"success": True, "sound": sound}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi thêm clip mẫu: {str(e)}")
+
+@router.delete("/custom-sounds/{sound_id}")
+async def delete_custom_sound(
+    sound_id: str,
+    custom_sounds: CustomSoundStore = Depends(get_custom_sounds),
+    alert_service: AlertService = Depends(get_alert_service),
+    device_id: str = Depends(require_device)
+):
+    """
+    Xóa custom sound của thiết bị
+    """
+    try:
+        if not await asyncio.to_thread(custom_sounds.remove, device_id, sound_id):
+            raise HTTPException(status_code=404, detail="Không tìm thấy custom sound")
+        alert_service.unregister_sound_type(sound_type_for(sound_id))
+        return {"success": True, "message": "Đã xóa custom sound"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi xóa custom sound: {str(e)}")
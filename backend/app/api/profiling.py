@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.core.profiling import request_profiler
+from app.core.security import require_admin
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    Danh sách profile gần nhất (mới nhất trước)
+    """
+    return {
+        "stats": request_profiler.get_stats(),
+        "profiles": request_profiler.list_profiles()
+    }
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, top: int = 50):
+    """
+    Chi tiết một profile: các stack xuất hiện nhiều nhất và top cấp phát bộ nhớ (nếu có)
+    """
+    capture = request_profiler.get_profile(profile_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return {
+        **capture.summary(),
+        "top_stacks": [
+            {"stack": stack.split(";"), "samples": count}
+            for stack, count in capture.stacks.most_common(top)
+        ],
+        "memory": capture.memory
+    }
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: int):
+    """
+    Profile ở định dạng collapsed stack (flamegraph.pl, inferno, speedscope)
+    """
+    capture = request_profiler.get_profile(profile_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    return PlainTextResponse(capture.collapsed())
+
+@router.delete("/profiles")
+async def clear_profiles():
+    """
+    Xóa toàn bộ profile đã lưu
+    """
+    return {"success": True, "deleted": request_profiler.clear()}
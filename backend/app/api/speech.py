@@ -1,17 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 import tempfile
 import os
 from app.services.speech_service import SpeechService
+from app.core.dependencies import get_speech_service
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded
 
 router = APIRouter()
-speech_service = SpeechService()
 
 @router.post("/upload")
 async def speech_to_text_upload(
     file: UploadFile = File(...),
-    language: str = "vi-VN"
+    language: str = "vi-VN",
+    speech_service: SpeechService = Depends(get_speech_service)
 ):
     """
     Upload file âm thanh và chuyển đổi thành văn bản
@@ -44,6 +46,8 @@ async def speech_to_text_upload(
             if os.path.exists(tmp_file_path):
                 os.unlink(tmp_file_path)
                 
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý: {str(e)}")
 
@@ -60,7 +64,7 @@ async def get_supported_languages():
     }
 
 @router.get("/status")
-async def get_speech_service_status():
+async def get_speech_service_status(speech_service: SpeechService = Depends(get_speech_service)):
     """
     Kiểm tra trạng thái dịch vụ Speech-to-Text
     """
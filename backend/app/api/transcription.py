@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+import time
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from app.services.transcription_service import TranscriptionService
+from app.core.dependencies import get_transcription_service
+from app.services.flow_control import FlowController
+from app.services.result_stabilizer import ResultStabilizer
+from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, check_deadline, deadline_context, frame_deadline
+from app.core.security import require_admin
+from app.core.live_protocol import LiveProtocol, ProtocolError, negotiate_protocol
 
 router = APIRouter()
-transcription_service = TranscriptionService()
 
 class TranscriptionSession(BaseModel):
     session_id: str
@@ -23,61 +30,98 @@ class TranscriptionSegment(BaseModel):
     duration: float
 
 @router.websocket("/live")
-async def websocket_transcription(websocket: WebSocket):
+async def websocket_transcription(websocket: WebSocket, transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     WebSocket endpoint cho real-time transcription
     """
     await websocket.accept()
     session_id = None
+    protocol = LiveProtocol()
+    stabilizer = None
     
     try:
         # Nhận cấu hình từ client
         config = await websocket.receive_json()
         language = config.get("language", "vi-VN")
+        protocol = LiveProtocol(negotiate_protocol(config), settings.sample_rate)
+        stabilizer = ResultStabilizer(delta=config.get("interim") == "delta")
+        deadline_ms = config.get("deadline_ms")
+        flow = FlowController(settings.sample_rate, can_change_sample_rate=protocol.is_binary)
+        frame_params = flow.negotiate(config)
+        
+        async def send_transcription(emitted, frame):
+            await protocol.send(websocket, protocol.transcription_message(emitted, frame))
         
         # Bắt đầu session transcription
         session_id = await transcription_service.start_session(language)
         
+        # Handshake luôn gửi bằng JSON để client biết giao thức đã được chọn
         await websocket.send_json({
             "type": "session_started",
             "session_id": session_id,
             "language": language,
+            "protocol": protocol.protocol,
+            "interim": "delta" if stabilizer.delta else "full",
+            **frame_params,
             "message": "Phiên transcription đã bắt đầu"
         })
         
         while True:
             # Nhận audio data từ client
             data = await websocket.receive_bytes()
+            started = time.perf_counter()
             
-            # Xử lý audio và trả về transcription
-            result = await transcription_service.process_audio_chunk(
-                session_id, data
-            )
-            
-            if result and result["text"]:
-                await websocket.send_json({
-                    "type": "transcription",
-                    "text": result["text"],
-                    "confidence": result["confidence"],
-                    "is_final": result["is_final"],
-                    "timestamp": datetime.now().isoformat()
+            try:
+                frame = protocol.decode_audio(data)
+            except ProtocolError as e:
+                await protocol.send(websocket, {
+                    "type": "error",
+                    "message": f"Frame không hợp lệ: {str(e)}"
                 })
+                continue
+            
+            # Xử lý audio và trả về transcription; caption quá deadline bị bỏ
+            with deadline_context(frame_deadline(frame["capture_ts_us"], deadline_ms)):
+                try:
+                    result = await transcription_service.process_audio_chunk(
+                        session_id, frame["pcm"], frame["seq"], frame["capture_ts_us"]
+                    )
+                    
+                    if result and result["text"]:
+                        # Bỏ partial trùng lặp / quá dày, final luôn được gửi ngay
+                        check_deadline("emit")
+                        emitted = stabilizer.push(result, meta=frame)
+                        if emitted is not None:
+                            await protocol.send(websocket, protocol.transcription_message(emitted, frame))
+                        # Partial bị giới hạn tần suất được gửi khi cửa sổ mở lại
+                        stabilizer.schedule_flush(send_transcription)
+                except DeadlineExceeded:
+                    pass
+            
+            # Đo độ trễ xử lý, yêu cầu client đổi kích thước frame / tốc độ gửi khi cần
+            adjustment = flow.observe(len(frame["pcm"]), time.perf_counter() - started, frame["capture_ts_us"])
+            if adjustment is not None:
+                await protocol.send(websocket, adjustment)
                 
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
-        await websocket.send_json({
+        await protocol.send(websocket, {
             "type": "error",
             "message": f"Lỗi transcription: {str(e)}"
         })
     finally:
-        if session_id:
+        if stabilizer is not None:
+            stabilizer.close()
+        # Session có thể đã bị reaper kết thúc nếu client im lặng quá lâu
+        if session_id and transcription_service.is_active(session_id):
             await transcription_service.end_session(session_id)
 
 @router.post("/session/start")
 async def start_transcription_session(
     language: str = "vi-VN",
-    participants: List[str] = []
+    participants: List[str] = [],
+    transcription_service: TranscriptionService = Depends(get_transcription_service)
 ):
     """
     Bắt đầu phiên transcription mới
@@ -95,7 +139,7 @@ async def start_transcription_session(
         raise HTTPException(status_code=500, detail=f"Lỗi tạo session: {str(e)}")
 
 @router.post("/session/{session_id}/end")
-async def end_transcription_session(session_id: str):
+async def end_transcription_session(session_id: str, transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     Kết thúc phiên transcription
     """
@@ -112,7 +156,7 @@ async def end_transcription_session(session_id: str):
         raise HTTPException(status_code=500, detail=f"Lỗi kết thúc session: {str(e)}")
 
 @router.get("/session/{session_id}/transcript")
-async def get_session_transcript(session_id: str):
+async def get_session_transcript(session_id: str, transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     Lấy bản transcript đầy đủ của phiên
     """
@@ -128,8 +172,18 @@ async def get_session_transcript(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lấy transcript: {str(e)}")
 
+@router.post("/session/{session_id}/replay")
+async def replay_transcription_session(session_id: str, speed: float = 0.0, transcription_service: TranscriptionService = Depends(get_transcription_service)):
+    """
+    Transcribe lại audio đã lưu của phiên qua pipeline hiện tại (speed = 0: nhanh nhất có thể)
+    """
+    try:
+        return await transcription_service.replay_session(session_id, speed)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi replay: {str(e)}")
+
 @router.get("/sessions")
-async def get_transcription_sessions(limit: int = 20):
+async def get_transcription_sessions(limit: int = 20, transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     Lấy danh sách các phiên transcription
     """
@@ -143,7 +197,7 @@ async def get_transcription_sessions(limit: int = 20):
         raise HTTPException(status_code=500, detail=f"Lỗi lấy danh sách session: {str(e)}")
 
 @router.delete("/session/{session_id}")
-async def delete_transcription_session(session_id: str):
+async def delete_transcription_session(session_id: str, transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     Xóa phiên transcription
     """
@@ -157,7 +211,7 @@ async def delete_transcription_session(session_id: str):
         raise HTTPException(status_code=500, detail=f"Lỗi xóa session: {str(e)}")
 
 @router.post("/session/{session_id}/export")
-async def export_transcript(session_id: str, format: str = "txt"):
+async def export_transcript(session_id: str, format: str = "txt", transcription_service: TranscriptionService = Depends(get_transcription_service)):
     """
     Export transcript ra file (txt, docx, pdf)
     """
@@ -173,4 +227,14 @@ async def export_transcript(session_id: str, format: str = "txt"):
             "download_url": f"/api/transcription/download/{session_id}.{format}"
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi export: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi export: {str(e)}") 
+
+@router.get("/admin/sessions", dependencies=[Depends(require_admin)])
+async def get_session_memory_report(transcription_service: TranscriptionService = Depends(get_transcription_service)):
+    """
+    Số phiên đang chạy và bộ nhớ ước lượng của từng phiên (admin)
+    """
+    try:
+        return transcription_service.get_memory_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi lấy thông tin session: {str(e)}")
@@ -0,0 +1,268 @@
+"""
+Chạy transcription / phân loại âm thanh hàng loạt trên kho audio đã ghi.
+
+Dùng lại SpeechService và AudioClassifierService, chia việc cho một process pool
+(mặc định bằng số core), ghi kết quả ra JSONL hoặc Parquet và lưu checkpoint để
+job bị gián đoạn có thể chạy tiếp từ chỗ dừng.
+
+Ví dụ (chạy từ thư mục backend):
+
+    python -m app.cli.batch recordings/ -o results.jsonl --tasks transcribe,classify
+    python -m app.cli.batch manifest.csv -o results.parquet --format parquet --workers 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, List, Optional
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+TASKS = ("transcribe", "classify")
+
+# Trạng thái riêng của từng worker process
+_worker = {}
+
+
+def _init_worker(tasks: List[str], top_k: int):
+    """Khởi tạo service một lần cho mỗi process"""
+    _worker["loop"] = asyncio.new_event_loop()
+    _worker["top_k"] = top_k
+    _worker["errors"] = {}
+
+    if "transcribe" in tasks:
+        from app.services.speech_service import SpeechService
+        _worker["speech"] = SpeechService()
+
+    if "classify" in tasks:
+        try:
+            from app.services.audio_classifier_service import AudioClassifierService
+            _worker["classifier"] = AudioClassifierService()
+        except Exception as e:
+            # Thiếu tensorflow - báo lỗi theo từng file thay vì làm hỏng cả job
+            _worker["errors"]["classify"] = str(e)
+
+
+def _process_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    loop = _worker["loop"]
+    result = {"path": item["path"], "status": "ok", "pid": os.getpid()}
+    started = time.perf_counter()
+
+    try:
+        if "speech" in _worker:
+            transcription = loop.run_until_complete(
+                _worker["speech"].transcribe_audio_file(item["path"], item.get("language", "vi-VN"))
+            )
+            result["transcription"] = transcription["transcription"]
+            result["confidence"] = transcription["confidence"]
+            result["language"] = transcription["language"]
+            result["duration"] = transcription["duration"]
+            result["source"] = transcription["source"]
+
+        if "classifier" in _worker:
+            classification = loop.run_until_complete(
+                _worker["classifier"].classify_audio_file(item["path"], _worker["top_k"])
+            )
+            result["classifications"] = classification["classifications"]
+            result["top_prediction"] = classification["top_prediction"]
+        elif "classify" in _worker["errors"]:
+            raise Exception(f"Classifier không khả dụng: {_worker['errors']['classify']}")
+
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    result["processing_time"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def iter_inputs(source: str, default_language: str) -> Iterator[Dict[str, Any]]:
+    """
+    Liệt kê file audio từ thư mục (đệ quy) hoặc manifest (.txt, .csv, .jsonl)
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield {"path": os.path.join(root, name), "language": default_language}
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+
+    def _resolve(path: str) -> str:
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    with open(source, encoding="utf-8") as f:
+        if source.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield {"path": _resolve(entry["path"]), "language": entry.get("language", default_language)}
+        elif source.endswith(".csv"):
+            for entry in csv.DictReader(f):
+                yield {"path": _resolve(entry["path"]), "language": entry.get("language") or default_language}
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield {"path": _resolve(line), "language": default_language}
+
+
+def load_checkpoint(checkpoint_path: str) -> set:
+    """Tập các file đã xử lý xong trong lần chạy trước"""
+    done = set()
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    done.add(line)
+    return done
+
+
+def compact_output(jsonl_path: str, done: set):
+    """
+    Bỏ khỏi file kết quả các dòng sẽ được xử lý lại (file lỗi, hoặc ghi xong nhưng chưa kịp checkpoint)
+    và các dòng trùng, để mỗi path chỉ có đúng một dòng khi job kết thúc
+    """
+    if not os.path.exists(jsonl_path):
+        return
+    kept = set()
+    tmp_path = jsonl_path + ".tmp"
+    with open(jsonl_path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            try:
+                path = json.loads(line)["path"]
+            except (ValueError, KeyError):
+                # Dòng bị cắt cụt khi job bị dừng
+                continue
+            if path in done and path not in kept:
+                kept.add(path)
+                dst.write(line if line.endswith("\n") else line + "\n")
+    os.replace(tmp_path, jsonl_path)
+
+
+def write_parquet(jsonl_path: str, parquet_path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Cần cài pyarrow để ghi Parquet (pip install pyarrow)")
+
+    rows = []
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                # Cột lồng nhau được lưu dạng JSON string để schema ổn định
+                for key in ("classifications", "top_prediction"):
+                    if key in row:
+                        row[key] = json.dumps(row[key], ensure_ascii=False)
+                rows.append(row)
+    pq.write_table(pa.Table.from_pylist(rows), parquet_path)
+
+
+def run(args) -> Dict[str, Any]:
+    tasks = [task.strip() for task in args.tasks.split(",") if task.strip()]
+    for task in tasks:
+        if task not in TASKS:
+            raise SystemExit(f"Task không hợp lệ: {task} (chọn trong {', '.join(TASKS)})")
+
+    # Parquet không append được - ghi JSONL trung gian rồi chuyển đổi khi xong
+    jsonl_path = args.output if args.format == "jsonl" else args.output + ".partial.jsonl"
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+
+    done = load_checkpoint(checkpoint_path)
+    compact_output(jsonl_path, done)
+
+    stats = {"processed": 0, "failed": 0, "skipped": 0, "audio_seconds": 0.0}
+
+    def _pending():
+        for item in iter_inputs(args.input, args.language):
+            if item["path"] in done:
+                stats["skipped"] += 1
+            else:
+                yield item
+
+    pending = _pending()
+    started = time.perf_counter()
+    max_in_flight = args.workers * 2
+
+    with open(jsonl_path, "a", encoding="utf-8") as output, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                initargs=(tasks, args.top_k)) as executor:
+        in_flight = set()
+
+        def _drain():
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                in_flight.discard(future)
+                result = future.result()
+                # Ghi kết quả trước rồi mới checkpoint: dừng giữa chừng chỉ có thể lặp lại, không mất.
+                # File lỗi không được checkpoint để lần chạy sau thử lại (dòng lỗi bị bỏ khi bắt đầu lần đó).
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+
+                if result["status"] == "ok":
+                    checkpoint.write(result["path"] + "\n")
+                    checkpoint.flush()
+                    stats["processed"] += 1
+                    stats["audio_seconds"] += result.get("duration", 0.0)
+                else:
+                    stats["failed"] += 1
+                    print(f"❌ {result['path']}: {result['error']}", file=sys.stderr)
+
+        for item in pending:
+            in_flight.add(executor.submit(_process_item, item))
+            if len(in_flight) >= max_in_flight:
+                _drain()
+
+        while in_flight:
+            _drain()
+
+    if args.format == "parquet":
+        write_parquet(jsonl_path, args.output)
+
+    wall_seconds = time.perf_counter() - started
+    completed = stats["processed"] + stats["failed"]
+    return {
+        "workers": args.workers,
+        "tasks": tasks,
+        "processed": stats["processed"],
+        "failed": stats["failed"],
+        "skipped_from_checkpoint": stats["skipped"],
+        "wall_seconds": round(wall_seconds, 2),
+        "files_per_second": round(completed / wall_seconds, 2) if wall_seconds > 0 else None,
+        "audio_seconds": round(stats["audio_seconds"], 2),
+        "realtime_factor": round(stats["audio_seconds"] / wall_seconds, 1) if wall_seconds > 0 else None,
+        "output": args.output,
+        "checkpoint": checkpoint_path
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Thư mục audio hoặc manifest (.txt, .csv, .jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="File kết quả")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--tasks", default="transcribe", help="transcribe, classify hoặc cả hai (phân tách bằng dấu phẩy)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--language", default="vi-VN")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--checkpoint", help="File checkpoint (mặc định: <output>.checkpoint)")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    print("\n📊 Throughput report")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Admission control theo lớp ưu tiên, đặt trước các router.
+
+Mỗi request /api được xếp vào một lớp:
+
+- critical: đánh giá / kích hoạt alert - không giới hạn, không bao giờ bị từ chối. Chỉ dành cho request
+  đã xác thực (device token hoặc admin key); request ẩn danh tới cùng route được xếp vào interactive
+- live: stream audio (WebSocket /api/transcription/live, phiên Socket.IO) - giữ slot suốt phiên,
+  hết slot thì từ chối ngay (stream không thể chờ trong hàng đợi)
+- interactive: upload / phân loại file và các API thông thường
+- batch: export, replay, lịch sử, admin
+
+Lớp interactive và batch có giới hạn số request chạy đồng thời và hàng đợi riêng. Request mới bị
+từ chối (503 + Retry-After) khi hàng đợi đầy, hoặc khi thời gian chờ ước lượng (dựa trên thời gian
+xử lý trung bình gần đây) vượt mục tiêu của lớp; request đã vào hàng đợi mà chờ quá mục tiêu cũng
+bị từ chối thay vì tiếp tục dồn độ trễ. Lớp ưu tiên thấp được cấp ít slot và mục tiêu chờ dài hơn,
+nên khi quá tải batch bị cắt trước, rồi tới interactive; live và critical không chịu ảnh hưởng.
+
+Các đường dẫn ngoài /api (health, metrics, docs, thống kê) không đi qua admission control.
+"""
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+from starlette.responses import JSONResponse
+from app.core.config import settings
+from app.core.security import scope_is_authenticated
+from app.core.metrics import Histogram, REGISTRY
+
+CRITICAL = "critical"
+LIVE = "live"
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# (loại scope, method hoặc None, regex đường dẫn, lớp) - luật đầu tiên khớp được dùng
+ROUTE_CLASSES = [
+    ("http", "POST", re.compile(r"^/api/alerts/(evaluate|test)$"), CRITICAL),
+    ("websocket", None, re.compile(r"^/api/transcription/live$"), LIVE),
+    ("http", None, re.compile(r"^/api/transcription/session/[^/]+/(export|replay)$"), BATCH),
+    ("http", "GET", re.compile(r"^/api/alerts/history$"), BATCH),
+    ("http", "GET", re.compile(r"^/api/transcription/(sessions|admin/.*)$"), BATCH),
+    ("http", None, re.compile(r"^/api/profiling/"), BATCH),
+    ("http", "POST", re.compile(r"^/api/audio/custom-sounds(/[^/]+/examples)?$"), BATCH),
+]
+DEFAULT_PREFIX = "/api/"
+
+# Giới hạn Retry-After (giây)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+# Trọng số EWMA của thời gian xử lý
+SERVICE_TIME_ALPHA = 0.2
+
+# Mã đóng WebSocket "Try Again Later" (RFC 6455)
+WS_TRY_AGAIN_LATER = 1013
+
+
+def classify_request(scope_type: str, method: Optional[str], path: str) -> Optional[str]:
+    """Lớp ưu tiên của request, hoặc None nếu request không đi qua admission control"""
+    for rule_type, rule_method, pattern, priority_class in ROUTE_CLASSES:
+        if rule_type == scope_type and (rule_method is None or rule_method == method) and pattern.match(path):
+            return priority_class
+    if path.startswith(DEFAULT_PREFIX):
+        return LIVE if scope_type == "websocket" else INTERACTIVE
+    return None
+
+
+def classify_scope(scope) -> Optional[str]:
+    """
+    Như classify_request cho một scope ASGI; lớp critical (không giới hạn) chỉ được cấp cho request đã xác thực,
+    để một loạt request ẩn danh không thể né load shedding
+    """
+    priority_class = classify_request(scope["type"], scope.get("method"), scope.get("path", ""))
+    if priority_class == CRITICAL and not scope_is_authenticated(scope):
+        return INTERACTIVE
+    return priority_class
+
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối vì lớp của nó đang quá tải"""
+
+    def __init__(self, priority_class: str, retry_after: int, reason: str):
+        super().__init__(f"{priority_class} overloaded ({reason})")
+        self.priority_class = priority_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class PriorityClass:
+    """
+    Slot chạy đồng thời + hàng đợi FIFO của một lớp; max_concurrent = 0 nghĩa là không giới hạn
+    """
+
+    def __init__(self, name: str, max_concurrent: int = 0, max_queue: int = 0, target_wait_ms: float = 0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.target_wait = target_wait_ms / 1000
+        self.in_flight = 0
+        self.waiters = deque()
+        # Thời gian xử lý trung bình (giây), dùng để ước lượng thời gian chờ
+        self.service_time = None
+
+        labels = {"class": name}
+        self.admitted = REGISTRY.counter("admission_admitted_total", "Số request được nhận theo lớp", labels)
+        self.shed = {
+            reason: REGISTRY.counter("admission_shed_total", "Số request bị từ chối theo lớp và lý do",
+                                     {"class": name, "reason": reason})
+            for reason in ("queue_full", "wait_estimate", "wait_timeout", "no_slot")
+        }
+        self.queue_wait = REGISTRY.register("admission_queue_wait_seconds", "Thời gian chờ trong hàng đợi admission",
+                                            Histogram(), labels)
+        REGISTRY.gauge("admission_in_flight", "Số request đang chạy theo lớp", labels,
+                       function=lambda: self.in_flight)
+        REGISTRY.gauge("admission_queued", "Số request đang chờ theo lớp", labels,
+                       function=lambda: len(self.waiters))
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_concurrent <= 0
+
+    def estimated_wait(self, position: int) -> float:
+        """Thời gian chờ ước lượng (giây) của request ở vị trí `position` trong hàng đợi"""
+        if self.service_time is None:
+            return 0.0
+        return (position + 1) * self.service_time / self.max_concurrent
+
+    def retry_after(self) -> int:
+        wait = self.estimated_wait(len(self.waiters)) or self.target_wait
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(wait)))
+
+    def reject(self, reason: str) -> AdmissionRejected:
+        self.shed[reason].inc()
+        return AdmissionRejected(self.name, self.retry_after(), reason)
+
+    def try_acquire(self) -> bool:
+        if self.unlimited or (self.in_flight < self.max_concurrent and not self.waiters):
+            self.in_flight += 1
+            self.admitted.inc()
+            return True
+        return False
+
+    async def acquire(self):
+        if self.try_acquire():
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise self.reject("queue_full" if self.max_queue else "no_slot")
+        if self.target_wait and self.estimated_wait(len(self.waiters)) > self.target_wait:
+            raise self.reject("wait_estimate")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter}, timeout=self.target_wait or None)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot đã được chuyển cho request này ngay trước khi nó bị hủy - trả lại
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                # Hết thời gian chờ hoặc request bị hủy: bỏ chỗ trong hàng đợi
+                waiter.cancel()
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+        self.queue_wait.observe(time.perf_counter() - started)
+        if waiter.cancelled():
+            raise self.reject("wait_timeout")
+        # Slot được chuyển thẳng từ request vừa xong (in_flight giữ nguyên)
+        self.admitted.inc()
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            self.service_time = service_time if self.service_time is None else (
+                SERVICE_TIME_ALPHA * service_time + (1 - SERVICE_TIME_ALPHA) * self.service_time
+            )
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent or None,
+            "max_queue": self.max_queue,
+            "target_wait_ms": self.target_wait * 1000 or None,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "service_time_ms": round(self.service_time * 1000, 3) if self.service_time is not None else None,
+            "admitted": self.admitted.get(),
+            "shed": sum(counter.get() for counter in self.shed.values()),
+            "shed_by_reason": {reason: counter.get() for reason, counter in self.shed.items()},
+            "queue_wait_p95_ms": _ms(self.queue_wait.quantile(0.95))
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    if seconds is None or math.isinf(seconds):
+        return seconds
+    return round(seconds * 1000, 3)
+
+
+class AdmissionController:
+    """
+    Xếp lớp request và cấp slot theo giới hạn của từng lớp
+    """
+
+    def __init__(self):
+        self.classes = {
+            CRITICAL: PriorityClass(CRITICAL),
+            LIVE: PriorityClass(LIVE, settings.admission_live_max_streams),
+            INTERACTIVE: PriorityClass(INTERACTIVE, settings.admission_interactive_max_concurrent,
+                                       settings.admission_interactive_max_queue, settings.admission_interactive_target_ms),
+            BATCH: PriorityClass(BATCH, settings.admission_batch_max_concurrent,
+                                 settings.admission_batch_max_queue, settings.admission_batch_target_ms),
+        }
+
+    async def acquire(self, priority_class: str):
+        """Chờ slot; raise AdmissionRejected nếu lớp đang quá tải"""
+        await self.classes[priority_class].acquire()
+
+    def try_acquire(self, priority_class: str) -> bool:
+        """Lấy slot ngay nếu còn (không chờ) - dùng cho stream như phiên Socket.IO"""
+        cls = self.classes[priority_class]
+        if cls.try_acquire():
+            return True
+        cls.shed["no_slot"].inc()
+        return False
+
+    def release(self, priority_class: str, service_time: Optional[float] = None):
+        self.classes[priority_class].release(service_time)
+
+    def retry_after(self, priority_class: str) -> int:
+        return self.classes[priority_class].retry_after()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.admission_enabled,
+            "shed_total": sum(sum(counter.get() for counter in cls.shed.values()) for cls in self.classes.values()),
+            "classes": {name: cls.get_stats() for name, cls in self.classes.items()}
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware: request HTTP quá tải nhận 503 + Retry-After, WebSocket bị đóng với mã 1013
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        priority_class = classify_scope(scope)
+        if priority_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(priority_class)
+        except AdmissionRejected as e:
+            await self._reject(scope, receive, send, e)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Thời gian của stream không phản ánh thời gian xử lý một request nên không đưa vào ước lượng
+            service_time = time.perf_counter() - started if scope["type"] == "http" else None
+            self.controller.release(priority_class, service_time)
+
+    async def _reject(self, scope, receive, send, rejected: AdmissionRejected):
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": WS_TRY_AGAIN_LATER,
+                        "reason": f"Server quá tải, thử lại sau {rejected.retry_after}s"})
+            return
+        response = JSONResponse(
+            {
+                "detail": "Server đang quá tải, vui lòng thử lại sau",
+                "class": rejected.priority_class,
+                "reason": rejected.reason,
+                "retry_after": rejected.retry_after
+            },
+            status_code=503,
+            headers={"Retry-After": str(rejected.retry_after)}
+        )
+        await response(scope, receive, send)
+
+
+admission_controller = AdmissionController()
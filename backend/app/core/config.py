@@ -19,16 +19,129 @@ class Settings(BaseSettings):
     google_credentials_path: Optional[str] = None
     google_project_id: Optional[str] = "ai-companion"
     google_application_credentials: Optional[str] = None  # For environment variable
+    google_speech_endpoint: Optional[str] = None  # host:port thay cho Speech API thật (emulator cục bộ), không TLS
     
     # Redis settings
     redis_url: str = "redis://localhost:6379"
     
+    # Startup
+    warm_up_on_startup: bool = True  # Nạp librosa / Google client / model ở nền ngay sau khi khởi động
+    
     # Audio settings
     sample_rate: int = 16000
-    chunk_size: int = 1024
+    
+    # Frame audio live và flow control (thương lượng lúc bắt đầu phiên, điều chỉnh theo độ trễ đo được)
+    live_frame_ms: int = 100  # Độ dài frame mặc định
+    live_frame_ms_min: int = 20
+    live_frame_ms_max: int = 500
+    live_sample_rates: list = [16000, 8000]  # Sample rate client binary-v1 có thể được yêu cầu chuyển sang
+    flow_control_enabled: bool = True
+    flow_lag_high_ms: float = 500  # Trễ hơn mức này thì yêu cầu client điều chỉnh
+    flow_lag_low_ms: float = 150  # Dưới mức này (và còn dư năng lực) thì quay về frame nhỏ hơn
+    flow_utilization_high: float = 0.8  # Thời gian xử lý / độ dài audio của frame
+    flow_utilization_low: float = 0.3
+    flow_eval_interval_seconds: float = 1.0
+    flow_cooldown_seconds: float = 3.0  # Khoảng cách tối thiểu giữa hai lần điều chỉnh
+    
+    # Live transcription settings
+    partial_max_rate_hz: float = 5.0  # Số kết quả interim tối đa gửi mỗi giây cho một phiên
+    session_idle_ttl_seconds: float = 300  # Session không nhận audio quá TTL sẽ bị kết thúc (0 = tắt)
+    session_max_segments: int = 5000  # Số segment tối đa giữ trong bộ nhớ cho mỗi session
+    session_history_max_sessions: int = 500
+    session_history_max_bytes: int = 64 * 1024 * 1024
+    session_archive_dir: Optional[str] = None  # Nếu đặt, session bị đẩy khỏi history được ghi ra JSONL
+    stream_deadline_ms: float = 2000  # Caption của frame quá thời điểm thu + ngân sách này thì bị bỏ (0 = tắt)
+    stream_clock_skew_seconds: float = 30  # Timestamp lệch đồng hồ server hơn mức này thì không áp deadline
+    ingest_classify_window_ms: float = 975  # Cửa sổ phân loại âm thanh trên luồng Socket.IO (bằng khung YAMNet)
+    ingest_classify_hop_ms: float = 500  # Khoảng trượt giữa hai lần phân loại
+    
+    # Audio journal (lưu audio live ra đĩa để replay / transcribe lại)
+    audio_journal_enabled: bool = False
+    audio_journal_dir: str = "data/audio_journal"
+    audio_journal_segment_bytes: int = 16 * 1024 * 1024
+    audio_journal_buffer_bytes: int = 256 * 1024
+    audio_journal_retention_hours: float = 72  # 0 = chỉ giới hạn theo dung lượng
+    audio_journal_max_bytes: int = 2 * 1024 * 1024 * 1024
+    audio_journal_retention_interval_seconds: float = 600
+    
+    # Alert settings
+    alert_history_max_size: int = 10000  # Số alert tối đa giữ trong lịch sử (ring buffer)
+    alert_rollups_path: Optional[str] = None  # File lưu bộ đếm thống kê alert qua các lần khởi động lại
+    alert_rollups_save_interval_seconds: float = 30
+    alert_critical_slo_ms: float = 500  # Độ trễ tối đa từ lúc phát hiện tới lúc push alert critical
+    alert_socketio_workers: int = 4
+    alert_email_workers: int = 2
+    alert_dispatch_max_queue: int = 1000
+    alert_cooldown_seconds: float = 30  # Sự kiện mới trong khoảng này sau sự kiện trước được gộp lại
+    alert_hysteresis: float = 0.1  # Ngưỡng tắt = sensitivity - hysteresis
+    alert_event_gap_seconds: float = 5  # Không có phát hiện trong khoảng này thì sự kiện kết thúc
+    alert_bus_backend: str = "none"  # "none" (một worker), "local" (loopback trong process) hoặc "redis"
+    alert_bus_channel: str = "ai-companion:alerts"
+    alert_bus_flush_ms: float = 100  # Gom các thay đổi lịch sử trong khoảng này thành một message
+    alert_bus_batch_size: int = 200
+    alert_log_dir: Optional[str] = None  # Bật write-ahead log cho lịch sử alert (mỗi worker tự giữ một thư mục con)
+    alert_log_fsync_ms: float = 200  # Gom fsync; alert critical luôn được fsync ngay
+    alert_log_snapshot_every: int = 5000  # Ghi snapshot sau chừng này thao tác
+    alert_log_buffer_bytes: int = 64 * 1024
+    
+    # Email (SMTP) cho kênh thông báo email
+    smtp_host: Optional[str] = None
+    smtp_port: int = 25
+    smtp_sender: str = "ai-companion@localhost"
+    alert_email_recipients: list = []
+    
+    # Admission control (giới hạn theo lớp ưu tiên; alert critical không bao giờ bị từ chối)
+    admission_enabled: bool = True
+    admission_live_max_streams: int = 200  # WebSocket / phiên Socket.IO đồng thời
+    admission_interactive_max_concurrent: int = 16  # Upload / phân loại file và API thông thường
+    admission_interactive_max_queue: int = 64
+    admission_interactive_target_ms: float = 2000  # Chờ trong hàng đợi lâu hơn mức này thì trả 503
+    admission_batch_max_concurrent: int = 2  # Export, replay, lịch sử, admin
+    admission_batch_max_queue: int = 8
+    admission_batch_target_ms: float = 10000
+    
+    # Lập lịch công bằng cho inference (deficit round-robin theo tenant / lớp ưu tiên)
+    scheduler_max_concurrent: int = 4  # Số lời gọi phân loại / STT chạy đồng thời
+    scheduler_quantum_seconds: float = 1.0  # Quantum mỗi vòng, tính bằng giây audio
+    scheduler_live_weight: float = 8.0
+    scheduler_interactive_weight: float = 2.0
+    scheduler_batch_weight: float = 1.0
+    scheduler_max_tenant_share: float = 0.5  # Tỉ lệ slot tối đa một tenant được giữ cùng lúc
+    
+    # Inference executor (thread pool riêng cho YAMNet; chọn cấu hình bằng benchmarks/bench_inference_sizing.py)
+    inference_workers: int = 2
+    inference_intra_op_threads: int = 0  # 0 = số CPU / số worker
+    inference_inter_op_threads: int = 1
+    inference_cpu_affinity: Optional[str] = None  # Ví dụ "2-7": chia đều cho các worker (Linux)
+    
+    # Admin
+    admin_api_key: Optional[str] = None  # Header X-Admin-Key cho các endpoint admin (chưa đặt = tắt admin API)
+    
+    # Profiling theo request (chỉ cài middleware khi bật)
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0  # Tỉ lệ request được profile ngẫu nhiên; request có X-Profile + admin key luôn được profile
+    profiling_interval_ms: float = 5  # Chu kỳ lấy mẫu stack
+    profiling_max_profiles: int = 50  # Số profile gần nhất giữ trong bộ nhớ
+    profiling_tracemalloc: bool = False  # Ghi thêm top cấp phát bộ nhớ (chậm hơn đáng kể)
     
     # YAMNet model settings
     yamnet_model_url: str = "https://tfhub.dev/google/yamnet/1"
+    yamnet_class_map_path: Optional[str] = None  # yamnet_class_map.csv (index,mid,display_name)
+    audioset_ontology_path: Optional[str] = None  # ontology.json của AudioSet (phân cấp class)
+    # Nhóm rộng trong ontology được tính điểm (rollup) cùng với phát hiện âm thanh nguy hiểm
+    yamnet_rollup_categories: list = ["Alarm", "Siren", "Telephone", "Bell", "Domestic sounds, home sounds",
+                                      "Human voice", "Music", "Animal", "Vehicle"]
+    
+    # Custom sound (clip mẫu do người dùng đăng ký, so khớp bằng embedding YAMNet)
+    custom_sounds_dir: Optional[str] = None  # Nếu đặt, chỉ mục của mỗi tenant được lưu thành file .npz
+    custom_sound_dtype: str = "float32"  # "float16" giảm một nửa bộ nhớ, so khớp chậm hơn một chút
+    custom_sound_threshold: float = 0.8  # Ngưỡng cosine mặc định (sensitivity của sound type)
+    custom_sound_top_k: int = 3
+    custom_sound_max_examples: int = 10  # Số clip mẫu tối đa mỗi âm thanh
+    custom_sound_max_per_tenant: int = 50
+    custom_sound_ann_enabled: bool = True  # Chỉ mục xấp xỉ (IVF) cho tenant có nhiều mẫu
+    custom_sound_ann_min_vectors: int = 4096
+    custom_sound_ann_probes: int = 8  # Số cụm được quét mỗi truy vấn
     
     # Language settings
     default_language: str = "vi-VN"  # Vietnamese
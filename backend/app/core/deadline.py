@@ -0,0 +1,176 @@
+"""
+Deadline cho request và chunk audio, truyền qua toàn bộ pipeline xử lý.
+
+Client bỏ qua caption đến trễ hơn vài giây, nên việc giải mã, suy luận hay gọi Google cho một chunk
+đã quá hạn chỉ tốn tài nguyên. Deadline được lấy từ:
+
+- header X-Deadline (thời điểm tuyệt đối, epoch ms) hoặc X-Timeout-Ms (ngân sách tính từ lúc nhận)
+- capture_ts_us của frame audio + settings.stream_deadline_ms (hoặc deadline_ms client gửi lúc bắt đầu phiên)
+
+Deadline hiện tại được truyền qua contextvars (deadline_context), giống tenant của lịch inference, nên
+SpeechService / AudioClassifierService / TranscriptionService chỉ cần gọi check_deadline(stage) trước
+mỗi giai đoạn tốn kém, hoặc run_before_deadline(stage, awaitable) để hủy phần chờ khi hết hạn.
+Số việc bị bỏ vì quá hạn được đếm theo giai đoạn (deadline_expired_total{stage}).
+
+Phát hiện âm thanh nguy hiểm không bị ràng buộc bởi deadline của caption: một cảnh báo báo cháy
+đến muộn vẫn cần được gửi.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Awaitable, Optional
+from starlette.responses import JSONResponse
+from app.core.config import settings
+from app.core.metrics import REGISTRY
+
+DEADLINE_HEADER = b"x-deadline"
+TIMEOUT_HEADER = b"x-timeout-ms"
+
+# Các giai đoạn có thể bỏ việc quá hạn
+STAGES = ("arrival", "queue", "decode", "inference", "google", "stt", "emit")
+
+EXPIRED = {
+    stage: REGISTRY.counter("deadline_expired_total", "Số việc bị bỏ vì đã quá deadline, theo giai đoạn",
+                            {"stage": stage})
+    for stage in STAGES
+}
+SKEWED_FRAMES = REGISTRY.counter("deadline_clock_skew_frames_total",
+                                 "Số frame có capture timestamp lệch quá xa đồng hồ server (không áp deadline)")
+
+
+class DeadlineExceeded(Exception):
+    """Việc bị bỏ vì deadline đã qua"""
+
+    def __init__(self, stage: str, late_by: float):
+        super().__init__(f"Quá deadline ở giai đoạn {stage} ({late_by * 1000:.0f}ms)")
+        self.stage = stage
+        self.late_by = late_by
+
+
+class Deadline:
+    """Thời điểm hết hạn (epoch giây, cùng đồng hồ với capture timestamp của client)"""
+
+    __slots__ = ("at",)
+
+    def __init__(self, at: float):
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.time() + seconds)
+
+    def remaining(self) -> float:
+        return self.at - time.time()
+
+    def expired(self) -> bool:
+        return time.time() >= self.at
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_context(deadline: Optional[Deadline]):
+    """Đặt deadline cho các lời gọi trong khối lệnh (None = không có deadline)"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def expire(stage: str, deadline: Deadline) -> DeadlineExceeded:
+    EXPIRED[stage].inc()
+    return DeadlineExceeded(stage, -deadline.remaining())
+
+
+def check_deadline(stage: str):
+    """Raise DeadlineExceeded nếu deadline hiện tại đã qua - gọi trước mỗi giai đoạn tốn kém"""
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.expired():
+        raise expire(stage, deadline)
+
+
+async def run_before_deadline(stage: str, awaitable: Awaitable):
+    """
+    Chờ awaitable trong thời gian còn lại của deadline; hết hạn thì hủy và raise DeadlineExceeded.
+    Với việc chạy trong thread (to_thread, executor), thread vẫn chạy nốt nhưng kết quả bị bỏ.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await awaitable
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise expire(stage, deadline)
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise expire(stage, deadline)
+
+
+def frame_deadline(capture_ts_us: Optional[int], budget_ms: Optional[float] = None) -> Optional[Deadline]:
+    """
+    Deadline của một frame audio = thời điểm thu + ngân sách. Frame không có timestamp, hoặc có
+    timestamp lệch quá settings.stream_clock_skew_seconds so với đồng hồ server, không bị áp deadline.
+    """
+    budget_ms = settings.stream_deadline_ms if budget_ms is None else budget_ms
+    if not capture_ts_us or budget_ms <= 0:
+        return None
+    captured = capture_ts_us / 1_000_000
+    if abs(time.time() - captured) > settings.stream_clock_skew_seconds:
+        SKEWED_FRAMES.inc()
+        return None
+    return Deadline(captured + budget_ms / 1000)
+
+
+def request_deadline(headers) -> Optional[Deadline]:
+    """Deadline từ header X-Deadline (epoch ms) hoặc X-Timeout-Ms; header sai định dạng bị bỏ qua"""
+    try:
+        for key, value in headers:
+            if key == DEADLINE_HEADER:
+                return Deadline(float(value) / 1000)
+            if key == TIMEOUT_HEADER:
+                return Deadline.after(float(value) / 1000)
+    except ValueError:
+        return None
+    return None
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "stream_deadline_ms": settings.stream_deadline_ms,
+        "expired_total": sum(counter.get() for counter in EXPIRED.values()),
+        "expired_by_stage": {stage: counter.get() for stage, counter in EXPIRED.items()},
+        "clock_skew_frames": SKEWED_FRAMES.get()
+    }
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware: gắn deadline từ header cho request HTTP; request đã quá hạn lúc đến nhận 504 ngay
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = request_deadline(scope.get("headers", []))
+        if deadline is not None and deadline.expired():
+            EXPIRED["arrival"].inc()
+            response = JSONResponse({"detail": "Request đã quá deadline trước khi được xử lý"}, status_code=504)
+            await response(scope, receive, send)
+            return
+
+        with deadline_context(deadline):
+            await self.app(scope, receive, send)
@@ -0,0 +1,87 @@
+"""
+Service dùng chung của ứng dụng.
+
+Các service được tạo trong lifespan của FastAPI (create_services) và gắn vào app.state, thay vì
+được tạo khi import router - import main.py chỉ còn chi phí của FastAPI / Socket.IO, còn các thư
+viện nặng (google-cloud-speech, librosa, tensorflow) được nạp ở lần dùng đầu hoặc trong warm_up nền.
+Router lấy service qua dependency get_* (dùng được cho cả HTTP và WebSocket).
+"""
+import asyncio
+import time
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+from app.core.inference_executor import InferenceExecutor
+from app.services.alert_service import AlertService
+from app.services.custom_sounds import CustomSoundStore, sound_type_for
+from app.services.ingestion_pipeline import IngestionManager, load_audio_classifier
+from app.services.speech_service import SpeechService
+from app.services.transcription_service import TranscriptionService
+
+
+def create_services(state):
+    """Tạo toàn bộ service và gắn vào app.state"""
+    state.inference_executor = InferenceExecutor()
+    state.speech_service = SpeechService()
+    state.transcription_service = TranscriptionService()
+    state.alert_service = AlertService()
+    state.custom_sounds = CustomSoundStore()
+    # Classifier của lifespan trước (nếu có) gắn với executor cũ - tải lại ở lần dùng đầu
+    state.audio_classifier_future = None
+    # Custom sound đã lưu từ lần chạy trước là sound type của AlertService như các loại mặc định
+    for sound in state.custom_sounds.all_sounds():
+        state.alert_service.register_sound_type(sound_type_for(sound["id"]), sound["threshold"],
+                                                sound.get("priority", "medium"))
+    state.ingestion = IngestionManager(
+        state.transcription_service, state.alert_service,
+        classifier_factory=lambda: audio_classifier_for(state)
+    )
+
+
+def audio_classifier_for(state) -> asyncio.Future:
+    """
+    Future của AudioClassifierService (None nếu môi trường không tải được model), được tạo ở lần dùng đầu.
+    Single-flight: warm_up, request và pipeline live cùng chờ một lần tải duy nhất trong thread,
+    nên model không bao giờ bị nạp hai lần. Lần tải lỗi sẽ được thử lại ở lần gọi sau.
+    """
+    future = getattr(state, "audio_classifier_future", None)
+    if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+        future = state.audio_classifier_future = asyncio.ensure_future(
+            asyncio.to_thread(load_audio_classifier, state.inference_executor, state.custom_sounds)
+        )
+    return future
+
+
+async def warm_up(state):
+    """
+    Nạp trước thư viện và model nặng trong thread nền sau khi app đã sẵn sàng phục vụ /health
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(state.speech_service.warm_up)
+        await audio_classifier_for(state)
+        print(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        print(f"Error warming up services: {e}")
+
+
+def get_speech_service(conn: HTTPConnection) -> SpeechService:
+    return conn.app.state.speech_service
+
+
+def get_transcription_service(conn: HTTPConnection) -> TranscriptionService:
+    return conn.app.state.transcription_service
+
+
+def get_alert_service(conn: HTTPConnection) -> AlertService:
+    return conn.app.state.alert_service
+
+
+def get_custom_sounds(conn: HTTPConnection) -> CustomSoundStore:
+    return conn.app.state.custom_sounds
+
+
+async def get_audio_classifier(conn: HTTPConnection):
+    classifier = await audio_classifier_for(conn.app.state)
+    if classifier is None:
+        raise HTTPException(status_code=503, detail="Audio classifier chưa sẵn sàng")
+    return classifier
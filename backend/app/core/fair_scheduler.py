@@ -0,0 +1,268 @@
+"""
+Lập lịch công bằng cho các lời gọi inference (phân loại âm thanh, STT).
+
+Mỗi lời gọi được gắn với một tenant (thiết bị đã xác thực bằng X-Device-Token, device_id của phiên
+Socket.IO hoặc địa chỉ client) và một lớp ưu tiên (live / interactive / batch, cùng cách xếp lớp với admission control).
+Số lời gọi chạy đồng thời bị giới hạn; khi hết slot, lời gọi chờ trong hàng đợi của luồng
+(tenant, lớp) và được cấp slot theo deficit round-robin:
+
+- mỗi vòng, luồng ở đầu danh sách nhận quantum * trọng số của lớp (đơn vị: giây audio)
+- luồng được phục vụ khi deficit đủ trả chi phí (độ dài audio ước lượng) của lời gọi đầu hàng
+- một tenant không giữ quá scheduler_max_tenant_share số slot, kể cả khi các tenant khác đang rảnh
+
+Nhờ vậy một client upload hàng loạt chỉ chiếm một phần giới hạn năng lực inference, còn stream
+live của các hộ gia đình khác vẫn được phục vụ với độ trễ ổn định.
+
+Tenant / lớp của lời gọi hiện tại được truyền qua contextvars (work_context), nên service không
+cần thêm tham số: middleware đặt context cho request HTTP, pipeline Socket.IO đặt cho từng frame.
+"""
+import asyncio
+import contextvars
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, Optional, Tuple
+from app.core.admission import CRITICAL, LIVE, INTERACTIVE, BATCH, classify_scope
+from app.core.config import settings
+from app.core.deadline import run_before_deadline
+from app.core.metrics import Histogram, REGISTRY
+from app.core.security import ADMIN_KEY_HEADER, DEVICE_TOKEN_HEADER, is_admin_key, verify_device_token
+
+ANONYMOUS_TENANT = "anonymous"
+# Chỉ được tin khi request có admin key hợp lệ (gateway / dịch vụ nội bộ gọi thay cho thiết bị)
+TENANT_HEADER = b"x-tenant-id"
+
+# (tenant, lớp ưu tiên) của lời gọi hiện tại
+_current_work: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar(
+    "inference_work", default=(ANONYMOUS_TENANT, INTERACTIVE)
+)
+
+
+def current_work() -> Tuple[str, str]:
+    return _current_work.get()
+
+
+@contextmanager
+def work_context(tenant: Optional[str], priority: str = INTERACTIVE):
+    """Gắn tenant / lớp ưu tiên cho các lời gọi inference trong khối lệnh"""
+    token = _current_work.set((tenant or ANONYMOUS_TENANT, LIVE if priority == CRITICAL else priority))
+    try:
+        yield
+    finally:
+        _current_work.reset(token)
+
+
+def audio_cost(num_bytes: int) -> float:
+    """Chi phí của lời gọi = số giây audio PCM16 ước lượng từ số byte"""
+    return num_bytes / (settings.sample_rate * 2)
+
+
+class _Flow:
+    """Hàng đợi của một cặp (tenant, lớp ưu tiên)"""
+
+    __slots__ = ("tenant", "priority", "weight", "queue", "deficit", "credited")
+
+    def __init__(self, tenant: str, priority: str, weight: float):
+        self.tenant = tenant
+        self.priority = priority
+        self.weight = weight
+        # (future, chi phí, thời điểm vào hàng)
+        self.queue = deque()
+        self.deficit = 0.0
+        # Đã nhận quantum trong lượt hiện tại ở đầu danh sách hay chưa
+        self.credited = False
+
+
+class FairScheduler:
+    """
+    Cấp slot inference theo deficit round-robin có trọng số giữa các luồng (tenant, lớp ưu tiên)
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, quantum: Optional[float] = None,
+                 weights: Optional[Dict[str, float]] = None, max_tenant_share: Optional[float] = None):
+        self.max_concurrent = max_concurrent or settings.scheduler_max_concurrent
+        self.quantum = quantum or settings.scheduler_quantum_seconds
+        self.weights = weights or {
+            LIVE: settings.scheduler_live_weight,
+            INTERACTIVE: settings.scheduler_interactive_weight,
+            BATCH: settings.scheduler_batch_weight,
+        }
+        share = settings.scheduler_max_tenant_share if max_tenant_share is None else max_tenant_share
+        self.max_per_tenant = max(1, math.ceil(self.max_concurrent * share))
+
+        self.running = 0
+        self.running_by_tenant = {}
+        self.flows = {}
+        # Thứ tự round-robin của các luồng đang có việc chờ
+        self.active = deque()
+
+        self.wait_seconds = {
+            priority: REGISTRY.register("scheduler_wait_seconds", "Thời gian chờ slot inference theo lớp",
+                                        Histogram(), {"priority": priority})
+            for priority in self.weights
+        }
+        self.dispatched = {
+            priority: REGISTRY.counter("scheduler_dispatched_total", "Số lời gọi inference được cấp slot",
+                                       {"priority": priority})
+            for priority in self.weights
+        }
+        REGISTRY.gauge("scheduler_running", "Số lời gọi inference đang chạy", function=lambda: self.running)
+        REGISTRY.gauge("scheduler_queued", "Số lời gọi inference đang chờ",
+                       function=lambda: sum(len(flow.queue) for flow in self.flows.values()))
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 1.0):
+        """
+        `async with scheduler.slot(cost): ...` - chạy khối lệnh khi được cấp slot.
+        Lời gọi có deadline bị bỏ khỏi hàng đợi (DeadlineExceeded) nếu hết hạn trước khi tới lượt.
+        """
+        tenant, priority = _current_work.get()
+        await run_before_deadline("queue", self.acquire(tenant, priority, cost))
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+    async def acquire(self, tenant: str, priority: str, cost: float = 1.0):
+        if priority not in self.weights:
+            priority = INTERACTIVE
+        started = time.perf_counter()
+        if not self.flows and self._has_capacity(tenant):
+            self._start(tenant, priority, started)
+            return
+
+        key = (tenant, priority)
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = _Flow(tenant, priority, self.weights[priority])
+            self.active.append(key)
+        waiter = asyncio.get_running_loop().create_future()
+        flow.queue.append((waiter, max(cost, 0.0), started))
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot đã được cấp ngay trước khi lời gọi bị hủy - trả lại
+                self.release(tenant)
+            else:
+                waiter.cancel()
+            raise
+
+    def release(self, tenant: str):
+        self.running -= 1
+        remaining = self.running_by_tenant[tenant] - 1
+        if remaining:
+            self.running_by_tenant[tenant] = remaining
+        else:
+            del self.running_by_tenant[tenant]
+        self._dispatch()
+
+    def _has_capacity(self, tenant: str) -> bool:
+        return self.running < self.max_concurrent and self.running_by_tenant.get(tenant, 0) < self.max_per_tenant
+
+    def _start(self, tenant: str, priority: str, enqueued: float):
+        self.running += 1
+        self.running_by_tenant[tenant] = self.running_by_tenant.get(tenant, 0) + 1
+        self.dispatched[priority].inc()
+        self.wait_seconds[priority].observe(time.perf_counter() - enqueued)
+
+    def _dispatch(self):
+        # Số luồng liên tiếp bị bỏ qua vì tenant đã dùng hết phần slot của mình
+        skipped = 0
+        while self.running < self.max_concurrent and self.active and skipped < len(self.active):
+            key = self.active[0]
+            flow = self.flows[key]
+            # Lời gọi đã bị hủy trong lúc chờ
+            while flow.queue and flow.queue[0][0].done():
+                flow.queue.popleft()
+            if not flow.queue:
+                self.active.popleft()
+                del self.flows[key]
+                continue
+
+            if self.running_by_tenant.get(flow.tenant, 0) >= self.max_per_tenant:
+                flow.credited = False
+                self.active.rotate(-1)
+                skipped += 1
+                continue
+            skipped = 0
+
+            if not flow.credited:
+                flow.deficit += self.quantum * flow.weight
+                flow.credited = True
+            waiter, cost, enqueued = flow.queue[0]
+            if cost > flow.deficit:
+                flow.credited = False
+                self.active.rotate(-1)
+                continue
+
+            flow.queue.popleft()
+            flow.deficit -= cost
+            self._start(flow.tenant, flow.priority, enqueued)
+            waiter.set_result(None)
+            if not flow.queue:
+                # Luồng hết việc thì không giữ deficit dư sang lần sau
+                self.active.popleft()
+                del self.flows[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_per_tenant": self.max_per_tenant,
+            "quantum_seconds": self.quantum,
+            "weights": self.weights,
+            "running": self.running,
+            "running_by_tenant": dict(self.running_by_tenant),
+            "queued": {f"{tenant}/{priority}": len(flow.queue) for (tenant, priority), flow in self.flows.items()},
+            "dispatched": {priority: counter.get() for priority, counter in self.dispatched.items()},
+            "wait_p95_ms": {
+                priority: round(histogram.quantile(0.95) * 1000, 3) if histogram.count else None
+                for priority, histogram in self.wait_seconds.items()
+            }
+        }
+
+
+class WorkContextMiddleware:
+    """
+    ASGI middleware: gắn tenant và lớp ưu tiên cho request.
+
+    Tenant là thiết bị trong X-Device-Token (token do server ký), hoặc X-Tenant-ID khi request có
+    admin key hợp lệ; ngược lại là địa chỉ client. Header do client tự đặt không bao giờ được tin,
+    nên đổi tenant ngẫu nhiên mỗi request không vượt được giới hạn slot theo tenant.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        tenant = request_tenant(scope)
+        priority = classify_scope(scope) or INTERACTIVE
+
+        with work_context(tenant, priority):
+            await self.app(scope, receive, send)
+
+
+def request_tenant(scope) -> Optional[str]:
+    """Tenant đã xác thực của một request ASGI (xem WorkContextMiddleware)"""
+    headers = {}
+    for key, value in scope.get("headers", []):
+        if key in (DEVICE_TOKEN_HEADER, TENANT_HEADER, ADMIN_KEY_HEADER):
+            headers[key] = value.decode("latin-1")
+    device_id = verify_device_token(headers.get(DEVICE_TOKEN_HEADER))
+    if device_id:
+        return device_id
+    if headers.get(TENANT_HEADER) and is_admin_key(headers.get(ADMIN_KEY_HEADER)):
+        return headers[TENANT_HEADER]
+    if scope.get("client"):
+        return scope["client"][0]
+    return None
+
+
+inference_scheduler = FairScheduler()
@@ -0,0 +1,169 @@
+"""
+Executor riêng cho suy luận model (YAMNet), với ngân sách CPU rõ ràng.
+
+Mặc định TensorFlow tạo thread pool intra-op / inter-op bằng số core của máy, tranh CPU với event loop
+của uvicorn, với librosa và với các worker khác trên cùng host. Executor này:
+
+- chạy suy luận trong một số worker thread cố định (inference_workers), tách khỏi thread pool mặc định
+  của asyncio (dùng cho giải mã audio)
+- đặt ngân sách intra-op / inter-op cho TensorFlow qua biến môi trường trước khi TF được import
+  (TF được import lười, xem AudioClassifierService._load_model) và qua configure_tensorflow
+- tùy chọn ghim mỗi worker vào một nhóm CPU (inference_cpu_affinity, chỉ trên Linux)
+
+Lưu ý: thread pool intra-op của TensorFlow dùng chung cho cả process và thừa hưởng affinity của thread
+đầu tiên chạy model, nên ghim theo từng worker chỉ tách biệt hoàn toàn khi intra-op = 1.
+
+Chọn cấu hình cho host hiện tại bằng `python -m benchmarks.bench_inference_sizing`.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+from app.core.config import settings
+from app.core.metrics import Histogram, REGISTRY, FAST_LATENCY_BUCKETS
+
+# Biến môi trường TF / oneDNN đọc khi khởi tạo runtime
+TF_INTRA_OP_ENV = "TF_NUM_INTRAOP_THREADS"
+TF_INTER_OP_ENV = "TF_NUM_INTEROP_THREADS"
+OMP_THREADS_ENV = "OMP_NUM_THREADS"
+
+
+def available_cpus() -> List[int]:
+    """Các CPU process được phép chạy"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """"0-3,6,8-9" -> [0, 1, 2, 3, 6, 8, 9]"""
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def split_cpus(cpus: List[int], groups: int) -> List[List[int]]:
+    """Chia đều danh sách CPU cho các worker (nhiều worker hơn CPU thì dùng chung)"""
+    if groups <= len(cpus):
+        size, extra = divmod(len(cpus), groups)
+        result, start = [], 0
+        for i in range(groups):
+            end = start + size + (1 if i < extra else 0)
+            result.append(cpus[start:end])
+            start = end
+        return result
+    return [[cpus[i % len(cpus)]] for i in range(groups)]
+
+
+def configure_tensorflow(tf, intra_op_threads: int, inter_op_threads: int):
+    """
+    Áp ngân sách thread cho TensorFlow - phải gọi ngay sau khi import, trước khi chạy model lần đầu
+    """
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        # Runtime đã được khởi tạo (TF đã chạy ở nơi khác trong process) - giữ cấu hình qua biến môi trường
+        print(f"⚠️ TensorFlow threading already initialized: {e}")
+
+
+class InferenceExecutor:
+    """
+    Thread pool riêng cho suy luận, với số worker / thread TF / affinity cấu hình được
+    """
+
+    def __init__(self, workers: Optional[int] = None, intra_op_threads: Optional[int] = None,
+                 inter_op_threads: Optional[int] = None, cpu_affinity: Optional[str] = None):
+        self.workers = max(1, workers or settings.inference_workers)
+        cpus = available_cpus()
+        self.intra_op_threads = (intra_op_threads or settings.inference_intra_op_threads
+                                 or max(1, len(cpus) // self.workers))
+        self.inter_op_threads = inter_op_threads or settings.inference_inter_op_threads
+        affinity = settings.inference_cpu_affinity if cpu_affinity is None else cpu_affinity
+        self.cpu_sets = split_cpus(parse_cpu_list(affinity), self.workers) if affinity else None
+
+        self._apply_thread_env()
+        self._worker_ids = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference",
+                                        initializer=self._init_worker)
+        self.pending = 0
+        self.pinned_workers = 0
+
+        self.run_seconds = REGISTRY.histogram("inference_executor_run_seconds",
+                                              "Thời gian chạy một lời gọi trong inference executor")
+        self.queue_seconds = REGISTRY.histogram("inference_executor_queue_seconds",
+                                                "Thời gian chờ worker của inference executor",
+                                                buckets=FAST_LATENCY_BUCKETS)
+        REGISTRY.gauge("inference_executor_pending", "Số lời gọi đang chờ hoặc đang chạy trong inference executor",
+                       function=lambda: self.pending)
+
+    def _apply_thread_env(self):
+        # Chỉ có tác dụng nếu TensorFlow chưa được import; không ghi đè cấu hình người dùng đã đặt
+        if "tensorflow" in sys.modules:
+            return
+        os.environ.setdefault(TF_INTRA_OP_ENV, str(self.intra_op_threads))
+        os.environ.setdefault(TF_INTER_OP_ENV, str(self.inter_op_threads))
+        os.environ.setdefault(OMP_THREADS_ENV, str(self.intra_op_threads))
+
+    def _init_worker(self):
+        index = next(self._worker_ids)
+        if self.cpu_sets and hasattr(os, "sched_setaffinity"):
+            try:
+                # pid 0 = thread hiện tại (Linux áp affinity theo thread)
+                os.sched_setaffinity(0, self.cpu_sets[index % len(self.cpu_sets)])
+                self.pinned_workers += 1
+            except OSError as e:
+                print(f"⚠️ Could not pin inference worker {index}: {e}")
+
+    def configure_tensorflow(self, tf):
+        configure_tensorflow(tf, self.intra_op_threads, self.inter_op_threads)
+
+    async def run(self, fn: Callable, *args):
+        """Chạy fn(*args) trong một worker của executor"""
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            self.queue_seconds.observe(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                self.run_seconds.observe(time.perf_counter() - started)
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "cpu_sets": self.cpu_sets,
+            "pinned_workers": self.pinned_workers,
+            "pending": self.pending,
+            "calls": self.run_seconds.count,
+            "run_p95_ms": _ms(self.run_seconds),
+            "queue_p95_ms": _ms(self.queue_seconds)
+        }
+
+
+def _ms(histogram: Histogram) -> Optional[float]:
+    value = histogram.quantile(0.95)
+    return round(value * 1000, 3) if value is not None and value != float("inf") else value
@@ -0,0 +1,332 @@
+"""
+Giao thức truyền dữ liệu cho WebSocket `/api/transcription/live`.
+
+Hai chế độ được hỗ trợ, client chọn trong message cấu hình đầu tiên
+(`{"protocol": "binary-v1"}`):
+
+- ``json`` (mặc định, client cũ): audio là raw bytes PCM16, kết quả là JSON.
+- ``binary-v1``: mỗi frame audio có header cố định (sequence, thời điểm thu,
+  codec, sample rate, số mẫu) và kết quả được mã hóa bằng MessagePack.
+
+Header frame audio (little-endian, 20 bytes)::
+
+    version:u8 | codec:u8 | num_samples:u16 | seq:u32 | sample_rate:u32 | capture_ts_us:u64
+
+Frame có sample rate khác settings.sample_rate được resample khi giải mã, nên client binary-v1 có thể
+đổi sample rate giữa phiên khi server gửi message ``flow_control`` (action ``lower_sample_rate``).
+Resample dùng bộ lọc polyphase có chống aliasing và giữ trạng thái lọc giữa các frame của cùng
+một kết nối, nên không có gián đoạn ở biên frame.
+"""
+import math
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from app.core.metrics import REGISTRY, FAST_LATENCY_BUCKETS
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tùy chọn - thiếu thì chỉ dùng được chế độ JSON
+    msgpack = None
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY_V1 = "binary-v1"
+
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<BBHIIQ")
+
+CODEC_PCM_S16LE = 1
+CODEC_PCM_F32LE = 2
+CODEC_MULAW = 3
+
+# Số byte cho mỗi mẫu của từng codec
+CODEC_SAMPLE_WIDTH = {
+    CODEC_PCM_S16LE: 2,
+    CODEC_PCM_F32LE: 4,
+    CODEC_MULAW: 1,
+}
+
+# Tên ngắn của các loại message kết quả trong chế độ binary
+RESULT_TYPES = {
+    "session_started": "ss",
+    "transcription": "tr",
+    "flow_control": "fc",
+    "error": "er",
+}
+
+# Sample rate frame binary-v1 được chấp nhận (được resample về sample rate của service)
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+
+DECODE_SECONDS = {
+    protocol: REGISTRY.histogram("live_frame_decode_seconds", "Thời gian giải mã một frame audio live",
+                                 {"protocol": protocol}, buckets=FAST_LATENCY_BUCKETS)
+    for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY_V1)
+}
+SEND_SECONDS = {
+    protocol: REGISTRY.histogram("websocket_send_seconds", "Thời gian gửi một message kết quả qua WebSocket",
+                                 {"protocol": protocol}, buckets=FAST_LATENCY_BUCKETS)
+    for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY_V1)
+}
+FRAMES_REJECTED = REGISTRY.counter("live_frames_rejected_total", "Số frame audio live không hợp lệ")
+
+
+class ProtocolError(Exception):
+    """Frame audio không hợp lệ"""
+
+
+def negotiate_protocol(config: Dict[str, Any]) -> str:
+    """
+    Chọn giao thức từ message cấu hình của client, quay về JSON nếu không hỗ trợ
+    """
+    requested = config.get("protocol", PROTOCOL_JSON)
+    if requested == PROTOCOL_BINARY_V1 and msgpack is not None:
+        return PROTOCOL_BINARY_V1
+    return PROTOCOL_JSON
+
+
+def encode_frame(seq: int, samples: bytes, codec: int = CODEC_PCM_S16LE,
+                 sample_rate: int = 16000, capture_ts_us: Optional[int] = None) -> bytes:
+    """
+    Đóng gói một frame audio theo định dạng binary-v1 (dùng cho client và benchmark)
+    """
+    if codec not in CODEC_SAMPLE_WIDTH:
+        raise ProtocolError(f"Codec không hỗ trợ: {codec}")
+    if capture_ts_us is None:
+        capture_ts_us = time.time_ns() // 1000
+    num_samples = len(samples) // CODEC_SAMPLE_WIDTH[codec]
+    header = FRAME_HEADER.pack(FRAME_VERSION, codec, num_samples, seq, sample_rate, capture_ts_us)
+    return header + samples
+
+
+def _mulaw_to_pcm16(samples: bytes) -> bytes:
+    import numpy as np
+
+    ulaw = ~np.frombuffer(samples, dtype=np.uint8)
+    sign = ulaw & 0x80
+    exponent = (ulaw >> 4) & 0x07
+    mantissa = ulaw & 0x0F
+    magnitude = ((mantissa.astype(np.int32) << 3) + 0x84) << exponent
+    pcm = np.where(sign != 0, 0x84 - magnitude, magnitude - 0x84)
+    return pcm.astype("<i2").tobytes()
+
+
+# Số hệ số của mỗi pha trong bộ lọc polyphase (độ dài bộ lọc = TAPS_PER_PHASE * hệ số nội suy)
+TAPS_PER_PHASE = 24
+# Tần số cắt so với Nyquist của sample rate thấp hơn (chừa dải chuyển tiếp cho bộ lọc)
+RESAMPLE_CUTOFF = 0.9
+KAISER_BETA = 8.0
+
+
+class PolyphaseResampler:
+    """
+    Resample PCM16 theo luồng với tỉ lệ hữu tỉ up/down (ví dụ 48000 -> 16000 = 1/3, 44100 -> 16000 = 160/441).
+
+    Bộ lọc thông thấp FIR (sinc cửa sổ Kaiser, cắt dưới Nyquist của sample rate thấp hơn) vừa chống
+    aliasing khi hạ tần số vừa chống ảnh phổ khi tăng. Mỗi mẫu ra chỉ cần TAPS_PER_PHASE phép nhân
+    (chỉ pha tương ứng của bộ lọc), và các mẫu cuối của frame trước được giữ lại làm trạng thái nên
+    kết quả của nhiều frame liên tiếp giống như resample cả luồng một lần.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int, taps_per_phase: int = TAPS_PER_PHASE):
+        import numpy as np
+
+        g = math.gcd(from_rate, to_rate)
+        self.up = to_rate // g
+        self.down = from_rate // g
+        self.taps = taps_per_phase
+
+        length = taps_per_phase * self.up
+        cutoff = RESAMPLE_CUTOFF / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        h = cutoff * np.sinc(cutoff * n) * np.kaiser(length, KAISER_BETA)
+        h *= self.up / h.sum()
+        # phases[p, j] = h[p + j * up]: hệ số áp lên mẫu vào thứ i0 - j cho mẫu ra ở pha p
+        self.phases = h.reshape(taps_per_phase, self.up).T.astype(np.float32)
+
+        self.history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        # Vị trí (trong miền đã nội suy) của mẫu ra kế tiếp, tính từ đầu buffer history + frame
+        self.position = (taps_per_phase - 1) * self.up
+
+    def process(self, pcm: bytes) -> bytes:
+        import numpy as np
+
+        audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+        if not len(audio):
+            return b""
+        buffer = np.concatenate([self.history, audio])
+        end = len(buffer) * self.up
+        positions = np.arange(self.position, end, self.down)
+
+        if len(positions):
+            base = positions // self.up
+            taps = buffer[base[:, None] - np.arange(self.taps)[None, :]]
+            output = np.einsum("ij,ij->i", taps, self.phases[positions % self.up])
+            next_position = positions[-1] + self.down
+        else:
+            output = np.zeros(0, dtype=np.float32)
+            next_position = self.position
+
+        keep = self.taps - 1
+        self.history = buffer[len(buffer) - keep:]
+        self.position = next_position - (len(buffer) - keep) * self.up
+        return np.clip(np.round(output), -32768, 32767).astype("<i2").tobytes()
+
+
+def _f32_to_pcm16(samples: bytes) -> bytes:
+    import numpy as np
+
+    audio = np.frombuffer(samples, dtype="<f4")
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class LiveProtocol:
+    """
+    Trạng thái giao thức của một kết nối WebSocket
+    """
+
+    def __init__(self, protocol: str = PROTOCOL_JSON, sample_rate: int = 16000):
+        self.protocol = protocol
+        self.sample_rate = sample_rate
+        self.last_seq = None
+        # sample rate của client -> resampler (giữ trạng thái lọc giữa các frame)
+        self._resamplers = {}
+        self.frames_received = 0
+        self.frames_missing = 0
+        self.frames_reordered = 0
+
+    @property
+    def is_binary(self) -> bool:
+        return self.protocol == PROTOCOL_BINARY_V1
+
+    def decode_audio(self, message: bytes) -> Dict[str, Any]:
+        """
+        Giải mã message audio từ client thành PCM16 kèm metadata
+        """
+        with DECODE_SECONDS[self.protocol].time():
+            try:
+                return self._decode_audio(message)
+            except ProtocolError:
+                FRAMES_REJECTED.inc()
+                raise
+
+    def _decode_audio(self, message: bytes) -> Dict[str, Any]:
+        self.frames_received += 1
+
+        if not self.is_binary:
+            # Chế độ cũ: raw bytes, không có metadata
+            return {
+                "seq": self.frames_received - 1,
+                "capture_ts_us": None,
+                "codec": CODEC_PCM_S16LE,
+                "sample_rate": self.sample_rate,
+                "pcm": message,
+            }
+
+        if len(message) < FRAME_HEADER.size:
+            raise ProtocolError("Frame quá ngắn")
+
+        version, codec, num_samples, seq, sample_rate, capture_ts_us = FRAME_HEADER.unpack_from(message)
+        if version != FRAME_VERSION:
+            raise ProtocolError(f"Phiên bản frame không hỗ trợ: {version}")
+        if codec not in CODEC_SAMPLE_WIDTH:
+            raise ProtocolError(f"Codec không hỗ trợ: {codec}")
+        if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+            raise ProtocolError(f"Sample rate không hỗ trợ: {sample_rate}")
+
+        samples = message[FRAME_HEADER.size:]
+        if len(samples) != num_samples * CODEC_SAMPLE_WIDTH[codec]:
+            raise ProtocolError("Số mẫu không khớp với kích thước payload")
+
+        self._track_sequence(seq)
+
+        if codec == CODEC_PCM_S16LE:
+            pcm = samples
+        elif codec == CODEC_PCM_F32LE:
+            pcm = _f32_to_pcm16(samples)
+        else:
+            pcm = _mulaw_to_pcm16(samples)
+        # Client có thể đổi sample rate giữa phiên (flow control) - service luôn nhận cùng một sample rate
+        if sample_rate != self.sample_rate:
+            resampler = self._resamplers.get(sample_rate)
+            if resampler is None:
+                resampler = self._resamplers[sample_rate] = PolyphaseResampler(sample_rate, self.sample_rate)
+            pcm = resampler.process(pcm)
+
+        return {
+            "seq": seq,
+            "capture_ts_us": capture_ts_us,
+            "codec": codec,
+            "sample_rate": sample_rate,
+            "pcm": pcm,
+        }
+
+    def _track_sequence(self, seq: int):
+        if self.last_seq is not None:
+            if seq > self.last_seq + 1:
+                self.frames_missing += seq - self.last_seq - 1
+            elif seq <= self.last_seq:
+                self.frames_reordered += 1
+                return
+        self.last_seq = seq
+
+    def encode_message(self, message: Dict[str, Any]) -> Any:
+        """
+        Mã hóa message gửi về client: dict cho JSON, bytes MessagePack cho binary
+        """
+        if not self.is_binary:
+            return message
+
+        compact = {"t": RESULT_TYPES.get(message["type"], message["type"])}
+        for key, value in message.items():
+            if key != "type":
+                compact[key] = value
+        return msgpack.packb(compact, use_bin_type=True)
+
+    def transcription_message(self, result: Dict[str, Any], frame: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Tạo message kết quả transcription theo định dạng của giao thức hiện tại.
+        Nếu result có "offset" (chế độ delta), text chỉ là phần thay thế từ vị trí offset.
+        """
+        if not self.is_binary:
+            message = {
+                "type": "transcription",
+                "text": result["text"],
+                "confidence": result["confidence"],
+                "is_final": result["is_final"],
+                "timestamp": datetime.now().isoformat()
+            }
+            if "offset" in result:
+                message["offset"] = result["offset"]
+            return message
+
+        message = {
+            "type": "transcription",
+            "x": result["text"],
+            "c": result["confidence"],
+            "f": result["is_final"],
+            "s": frame["seq"] if frame else None,
+            "ts": time.time_ns() // 1_000_000,
+        }
+        if "offset" in result:
+            message["o"] = result["offset"]
+        return message
+
+    async def send(self, websocket, message: Dict[str, Any]):
+        """
+        Gửi message qua WebSocket theo giao thức đã thương lượng
+        """
+        with SEND_SECONDS[self.protocol].time():
+            if self.is_binary:
+                await websocket.send_bytes(self.encode_message(message))
+            else:
+                await websocket.send_json(message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "protocol": self.protocol,
+            "frames_received": self.frames_received,
+            "frames_missing": self.frames_missing,
+            "frames_reordered": self.frames_reordered,
+        }
@@ -0,0 +1,248 @@
+"""
+Metrics nhẹ cho các đường xử lý nóng: Counter, Gauge, Histogram và registry xuất ra
+định dạng text của Prometheus (endpoint `/metrics`).
+
+Chi phí ghi nhận chỉ là vài phép cộng, không lock và không cấp phát bộ nhớ; tra cứu theo
+label nên làm một lần lúc khởi tạo rồi giữ tham chiếu tới metric con.
+"""
+import bisect
+import time
+from typing import Dict, Any, Callable, List, Optional, Sequence
+
+# Bucket mặc định cho độ trễ (giây): 1ms -> 10s
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Bucket cho các thao tác rất ngắn (giải mã frame, gửi message): 10µs -> 100ms
+FAST_LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1
+)
+
+METRIC_PREFIX = "ai_companion_"
+
+
+class Histogram:
+    """
+    Histogram bucket cố định, chi phí observe O(log số bucket), không cấp phát bộ nhớ
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Bucket cuối cùng là +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def time(self) -> "Timer":
+        """Đo thời gian một khối lệnh: `with histogram.time(): ...`"""
+        return Timer(self)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Ước lượng quantile bằng cận trên của bucket chứa nó"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Counter:
+    """
+    Bộ đếm chỉ tăng. Nếu có function thì giá trị được đọc từ function lúc scrape
+    (dùng cho bộ đếm sẵn có trong service).
+    """
+
+    __slots__ = ("value", "function")
+
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge:
+    """
+    Giá trị tức thời (số session, độ sâu hàng đợi...). Nếu có function thì đọc lúc scrape.
+    """
+
+    __slots__ = ("value", "function")
+
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+_KINDS = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> tuple:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Tập hợp metric theo tên và label. Gọi lại với cùng tên + label trả về cùng một đối tượng.
+    """
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self._families = {}
+
+    def _family(self, kind: str, name: str, documentation: str) -> Dict[str, Any]:
+        family = self._families.get(name)
+        if family is None:
+            family = {"kind": kind, "help": documentation, "series": {}}
+            self._families[name] = family
+        elif family["kind"] != kind:
+            raise ValueError(f"Metric {name} đã được đăng ký với kiểu {family['kind']}")
+        return family
+
+    def counter(self, name: str, documentation: str, labels: Optional[Dict[str, str]] = None,
+                function: Optional[Callable[[], float]] = None) -> Counter:
+        series = self._family("counter", name, documentation)["series"]
+        key = _label_key(labels)
+        metric = series.get(key)
+        if metric is None:
+            metric = series[key] = Counter(function)
+        elif function is not None:
+            metric.function = function
+        return metric
+
+    def gauge(self, name: str, documentation: str, labels: Optional[Dict[str, str]] = None,
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        series = self._family("gauge", name, documentation)["series"]
+        key = _label_key(labels)
+        metric = series.get(key)
+        if metric is None:
+            metric = series[key] = Gauge(function)
+        elif function is not None:
+            # Service được tạo lại (ví dụ khi reload) thay function cũ
+            metric.function = function
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Optional[Dict[str, str]] = None,
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        series = self._family("histogram", name, documentation)["series"]
+        key = _label_key(labels)
+        metric = series.get(key)
+        if metric is None:
+            metric = series[key] = Histogram(buckets)
+        return metric
+
+    def register(self, name: str, documentation: str, metric, labels: Optional[Dict[str, str]] = None):
+        """Đăng ký một metric đã có sẵn (ví dụ histogram do service tự tạo)"""
+        self._family(_KINDS[type(metric)], name, documentation)["series"][_label_key(labels)] = metric
+        return metric
+
+    def render(self) -> str:
+        """Xuất toàn bộ metric theo định dạng text exposition 0.0.4 của Prometheus"""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            full_name = self.prefix + name
+            lines.append(f"# HELP {full_name} {_escape(family['help'])}")
+            lines.append(f"# TYPE {full_name} {family['kind']}")
+            for key, metric in family["series"].items():
+                if family["kind"] == "histogram":
+                    lines.extend(self._render_histogram(full_name, key, metric))
+                    continue
+                try:
+                    value = metric.get()
+                except Exception:
+                    # Function lỗi không được làm hỏng cả lần scrape
+                    continue
+                lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(full_name: str, key: tuple, histogram: Histogram) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+            cumulative += bucket_count
+            lines.append(f"{full_name}_bucket{_format_labels(key, ('le', _format_value(float(bound))))} {cumulative}")
+        lines.append(f"{full_name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+        lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+        lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        return lines
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,266 @@
+"""
+Profiling theo từng request, bật khi cần (settings.profiling_enabled).
+
+Request được profile khi có header `X-Profile: 1` kèm admin key hợp lệ, hoặc được chọn ngẫu nhiên
+theo settings.profiling_sample_rate. Trong lúc request chạy, một thread nền lấy mẫu stack của các
+thread trong process mỗi profiling_interval_ms (không hook vào từng lời gọi hàm như cProfile nên
+overhead thấp). Kết quả được giữ trong ring buffer giới hạn và xuất ra định dạng "collapsed stack"
+(`frame;frame;frame count`) dùng được với flamegraph.pl, inferno hoặc speedscope.
+
+Vì các request async chạy xen kẽ trên cùng event loop, mẫu lấy được trong lúc nhiều request cùng
+được profile sẽ xuất hiện trong tất cả các profile đó.
+
+Khi tắt, middleware không được cài nên không có chi phí nào.
+"""
+import itertools
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+from app.core.security import is_admin_key
+
+# Giới hạn độ sâu stack để một mẫu không quá lớn
+MAX_STACK_DEPTH = 128
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 15
+
+
+class ProfileCapture:
+    """Các mẫu stack của một request đang được profile"""
+
+    def __init__(self, profile_id: int, method: str, path: str, reason: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.samples = 0
+        self.stacks = Counter()
+        self.memory = None
+        self._memory_before = None
+
+    def add(self, stack: str):
+        if self.duration_ms is not None:
+            # Sampler có thể còn giữ capture vừa kết thúc trong vòng lấy mẫu hiện tại
+            return
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "memory": self.memory is not None
+        }
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class StackSampler:
+    """
+    Thread nền lấy mẫu stack của mọi thread (trừ chính nó); chỉ chạy khi có ít nhất một capture đang mở
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._captures = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        # code object -> nhãn "module:qualname", tránh format lại cùng một hàm ở mỗi mẫu
+        self._labels = {}
+        self.samples_taken = 0
+
+    def attach(self, capture: ProfileCapture):
+        with self._lock:
+            self._captures.add(capture)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def detach(self, capture: ProfileCapture):
+        with self._lock:
+            self._captures.discard(capture)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._captures:
+                    self._thread = None
+                    return
+                captures = list(self._captures)
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._fold(names.get(thread_id, str(thread_id)), frame)
+                for capture in captures:
+                    capture.add(stack)
+            self.samples_taken += 1
+            time.sleep(self.interval)
+
+    def _fold(self, thread_name: str, frame) -> str:
+        labels = self._labels
+        parts = []
+        while frame is not None and len(parts) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                module = frame.f_globals.get("__name__", "?")
+                label = labels[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(";", ":").replace(" ", "_")
+            parts.append(label)
+            frame = frame.f_back
+        parts.append(thread_name.replace(";", ":").replace(" ", "_"))
+        parts.reverse()
+        return ";".join(parts)
+
+
+class RequestProfiler:
+    """
+    Quyết định request nào được profile, quản lý sampler / tracemalloc và ring buffer kết quả
+    """
+
+    def __init__(self, interval_ms: Optional[float] = None, max_profiles: Optional[int] = None,
+                 sample_rate: Optional[float] = None, trace_memory: Optional[bool] = None):
+        self.sample_rate = settings.profiling_sample_rate if sample_rate is None else sample_rate
+        self.trace_memory = settings.profiling_tracemalloc if trace_memory is None else trace_memory
+        self.sampler = StackSampler((settings.profiling_interval_ms if interval_ms is None else interval_ms) / 1000)
+        self.profiles = deque(maxlen=settings.profiling_max_profiles if max_profiles is None else max_profiles)
+        self._ids = itertools.count(1)
+        self._memory_users = 0
+        self._started_tracemalloc = False
+        self.stats = {"requests_seen": 0, "profiled_on_demand": 0, "profiled_sampled": 0}
+
+    def select(self, headers: Dict[str, str]) -> Optional[str]:
+        """Lý do profile request ("on_demand" / "sampled") hoặc None nếu không profile"""
+        self.stats["requests_seen"] += 1
+        if headers.get("x-profile") in ("1", "true") and is_admin_key(headers.get("x-admin-key")):
+            self.stats["profiled_on_demand"] += 1
+            return "on_demand"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            self.stats["profiled_sampled"] += 1
+            return "sampled"
+        return None
+
+    def begin(self, method: str, path: str, reason: str) -> ProfileCapture:
+        capture = ProfileCapture(next(self._ids), method, path, reason)
+        if self.trace_memory:
+            self._start_memory(capture)
+        self.sampler.attach(capture)
+        return capture
+
+    def end(self, capture: ProfileCapture, status: Optional[int]):
+        self.sampler.detach(capture)
+        capture.duration_ms = round((time.perf_counter() - capture.started) * 1000, 3)
+        capture.status = status
+        if capture._memory_before is not None:
+            self._stop_memory(capture)
+        self.profiles.append(capture)
+
+    def _start_memory(self, capture: ProfileCapture):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._memory_users += 1
+        capture._memory_before = tracemalloc.take_snapshot()
+
+    def _stop_memory(self, capture: ProfileCapture):
+        after = tracemalloc.take_snapshot()
+        capture.memory = [
+            {
+                "location": str(stat.traceback[0]) if stat.traceback else "?",
+                "size_diff_kb": round(stat.size_diff / 1024, 2),
+                "count_diff": stat.count_diff
+            }
+            for stat in after.compare_to(capture._memory_before, "lineno")[:TOP_ALLOCATIONS]
+        ]
+        capture._memory_before = None
+        self._memory_users -= 1
+        # Chỉ tắt tracemalloc nếu chính profiler đã bật nó
+        if self._memory_users == 0 and self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def get_profile(self, profile_id: int) -> Optional[ProfileCapture]:
+        for capture in self.profiles:
+            if capture.id == profile_id:
+                return capture
+        return None
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        return [capture.summary() for capture in reversed(self.profiles)]
+
+    def clear(self) -> int:
+        count = len(self.profiles)
+        self.profiles.clear()
+        return count
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.profiling_enabled,
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.sampler.interval * 1000,
+            "trace_memory": self.trace_memory,
+            "profiles_kept": len(self.profiles),
+            "max_profiles": self.profiles.maxlen,
+            "samples_taken": self.sampler.samples_taken,
+            **self.stats
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: profile request HTTP được chọn và trả id profile trong header X-Profile-Id
+    """
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        reason = self.profiler.select(headers)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        capture = self.profiler.begin(scope.get("method", ""), scope.get("path", ""), reason)
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-profile-id", str(capture.id).encode())]
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.end(capture, status)
+
+
+request_profiler = RequestProfiler()
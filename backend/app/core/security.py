@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.core.config import settings
+
+# Header của request ASGI (tên viết thường, dạng bytes)
+DEVICE_TOKEN_HEADER = b"x-device-token"
+ADMIN_KEY_HEADER = b"x-admin-key"
+
+def is_admin_key(x_admin_key: Optional[str]) -> bool:
+    """
+    Kiểm tra admin key (dùng chung cho dependency và middleware).
+    Nếu chưa cấu hình admin_api_key thì không chấp nhận key nào (kể cả ở chế độ debug).
+    """
+    if not settings.admin_api_key or x_admin_key is None:
+        return False
+    return hmac.compare_digest(x_admin_key.encode(), settings.admin_api_key.encode())
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """
+    Dependency cho các endpoint admin: yêu cầu header X-Admin-Key khớp với settings.admin_api_key.
+    Nếu chưa cấu hình admin_api_key thì mọi endpoint admin đều bị từ chối.
+    """
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=403, detail="Admin API chưa được cấu hình (đặt ADMIN_API_KEY)")
+    if not is_admin_key(x_admin_key):
+        raise HTTPException(status_code=403, detail="Sai admin key")
+
+def _device_signature(device_id: str) -> str:
+    digest = hmac.new(settings.secret_key.encode(), f"device:{device_id}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+def issue_device_token(device_id: str) -> str:
+    """
+    Token định danh thiết bị (header X-Device-Token / auth của Socket.IO): "<device_id>.<chữ ký HMAC>".
+    Chỉ server có secret_key mới tạo được token, nên device_id trong token là đã được xác thực.
+    """
+    if not device_id or "." in device_id:
+        raise ValueError("device_id không hợp lệ")
+    return f"{device_id}.{_device_signature(device_id)}"
+
+def verify_device_token(token: Optional[str]) -> Optional[str]:
+    """Trả về device_id nếu token hợp lệ, ngược lại None"""
+    if not token or "." not in token:
+        return None
+    device_id, signature = token.rsplit(".", 1)
+    if not device_id or not hmac.compare_digest(signature.encode(), _device_signature(device_id).encode()):
+        return None
+    return device_id
+
+async def require_device(x_device_token: Optional[str] = Header(None)) -> str:
+    """
+    Dependency cho các endpoint theo thiết bị: trả về device_id đã xác thực từ header X-Device-Token.
+    Thiếu hoặc sai token thì từ chối (401), không suy ra thiết bị từ header tự khai hay địa chỉ client.
+    """
+    device_id = verify_device_token(x_device_token)
+    if device_id is None:
+        raise HTTPException(status_code=401, detail="Thiếu hoặc sai device token (header X-Device-Token)")
+    return device_id
+
+def scope_is_authenticated(scope) -> bool:
+    """Request ASGI có device token hợp lệ hoặc admin key đúng"""
+    for key, value in scope.get("headers", []):
+        if key == DEVICE_TOKEN_HEADER and verify_device_token(value.decode("latin-1")):
+            return True
+        if key == ADMIN_KEY_HEADER and is_admin_key(value.decode("latin-1")):
+            return True
+    return False
@@ -0,0 +1,244 @@
+import abc
+import asyncio
+import json
+import uuid
+from typing import Dict, Any, Callable, Awaitable, Optional
+from app.core.config import settings
+
+MessageHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Chờ giữa các lần kết nối lại Redis (tăng gấp đôi mỗi lần lỗi liên tiếp)
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class AlertBus(abc.ABC):
+    """
+    Kênh pub/sub chia sẻ thay đổi lịch sử alert giữa các worker.
+    Các thao tác ghi được gom lại và publish theo batch mỗi alert_bus_flush_ms
+    (hoặc khi đủ alert_bus_batch_size thao tác).
+    """
+
+    def __init__(self, channel: Optional[str] = None):
+        self.channel = channel or settings.alert_bus_channel
+        self.worker_id = uuid.uuid4().hex
+        self.outbox = []
+        # Cập nhật của cùng một alert trong một batch được gộp, chỉ giữ bản mới nhất
+        self._pending_updates = {}
+        self._handler = None
+        self._flush_task = None
+        self._flush_event = None
+        self.stats = {"batches_published": 0, "ops_published": 0, "batches_failed": 0,
+                      "batches_received": 0, "ops_received": 0}
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+        self._flush_event = asyncio.Event()
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        await self._subscribe()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        await self._unsubscribe()
+
+    def queue_write(self, op: Dict[str, Any]):
+        """Thêm một thao tác ghi lịch sử vào batch kế tiếp"""
+        if op["op"] == "update":
+            self._pending_updates[op["id"]] = op
+        else:
+            self.outbox.append(op)
+        if len(self.outbox) + len(self._pending_updates) >= settings.alert_bus_batch_size and self._flush_event is not None:
+            self._flush_event.set()
+
+    @property
+    def pending_ops(self) -> int:
+        return len(self.outbox) + len(self._pending_updates)
+
+    async def _flush_loop(self):
+        interval = settings.alert_bus_flush_ms / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error publishing alert batch: {e}")
+
+    async def flush(self):
+        if not self.outbox and not self._pending_updates:
+            return
+        outbox, updates = self.outbox, self._pending_updates
+        ops = outbox + list(updates.values())
+        self.outbox = []
+        self._pending_updates = {}
+        try:
+            await self._publish({"type": "history", "origin": self.worker_id, "ops": ops})
+        except Exception:
+            # Trả batch về đầu hàng đợi để gửi lại ở lần flush sau; cập nhật mới hơn (ghi trong lúc publish) được giữ
+            self.outbox = outbox + self.outbox
+            self._pending_updates = {**updates, **self._pending_updates}
+            self.stats["batches_failed"] += 1
+            raise
+        self.stats["batches_published"] += 1
+        self.stats["ops_published"] += len(ops)
+
+    async def _receive(self, message: Dict[str, Any]):
+        # Bỏ qua message do chính worker này gửi
+        if message.get("origin") == self.worker_id or self._handler is None:
+            return
+        self.stats["batches_received"] += 1
+        self.stats["ops_received"] += len(message.get("ops", []))
+        await self._handler(message)
+
+    @abc.abstractmethod
+    async def _subscribe(self):
+        ...
+
+    @abc.abstractmethod
+    async def _unsubscribe(self):
+        ...
+
+    @abc.abstractmethod
+    async def _publish(self, message: Dict[str, Any]):
+        ...
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "channel": self.channel,
+            "worker_id": self.worker_id,
+            "pending_ops": self.pending_ops,
+            **self.stats
+        }
+
+
+class LocalAlertBus(AlertBus):
+    """
+    Backend loopback trong cùng process - nhiều AlertService dùng chung channel sẽ thấy
+    thay đổi của nhau như các worker thật. Dùng cho test và chạy một worker.
+    """
+
+    _hubs = {}
+
+    async def _subscribe(self):
+        self._hubs.setdefault(self.channel, []).append(self)
+
+    async def _unsubscribe(self):
+        subscribers = self._hubs.get(self.channel, [])
+        if self in subscribers:
+            subscribers.remove(self)
+
+    async def _publish(self, message: Dict[str, Any]):
+        # Đi qua JSON giống như khi gửi qua Redis
+        payload = json.dumps(message, ensure_ascii=False)
+        for bus in list(self._hubs.get(self.channel, [])):
+            await bus._receive(json.loads(payload))
+
+
+class RedisAlertBus(AlertBus):
+    """
+    Backend Redis pub/sub (settings.redis_url).
+    Listener tự kết nối lại với backoff khi Redis lỗi / khởi động lại; batch nhận được trong lúc
+    mất kết nối bị mất (lịch sử của worker khác vẫn có trong log / snapshot của worker đó).
+    """
+
+    def __init__(self, channel: Optional[str] = None, redis_url: Optional[str] = None):
+        super().__init__(channel)
+        self.redis_url = redis_url or settings.redis_url
+        self._redis = None
+        self._pubsub = None
+        self._listen_task = None
+        self.connected = False
+        self.stats.update({"listener_errors": 0, "reconnects": 0})
+
+    async def _subscribe(self):
+        import redis.asyncio as redis
+
+        # Client dùng connection pool nên publish tự kết nối lại; chỉ pub/sub cần được tạo lại
+        self._redis = redis.from_url(self.redis_url)
+        try:
+            await self._connect_pubsub()
+        except Exception as e:
+            # Redis chưa sẵn sàng lúc khởi động: listener sẽ thử lại, app vẫn chạy
+            self.stats["listener_errors"] += 1
+            print(f"⚠️ Alert bus: không subscribe được Redis ({e}), sẽ thử lại")
+        self._listen_task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _connect_pubsub(self):
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self.connected = True
+
+    async def _reset_pubsub(self):
+        self.connected = False
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def _listen(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._connect_pubsub()
+                    self.stats["reconnects"] += 1
+                    print(f"✅ Alert bus: đã kết nối lại Redis channel {self.channel}")
+                delay = RECONNECT_MIN_SECONDS
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    try:
+                        await self._receive(json.loads(item["data"]))
+                    except Exception as e:
+                        print(f"Error applying alert batch from Redis: {e}")
+                # listen() chỉ dừng khi pub/sub không còn subscribe channel nào
+                raise ConnectionError("Redis pub/sub đã dừng")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["listener_errors"] += 1
+                print(f"⚠️ Alert bus: lỗi Redis listener ({e}), kết nối lại sau {delay:.1f}s")
+                await self._reset_pubsub()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def _unsubscribe(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel)
+            except Exception as e:
+                print(f"Error unsubscribing alert bus: {e}")
+            await self._reset_pubsub()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def _publish(self, message: Dict[str, Any]):
+        await self._redis.publish(self.channel, json.dumps(message, ensure_ascii=False))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**super().get_stats(), "connected": self.connected}
+
+
+def create_alert_bus(backend: Optional[str] = None) -> Optional[AlertBus]:
+    """
+    Tạo bus theo settings.alert_bus_backend: "none" (mặc định), "local" hoặc "redis"
+    """
+    backend = backend or settings.alert_bus_backend
+    if backend == "redis":
+        return RedisAlertBus()
+    if backend == "local":
+        return LocalAlertBus()
+    return None
@@ -0,0 +1,140 @@
+import time
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from app.core.config import settings
+
+# Kết quả của AlertDebouncer.observe
+EVENT_OPEN = "open"        # sự kiện mới -> tạo alert và gửi thông báo
+EVENT_MERGED = "merged"    # phát hiện thuộc sự kiện đang diễn ra (hoặc trong cooldown) -> gộp vào alert cũ
+EVENT_CLOSED = "closed"    # điểm số rơi dưới ngưỡng tắt -> kết thúc sự kiện
+EVENT_IGNORED = "ignored"  # dưới ngưỡng bật, không có sự kiện nào đang diễn ra
+
+# (trạng thái sự kiện, thời điểm kết thúc theo time.monotonic()) -> None
+CloseCallback = Callable[[Dict[str, Any], float], None]
+
+
+class AlertDebouncer:
+    """
+    Gộp các phát hiện liên tiếp của cùng một (device, sound_type) thành một sự kiện.
+
+    - Hysteresis: sự kiện bắt đầu khi confidence >= ngưỡng bật (sensitivity) và chỉ kết thúc
+      khi confidence < ngưỡng tắt (sensitivity - alert_hysteresis) hoặc không có phát hiện nào
+      trong alert_event_gap_seconds.
+    - Cooldown: sự kiện mới bắt đầu trong alert_cooldown_seconds sau khi sự kiện trước kết thúc
+      được gộp lại vào sự kiện trước thay vì tạo alert mới.
+
+    Sự kiện không còn nhận phát hiện nào được kết thúc khi dọn dẹp định kỳ (on_close được gọi để chốt
+    end_time của alert), kể cả khi key đó không bao giờ được thấy lại.
+    """
+
+    def __init__(self, on_close: Optional[CloseCallback] = None):
+        self.on_close = on_close
+        # (device, sound_type) -> trạng thái sự kiện
+        self.events = {}
+        self.stats = {
+            "detections": 0,
+            "events_opened": 0,
+            "detections_merged": 0,
+            "events_closed": 0
+        }
+        self._observations = 0
+        self._last_prune = time.monotonic()
+
+    def observe(self, key: Tuple[str, str], confidence: float, sensitivity: float,
+                now: Optional[float] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Cập nhật trạng thái với một điểm số mới.
+        Trả về (kết quả, trạng thái sự kiện); trạng thái chứa "alert" là bản ghi alert của sự kiện.
+        """
+        now = time.monotonic() if now is None else now
+        off_threshold = sensitivity - settings.alert_hysteresis
+        state = self.events.get(key)
+
+        self._observations += 1
+        if self._observations % 1000 == 0 or now - self._last_prune >= settings.alert_event_gap_seconds:
+            self._prune(now)
+
+        if state is not None and state["active"] and now - state["last_seen"] > settings.alert_event_gap_seconds:
+            # Không còn phát hiện nào trong khoảng gap -> sự kiện đã kết thúc tại lần thấy cuối
+            self._close(state, state["last_seen"])
+
+        if state is not None and state["active"]:
+            if confidence >= off_threshold:
+                state["last_seen"] = now
+                self.stats["detections"] += 1
+                self.stats["detections_merged"] += 1
+                return EVENT_MERGED, state
+            self._close(state, now)
+            return EVENT_CLOSED, state
+
+        if confidence < sensitivity:
+            return EVENT_IGNORED, state
+
+        self.stats["detections"] += 1
+
+        if state is not None and now - state["closed_at"] < settings.alert_cooldown_seconds:
+            # Trong cooldown: mở lại sự kiện trước, không thông báo lại
+            state["active"] = True
+            state["last_seen"] = now
+            self.stats["detections_merged"] += 1
+            return EVENT_MERGED, state
+
+        state = {
+            "active": True,
+            "started": now,
+            "last_seen": now,
+            "closed_at": None,
+            "alert": None
+        }
+        self.events[key] = state
+        self.stats["events_opened"] += 1
+        return EVENT_OPEN, state
+
+    def active_by_device(self, now: Optional[float] = None) -> Dict[str, List[str]]:
+        """device -> các sound type đang có sự kiện diễn ra (để đưa điểm dưới ngưỡng vào observe)"""
+        self._expire(time.monotonic() if now is None else now)
+        active = {}
+        for (device, sound_type), state in self.events.items():
+            if state["active"]:
+                active.setdefault(device, []).append(sound_type)
+        return active
+
+    def _close(self, state: Dict[str, Any], closed_at: float):
+        state["active"] = False
+        state["closed_at"] = closed_at
+        self.stats["events_closed"] += 1
+        if self.on_close is not None and state["alert"] is not None:
+            try:
+                self.on_close(state, closed_at)
+            except Exception as e:
+                print(f"⚠️ Alert event close callback failed: {e}")
+
+    def _expire(self, now: float):
+        """Kết thúc các sự kiện không có phát hiện nào trong alert_event_gap_seconds (tại lần thấy cuối)"""
+        for state in self.events.values():
+            if state["active"] and now - state["last_seen"] > settings.alert_event_gap_seconds:
+                self._close(state, state["last_seen"])
+
+    def _prune(self, now: float):
+        """Kết thúc sự kiện đã im lặng, rồi bỏ trạng thái của các sự kiện đã kết thúc và hết cooldown"""
+        self._last_prune = now
+        self._expire(now)
+        expired = [
+            key for key, state in self.events.items()
+            if not state["active"] and now - state["closed_at"] >= settings.alert_cooldown_seconds
+        ]
+        for key in expired:
+            del self.events[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        detections = self.stats["detections"]
+        return {
+            **self.stats,
+            "tracked_events": len(self.events),
+            "active_events": sum(1 for state in self.events.values()
+                                 if state["active"] and now - state["last_seen"] <= settings.alert_event_gap_seconds),
+            "coalescing_ratio": round(detections / self.stats["events_opened"], 1) if self.stats["events_opened"] else None,
+            "cooldown_seconds": settings.alert_cooldown_seconds,
+            "hysteresis": settings.alert_hysteresis,
+            "event_gap_seconds": settings.alert_event_gap_seconds
+        }
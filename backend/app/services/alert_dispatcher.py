@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, Any, Callable, Awaitable, List, Optional
+from app.core.config import settings
+from app.core.metrics import Histogram, REGISTRY
+
+# Số càng nhỏ càng được ưu tiên trong hàng đợi
+PRIORITY_RANK = {
+    "critical": 0,
+    "high": 1,
+    "medium": 2,
+    "low": 3
+}
+
+# notification_method -> kênh phân phối. "visual" và "vibration" đều do app trên thiết bị
+# hiển thị nên dùng chung một lần push Socket.IO
+METHOD_CHANNELS = {
+    "visual": "socketio",
+    "vibration": "socketio",
+    "email": "email"
+}
+
+ChannelHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class AlertDispatcher:
+    """
+    Phân phối alert tới các kênh thông báo.
+    Mỗi kênh có hàng đợi ưu tiên và worker riêng, nên kênh chậm (email) không chặn kênh nhanh (Socket.IO),
+    và alert critical luôn được lấy ra trước trong mỗi kênh.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self._seq = itertools.count()
+        self.latency_by_channel = {}
+        self.latency_by_priority = {
+            priority: REGISTRY.register("alert_dispatch_priority_latency_seconds",
+                                        "Độ trễ từ lúc phát hiện tới lúc gửi xong theo mức ưu tiên",
+                                        Histogram(), {"priority": priority})
+            for priority in PRIORITY_RANK
+        }
+        self.slo_violations = 0
+
+    def register_channel(self, name: str, handler: ChannelHandler, workers: int = 1, max_queue: int = 1000):
+        """
+        Đăng ký một kênh phân phối (có thể gọi lại để thay handler)
+        """
+        channel = self.channels.get(name)
+        if channel is not None:
+            channel["handler"] = handler
+            return
+
+        channel = self.channels[name] = {
+            "handler": handler,
+            "workers": workers,
+            "max_queue": max_queue,
+            "queue": None,
+            "tasks": [],
+            "delivered": 0,
+            "failed": 0,
+            "dropped": 0
+        }
+        self.latency_by_channel[name] = REGISTRY.register(
+            "alert_dispatch_latency_seconds", "Độ trễ từ lúc phát hiện tới lúc gửi xong theo kênh",
+            Histogram(), {"channel": name}
+        )
+        REGISTRY.gauge("alert_dispatch_queue_depth", "Số alert đang chờ trong hàng đợi của kênh", {"channel": name},
+                       function=lambda: channel["queue"].qsize() if channel["queue"] else 0)
+        for outcome in ("delivered", "failed", "dropped"):
+            REGISTRY.counter(f"alert_dispatch_{outcome}_total", f"Số alert {outcome} theo kênh", {"channel": name},
+                             function=lambda outcome=outcome: channel[outcome])
+
+    def _ensure_started(self, channel: Dict[str, Any], name: str):
+        if channel["tasks"]:
+            return
+        loop = asyncio.get_running_loop()
+        channel["queue"] = asyncio.PriorityQueue()
+        channel["tasks"] = [
+            loop.create_task(self._worker(name, channel))
+            for _ in range(channel["workers"])
+        ]
+
+    def channels_for(self, alert: Dict[str, Any]) -> List[str]:
+        """Các kênh cần phân phối cho một alert"""
+        channels = []
+        for method in alert.get("notification_method", []):
+            channel = METHOD_CHANNELS.get(method)
+            if channel and channel not in channels:
+                channels.append(channel)
+
+        # Alert critical luôn được push tới thiết bị, kể cả khi user tắt visual/vibration
+        if alert.get("priority") == "critical" and "socketio" not in channels:
+            channels.insert(0, "socketio")
+
+        return [channel for channel in channels if channel in self.channels]
+
+    def dispatch(self, alert: Dict[str, Any], detected_at: Optional[float] = None) -> List[str]:
+        """
+        Đưa alert vào hàng đợi của các kênh tương ứng, trả về danh sách kênh đã nhận.
+        detected_at là thời điểm phát hiện (time.time()), dùng để đo độ trễ end-to-end.
+        """
+        detected_at = time.time() if detected_at is None else detected_at
+        rank = PRIORITY_RANK.get(alert.get("priority"), len(PRIORITY_RANK))
+        accepted = []
+
+        for name in self.channels_for(alert):
+            channel = self.channels[name]
+            self._ensure_started(channel, name)
+
+            # Hàng đợi đầy thì bỏ alert không critical, alert critical không bao giờ bị bỏ
+            if rank > 0 and channel["queue"].qsize() >= channel["max_queue"]:
+                channel["dropped"] += 1
+                continue
+
+            channel["queue"].put_nowait((rank, next(self._seq), detected_at, alert))
+            accepted.append(name)
+
+        return accepted
+
+    async def _worker(self, name: str, channel: Dict[str, Any]):
+        queue = channel["queue"]
+        while True:
+            rank, _, detected_at, alert = await queue.get()
+            try:
+                await channel["handler"](alert)
+                latency = time.time() - detected_at
+                channel["delivered"] += 1
+                self.latency_by_channel[name].observe(latency)
+                self.latency_by_priority.get(alert.get("priority"), self.latency_by_priority["low"]).observe(latency)
+                if rank == 0 and latency * 1000 > settings.alert_critical_slo_ms:
+                    self.slo_violations += 1
+            except Exception as e:
+                channel["failed"] += 1
+                print(f"Error dispatching alert {alert.get('id')} via {name}: {e}")
+            finally:
+                queue.task_done()
+
+    async def stop(self):
+        """Dừng toàn bộ worker (alert còn trong hàng đợi bị bỏ)"""
+        for channel in self.channels.values():
+            for task in channel["tasks"]:
+                task.cancel()
+            await asyncio.gather(*channel["tasks"], return_exceptions=True)
+            channel["tasks"] = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "critical_slo_ms": settings.alert_critical_slo_ms,
+            "slo_violations": self.slo_violations,
+            "channels": {
+                name: {
+                    "workers": channel["workers"],
+                    "queue_depth": channel["queue"].qsize() if channel["queue"] else 0,
+                    "delivered": channel["delivered"],
+                    "failed": channel["failed"],
+                    "dropped": channel["dropped"],
+                    "latency_seconds": self.latency_by_channel[name].snapshot()
+                }
+                for name, channel in self.channels.items()
+            },
+            "latency_by_priority": {
+                priority: histogram.snapshot()
+                for priority, histogram in self.latency_by_priority.items()
+            }
+        }
+
+
+def device_room(device_id: str) -> str:
+    """Room Socket.IO của một thiết bị: mọi kết nối của thiết bị đó join room này"""
+    return f"device:{device_id}"
+
+
+def socketio_channel(sio) -> ChannelHandler:
+    """
+    Kênh push alert qua Socket.IO (event "alert") tới app trên thiết bị phát hiện âm thanh.
+    Alert chỉ được gửi vào room của device_id - không bao giờ phát cho mọi client.
+    """
+    async def _send(alert: Dict[str, Any]):
+        device_id = alert.get("device_id")
+        if not device_id:
+            # Alert không gắn thiết bị (ví dụ tạo qua API chỉ với location): không có ai để push
+            return
+        payload = {
+            "id": alert["id"],
+            "sound_type": alert["sound_type"],
+            "confidence": alert["confidence"],
+            "priority": alert["priority"],
+            "location": alert.get("location"),
+            "notification_method": alert.get("notification_method", []),
+            "timestamp": alert["timestamp"].isoformat()
+        }
+        await sio.emit("alert", payload, room=device_room(device_id))
+
+    return _send
+
+
+async def email_channel(alert: Dict[str, Any]):
+    """
+    Kênh email: gửi qua SMTP nếu đã cấu hình, chạy trong thread để không chặn event loop
+    """
+    if not settings.smtp_host or not settings.alert_email_recipients:
+        print(f"📧 Email alert (SMTP chưa cấu hình): {alert['sound_type']} - {alert['id']}")
+        return
+    await asyncio.to_thread(_send_email, alert)
+
+
+def _send_email(alert: Dict[str, Any]):
+    import smtplib
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["Subject"] = f"[{settings.app_name}] Cảnh báo: {alert['sound_type']} ({alert['priority']})"
+    message["From"] = settings.smtp_sender
+    message["To"] = ", ".join(settings.alert_email_recipients)
+    message.set_content(
+        f"Phát hiện âm thanh: {alert['sound_type']}\n"
+        f"Độ tin cậy: {alert['confidence']}\n"
+        f"Vị trí: {alert.get('location') or '-'}\n"
+        f"Thời gian: {alert['timestamp'].isoformat()}\n"
+    )
+
+    with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=10) as smtp:
+        smtp.send_message(message)
@@ -0,0 +1,254 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows - không có khóa file, chỉ chạy một worker
+    fcntl = None
+
+SNAPSHOT_FILE = "snapshot.json"
+WAL_PATTERN = "wal-*.log"
+LOCK_FILE = "owner.lock"
+
+
+def _wal_name(start_seq: int) -> str:
+    return f"wal-{start_seq:012d}.log"
+
+
+def _wal_start(path: str) -> int:
+    return int(os.path.basename(path)[4:-4])
+
+
+def claim_log_dir(root: str) -> Tuple[str, Any]:
+    """
+    Chọn thư mục log riêng cho process này: root cho worker đầu tiên, root/worker-<n> cho các worker sau.
+    Mỗi thư mục được giữ bằng khóa file độc quyền (nhả khi process kết thúc), nên khi chạy
+    `uvicorn --workers N` với cùng alert_log_dir, các worker không ghi / khôi phục chung một WAL,
+    và sau khi khởi động lại mỗi worker nhận lại một thư mục cùng lịch sử của nó.
+    Trả về (thư mục, file khóa).
+    """
+    os.makedirs(root, exist_ok=True)
+    if fcntl is None:
+        return root, None
+    slot = 0
+    while True:
+        log_dir = root if slot == 0 else os.path.join(root, f"worker-{slot}")
+        os.makedirs(log_dir, exist_ok=True)
+        lock_file = open(os.path.join(log_dir, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return log_dir, lock_file
+        except BlockingIOError:
+            lock_file.close()
+            slot += 1
+
+
+class AlertLog:
+    """
+    Write-ahead log cho lịch sử alert.
+
+    Mỗi thao tác (add / update / delete) được ghi append-only thành một dòng JSON có số thứ tự.
+    Dòng mới chỉ được gom trong bộ nhớ; việc ghi file và fsync chạy trong thread theo batch
+    (mỗi alert_log_fsync_ms, hoặc ngay khi có thao tác khẩn cấp), không chặn event loop.
+    Định kỳ ghi snapshot gọn của trạng thái hiện tại rồi bỏ các file WAL cũ, nên thời gian
+    khôi phục chỉ phụ thuộc kích thước snapshot (bị giới hạn bởi ring buffer) và phần đuôi log.
+    """
+
+    def __init__(self, log_dir: Optional[str] = None):
+        self.log_dir, self._lock_file = claim_log_dir(log_dir or settings.alert_log_dir)
+        self.seq = 0
+        self.ops_since_snapshot = 0
+        self._file = None
+        # Dòng đã append nhưng chưa ghi xuống file
+        self._pending = []
+        # Mỗi lần chỉ một thread ghi / fsync, theo đúng thứ tự append
+        self._sync_lock = asyncio.Lock()
+        self._wake = None
+        self._closing = False
+        self._fsync_task = None
+        self._snapshot_task = None
+        self.stats = {"ops_written": 0, "fsyncs": 0, "snapshots": 0, "recovered_ops": 0, "recovery_ms": 0.0,
+                      "truncated_bytes": 0}
+
+    def recover(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Đọc snapshot mới nhất và các thao tác sau nó. Phải gọi trước lần append đầu tiên.
+        """
+        started = time.perf_counter()
+        snapshot = None
+        snapshot_path = os.path.join(self.log_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.seq = snapshot["seq"]
+
+        ops = []
+        for path in sorted(glob.glob(os.path.join(self.log_dir, WAL_PATTERN)), key=_wal_start):
+            # Vị trí sau dòng hoàn chỉnh cuối cùng
+            valid_bytes = 0
+            missing_newline = False
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối bị ghi dở khi process chết - bỏ qua
+                        break
+                    valid_bytes += len(line)
+                    missing_newline = not line.endswith(b"\n")
+                    if op["seq"] > self.seq:
+                        ops.append(op)
+                        self.seq = op["seq"]
+            self._repair_tail(path, valid_bytes, missing_newline)
+
+        self.ops_since_snapshot = len(ops)
+        self.stats["recovered_ops"] = len(ops)
+        self.stats["recovery_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self._open_wal(self.seq + 1)
+        return snapshot, ops
+
+    def _repair_tail(self, path: str, valid_bytes: int, missing_newline: bool):
+        """
+        Cắt phần dòng ghi dở ở cuối file WAL. File có thể được mở lại ở chế độ append (cùng tên khi
+        không có thao tác hoàn chỉnh nào sau snapshot), và thao tác mới không được dính vào mảnh vỡ.
+        """
+        size = os.path.getsize(path)
+        if size > valid_bytes:
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+                os.fsync(f.fileno())
+            self.stats["truncated_bytes"] += size - valid_bytes
+        if missing_newline:
+            # Thao tác cuối đầy đủ nhưng thiếu ký tự xuống dòng
+            with open(path, "ab") as f:
+                f.write(b"\n")
+                os.fsync(f.fileno())
+
+    def _open_wal(self, start_seq: int):
+        self._file = open(os.path.join(self.log_dir, _wal_name(start_seq)), "a", encoding="utf-8",
+                          buffering=settings.alert_log_buffer_bytes)
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._fsync_task = asyncio.get_running_loop().create_task(self._fsync_loop())
+
+    def append(self, op: Dict[str, Any], urgent: bool = False):
+        """
+        Ghi một thao tác. urgent=True (alert critical) đánh thức fsync ngay thay vì chờ batch.
+        """
+        if self._file is None:
+            self._open_wal(self.seq + 1)
+        self.seq += 1
+        self._pending.append(json.dumps({"seq": self.seq, **op}, ensure_ascii=False) + "\n")
+        self.ops_since_snapshot += 1
+        self.stats["ops_written"] += 1
+        if urgent:
+            if self._wake is not None:
+                self._wake.set()
+            else:
+                # Chưa start (CLI, khôi phục) - không có vòng fsync nền, ghi ngay
+                self._write(self._file, self._take_pending())
+
+    def _take_pending(self) -> List[str]:
+        lines, self._pending = self._pending, []
+        return lines
+
+    def _write(self, file, lines: List[str], close: bool = False):
+        """Ghi các dòng, flush và fsync (chạy trong thread, trừ khi chưa có event loop)"""
+        if lines:
+            file.write("".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+            self.stats["fsyncs"] += 1
+        if close:
+            file.close()
+
+    async def sync(self):
+        async with self._sync_lock:
+            if self._pending and self._file is not None:
+                await asyncio.to_thread(self._write, self._file, self._take_pending())
+
+    async def _fsync_loop(self):
+        interval = settings.alert_log_fsync_ms / 1000
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Error syncing alert log: {e}")
+
+    def needs_snapshot(self) -> bool:
+        return self.ops_since_snapshot >= settings.alert_log_snapshot_every and (
+            self._snapshot_task is None or self._snapshot_task.done()
+        )
+
+    def schedule_snapshot(self, build_state: Callable[[], Dict[str, Any]]):
+        """Chạy snapshot ở nền (trạng thái được chụp đồng bộ, ghi file trong thread)"""
+        self._snapshot_task = asyncio.get_running_loop().create_task(self.snapshot(build_state))
+
+    async def snapshot(self, build_state: Callable[[], Dict[str, Any]]):
+        # Chụp trạng thái và chuyển sang file WAL mới trong cùng một bước đồng bộ,
+        # để mọi thao tác sau seq này nằm trong file WAL mới
+        state = build_state()
+        seq = self.seq
+        state["seq"] = seq
+        old_file, lines = self._file, self._take_pending()
+        self._open_wal(seq + 1)
+        self.ops_since_snapshot = 0
+
+        # Phần đuôi của WAL cũ phải bền vững trước snapshot (sau mọi lần ghi đang chạy vào file đó)
+        async with self._sync_lock:
+            await asyncio.to_thread(self._write, old_file, lines, True)
+        await asyncio.to_thread(self._write_snapshot, state)
+
+        # Snapshot đã bền vững - các WAL chỉ chứa thao tác <= seq không còn cần
+        for path in glob.glob(os.path.join(self.log_dir, WAL_PATTERN)):
+            if _wal_start(path) <= seq:
+                os.unlink(path)
+        self.stats["snapshots"] += 1
+
+    def _write_snapshot(self, state: Dict[str, Any]):
+        tmp_path = os.path.join(self.log_dir, SNAPSHOT_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.log_dir, SNAPSHOT_FILE))
+
+    async def close(self, build_state: Optional[Callable[[], Dict[str, Any]]] = None):
+        """Dừng fsync nền; nếu có build_state thì ghi snapshot cuối để lần khởi động sau nhanh hơn"""
+        if self._fsync_task is not None:
+            # Không hủy giữa chừng: lần ghi đang chạy trong thread phải xong trước khi đóng file
+            self._closing = True
+            self._wake.set()
+            await asyncio.gather(self._fsync_task, return_exceptions=True)
+            self._fsync_task = None
+        if self._snapshot_task is not None:
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+        if build_state is not None and self.ops_since_snapshot:
+            await self.snapshot(build_state)
+        if self._file is not None:
+            async with self._sync_lock:
+                await asyncio.to_thread(self._write, self._file, self._take_pending(), True)
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "log_dir": self.log_dir,
+            "seq": self.seq,
+            "ops_since_snapshot": self.ops_since_snapshot,
+            "pending_ops": len(self._pending),
+            **self.stats
+        }
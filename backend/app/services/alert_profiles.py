@@ -0,0 +1,150 @@
+import threading
+from typing import Dict, Any, List, Optional, Sequence
+import numpy as np
+
+DEFAULT_PROFILE = "default"
+
+
+class ProfileSnapshot:
+    """
+    Ảnh chụp bất biến của tất cả profile, đã biên dịch thành ma trận numpy:
+    thresholds[profile, sound_type] và enabled[profile, sound_type]
+    """
+
+    def __init__(self, sound_types: Sequence[str], profile_ids: Sequence[str],
+                 thresholds: np.ndarray, enabled: np.ndarray):
+        self.sound_types = tuple(sound_types)
+        self.type_index = {sound_type: i for i, sound_type in enumerate(self.sound_types)}
+        self.profile_ids = tuple(profile_ids)
+        self.rows = {profile_id: i for i, profile_id in enumerate(self.profile_ids)}
+        thresholds.setflags(write=False)
+        enabled.setflags(write=False)
+        self.thresholds = thresholds
+        self.enabled = enabled
+
+    def row(self, profile_id: Optional[str]) -> int:
+        # Device chưa có profile riêng dùng profile mặc định (hàng 0)
+        return self.rows.get(profile_id, 0)
+
+
+class AlertProfileStore:
+    """
+    Profile cảnh báo theo user / device.
+    Cập nhật theo kiểu copy-on-write: mỗi thay đổi tạo snapshot mới rồi thay tham chiếu,
+    nên việc đánh giá không bao giờ phải lấy lock.
+    """
+
+    def __init__(self, alert_settings: Dict[str, Dict[str, Any]]):
+        sound_types = list(alert_settings.keys())
+        thresholds = np.array([[alert_settings[t]["sensitivity"] for t in sound_types]], dtype=np.float32)
+        enabled = np.array([[alert_settings[t]["enabled"] for t in sound_types]], dtype=bool)
+        self._snapshot = ProfileSnapshot(sound_types, [DEFAULT_PROFILE], thresholds, enabled)
+        # Chỉ các writer cần tuần tự hóa với nhau
+        self._write_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> ProfileSnapshot:
+        return self._snapshot
+
+    def set_profile(self, profile_id: str, overrides: List[Dict[str, Any]]):
+        """
+        Tạo hoặc cập nhật profile. Sound type không có trong overrides lấy giá trị của profile mặc định
+        (với profile mới) hoặc giữ nguyên (với profile đã có).
+        """
+        with self._write_lock:
+            snap = self._snapshot
+            thresholds = snap.thresholds.copy()
+            enabled = snap.enabled.copy()
+            profile_ids = list(snap.profile_ids)
+
+            row = snap.rows.get(profile_id)
+            if row is None:
+                row = len(profile_ids)
+                profile_ids.append(profile_id)
+                thresholds = np.vstack([thresholds, thresholds[0]])
+                enabled = np.vstack([enabled, enabled[0]])
+
+            for override in overrides:
+                col = snap.type_index.get(override.get("sound_type"))
+                if col is None:
+                    continue
+                if "sensitivity" in override:
+                    thresholds[row, col] = override["sensitivity"]
+                if "enabled" in override:
+                    enabled[row, col] = override["enabled"]
+
+            self._snapshot = ProfileSnapshot(snap.sound_types, profile_ids, thresholds, enabled)
+
+    def delete_profile(self, profile_id: str) -> bool:
+        if profile_id == DEFAULT_PROFILE:
+            return False
+        with self._write_lock:
+            snap = self._snapshot
+            row = snap.rows.get(profile_id)
+            if row is None:
+                return False
+            keep = [i for i in range(len(snap.profile_ids)) if i != row]
+            self._snapshot = ProfileSnapshot(
+                snap.sound_types,
+                [snap.profile_ids[i] for i in keep],
+                snap.thresholds[keep],
+                snap.enabled[keep]
+            )
+            return True
+
+    def add_sound_type(self, sound_type: str, sensitivity: float, enabled: bool = True):
+        """Thêm một cột sound type mới cho tất cả profile"""
+        with self._write_lock:
+            snap = self._snapshot
+            if sound_type in snap.type_index:
+                return
+            rows = len(snap.profile_ids)
+            self._snapshot = ProfileSnapshot(
+                snap.sound_types + (sound_type,),
+                snap.profile_ids,
+                np.hstack([snap.thresholds, np.full((rows, 1), sensitivity, dtype=np.float32)]),
+                np.hstack([snap.enabled, np.full((rows, 1), enabled, dtype=bool)])
+            )
+
+    def get_profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        snap = self._snapshot
+        row = snap.rows.get(profile_id)
+        if row is None:
+            return None
+        return {
+            sound_type: {
+                "enabled": bool(snap.enabled[row, col]),
+                "sensitivity": round(float(snap.thresholds[row, col]), 4)
+            }
+            for col, sound_type in enumerate(snap.sound_types)
+        }
+
+    def get_setting(self, profile_id: Optional[str], sound_type: str) -> Optional[Dict[str, Any]]:
+        """Ngưỡng và trạng thái bật của một sound type cho một profile (None nếu sound type không tồn tại)"""
+        snap = self._snapshot
+        col = snap.type_index.get(sound_type)
+        if col is None:
+            return None
+        row = snap.row(profile_id)
+        return {
+            "enabled": bool(snap.enabled[row, col]),
+            "sensitivity": float(snap.thresholds[row, col])
+        }
+
+    def evaluate(self, profile_ids: Sequence[Optional[str]], scores: np.ndarray,
+                 margin: float = 0.0, snap: Optional[ProfileSnapshot] = None) -> np.ndarray:
+        """
+        Đánh giá một batch điểm số [N, số sound type] của N stream với profile tương ứng trong một phép toán.
+        Trả về mask [N, số sound type]: True nếu sound type được bật và điểm >= ngưỡng - margin.
+        """
+        snap = snap or self._snapshot
+        rows = np.fromiter((snap.row(profile_id) for profile_id in profile_ids), dtype=np.intp, count=len(profile_ids))
+        return (scores >= snap.thresholds[rows] - margin) & snap.enabled[rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            "profiles": len(snap.profile_ids),
+            "sound_types": list(snap.sound_types),
+            "matrix_bytes": int(snap.thresholds.nbytes + snap.enabled.nbytes)
+        }
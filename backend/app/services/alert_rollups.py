@@ -0,0 +1,153 @@
+import json
+import os
+import time
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+
+DAY_FORMAT = "%Y-%m-%d"
+MONTH_FORMAT = "%Y-%m"
+
+# Số bucket giữ lại: đủ cho 4 tuần / 6 tháng của API thống kê, có dư
+RETAIN_DAYS = 62
+RETAIN_MONTHS = 24
+
+
+class AlertRollups:
+    """
+    Bộ đếm alert cộng dồn theo ngày, tháng và loại âm thanh.
+    Cập nhật O(1) khi thêm / xóa alert, thống kê O(số bucket) thay vì quét toàn bộ lịch sử.
+
+    seq là số thứ tự (trong alert log) của thao tác mới nhất đã được đếm - được lưu kèm bộ đếm để
+    khi replay log, các thao tác đã có trong bộ đếm không bị đếm lại.
+    """
+
+    def __init__(self, path: Optional[str] = None, save_interval: float = 30.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.daily = {}
+        self.monthly = {}
+        self.by_type = {}
+        self.seq = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+        if path:
+            self.load()
+
+    def record(self, timestamp: datetime, sound_type: str, delta: int = 1, seq: Optional[int] = None):
+        """
+        Cộng (delta = 1) hoặc trừ (delta = -1) một alert vào các bucket tương ứng.
+        seq: số thứ tự trong log của thao tác được đếm (None khi không dùng log).
+        """
+        if seq is not None:
+            self.seq = seq
+        day = timestamp.strftime(DAY_FORMAT)
+        month = day[:7]
+
+        if delta > 0 and day not in self.daily:
+            self._prune(timestamp)
+
+        _bump(self.daily, day, delta)
+        _bump(self.monthly, month, delta)
+        _bump(self.by_type, sound_type, delta)
+
+        self._dirty = True
+        self.maybe_save()
+
+    def _prune(self, now: datetime):
+        oldest_day = (now - timedelta(days=RETAIN_DAYS)).strftime(DAY_FORMAT)
+        for day in [d for d in self.daily if d < oldest_day]:
+            del self.daily[day]
+
+        if len(self.monthly) > RETAIN_MONTHS:
+            for month in sorted(self.monthly)[:-RETAIN_MONTHS]:
+                del self.monthly[month]
+
+    def report(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Thống kê theo định dạng của /api/alerts/statistics
+        """
+        now = now or datetime.now()
+
+        # Daily stats (last 7 days)
+        daily_stats = {}
+        for i in range(7):
+            date = (now - timedelta(days=i)).strftime(DAY_FORMAT)
+            daily_stats[date] = self.daily.get(date, 0)
+
+        # Weekly stats (last 4 weeks) - cửa sổ 7 ngày trượt, cộng từ các bucket ngày
+        weekly_stats = {}
+        for i in range(4):
+            weekly_stats[f"Week {i+1}"] = sum(
+                self.daily.get((now - timedelta(days=7 * i + d)).strftime(DAY_FORMAT), 0)
+                for d in range(7)
+            )
+
+        # Monthly stats (last 6 months)
+        monthly_stats = {}
+        for i in range(6):
+            month = (now - timedelta(days=30*i)).strftime(MONTH_FORMAT)
+            monthly_stats[month] = self.monthly.get(month, 0)
+
+        common_types = sorted(self.by_type.items(), key=lambda x: x[1], reverse=True)
+
+        return {
+            "daily": daily_stats,
+            "weekly": weekly_stats,
+            "monthly": monthly_stats,
+            "common_types": common_types[:5]  # Top 5
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Bản sao - snapshot có thể được ghi ra file trong thread khác trong khi bộ đếm vẫn thay đổi
+        return {
+            "daily": dict(self.daily),
+            "monthly": dict(self.monthly),
+            "by_type": dict(self.by_type),
+            "seq": self.seq
+        }
+
+    def restore(self, data: Dict[str, Any], seq: Optional[int] = None):
+        self.daily = dict(data.get("daily", {}))
+        self.monthly = dict(data.get("monthly", {}))
+        self.by_type = dict(data.get("by_type", {}))
+        self.seq = data.get("seq", 0) if seq is None else seq
+
+    def load(self):
+        """Đọc bộ đếm đã lưu (nếu có)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.restore(json.load(f))
+        except Exception as e:
+            print(f"Error loading alert rollups: {e}")
+
+    def save(self):
+        """Ghi bộ đếm ra file (ghi file tạm rồi rename để không bao giờ để lại file hỏng)"""
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except Exception as e:
+            print(f"Error saving alert rollups: {e}")
+
+    def maybe_save(self):
+        if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+
+def _bump(counters: Dict[str, int], key: str, delta: int):
+    value = counters.get(key, 0) + delta
+    if value > 0:
+        counters[key] = value
+    else:
+        counters.pop(key, None)
@@ -1,14 +1,121 @@
 import asyncio
 import json
+import time
+from collections import deque
+import numpy as np
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.core.config import settings
+from app.core.metrics import REGISTRY, FAST_LATENCY_BUCKETS
+from app.services.alert_rollups import AlertRollups
+from app.services.alert_dispatcher import AlertDispatcher, email_channel
+from app.services.alert_debouncer import AlertDebouncer, EVENT_OPEN, EVENT_MERGED, EVENT_CLOSED
+from app.services.alert_profiles import AlertProfileStore, DEFAULT_PROFILE
+from app.services.alert_bus import create_alert_bus
+from app.services.alert_log import AlertLog
+
+TRIGGER_SECONDS = REGISTRY.histogram("alert_trigger_seconds", "Thời gian xử lý một phát hiện âm thanh",
+                                     buckets=FAST_LATENCY_BUCKETS)
+DETECTIONS = {
+    outcome: REGISTRY.counter("alert_detections_total", "Số phát hiện âm thanh theo kết quả xử lý", {"outcome": outcome})
+    for outcome in ("opened", "merged", "closed", "ignored", "disabled", "unknown")
+}
 
 class AlertService:
     def __init__(self):
         self.alert_settings = {}
-        self.alert_history = []
+        # Ring buffer giới hạn kích thước, cũ nhất ở đầu
+        self.alert_history = deque(maxlen=settings.alert_history_max_size)
+        # sound_type -> deque các alert cùng loại (cùng thứ tự với alert_history)
+        self._history_by_type = {}
+        # id -> alert còn hiệu lực; alert đã xóa chỉ bị gỡ khỏi index và được bỏ qua khi đọc
+        self._alerts_by_id = {}
+        self._next_alert_id = 1
+        # Seq của thao tác log đang được replay (None: thao tác mới, sẽ nhận seq kế tiếp của log)
+        self._replay_seq = None
+        # Bộ đếm thống kê cộng dồn, cập nhật cùng lúc với lịch sử
+        self.rollups = AlertRollups(settings.alert_rollups_path, settings.alert_rollups_save_interval_seconds)
+        # Kênh Socket.IO được đăng ký trong main.py, nơi có server sio
+        self.dispatcher = AlertDispatcher()
+        self.dispatcher.register_channel(
+            "email", email_channel,
+            workers=settings.alert_email_workers, max_queue=settings.alert_dispatch_max_queue
+        )
+        # Gộp các phát hiện lặp lại của cùng một sự kiện (cooldown + hysteresis)
+        self.debouncer = AlertDebouncer(on_close=self._finalize_event)
         self._load_default_settings()
+        # Ngưỡng / bật-tắt theo từng user hoặc device, biên dịch thành ma trận numpy
+        self.profiles = AlertProfileStore(self.alert_settings)
+        # Chia sẻ lịch sử với các worker khác (None khi chỉ chạy một worker)
+        self.bus = create_alert_bus()
+        # Id phải duy nhất giữa các worker khi dùng chung lịch sử
+        self._id_prefix = f"alert_{self.bus.worker_id[:8]}_" if self.bus else "alert_"
+        # Write-ahead log: khôi phục lịch sử và thống kê sau khi khởi động lại
+        self.log = AlertLog() if settings.alert_log_dir else None
+        if self.log is not None:
+            self._recover()
+        
+        REGISTRY.gauge("alert_history_size", "Số alert đang giữ trong ring buffer",
+                       function=lambda: len(self._alerts_by_id))
+        if self.bus is not None:
+            REGISTRY.gauge("alert_bus_pending_ops", "Số thay đổi lịch sử chờ publish sang worker khác",
+                           function=lambda: self.bus.pending_ops)
+    
+    async def start(self):
+        """Khởi động các thành phần nền (đăng ký nhận thay đổi từ worker khác, fsync log định kỳ)"""
+        if self.log is not None:
+            await self.log.start()
+        if self.bus is not None:
+            await self.bus.start(self._apply_remote)
+    
+    async def close(self):
+        """Gửi nốt các thay đổi chưa publish, dừng worker phân phối và lưu bộ đếm"""
+        if self.bus is not None:
+            await self.bus.close()
+        await self.dispatcher.stop()
+        if self.log is not None:
+            await self.log.close(self._snapshot_state)
+        self.rollups.save()
+    
+    def _recover(self):
+        """Dựng lại lịch sử, các index và bộ đếm từ snapshot mới nhất cộng phần đuôi của log"""
+        snapshot, ops = self.log.recover()
+        
+        if snapshot is not None:
+            self._next_alert_id = snapshot["next_alert_id"]
+            for data in snapshot["alerts"]:
+                self._append_history(self._deserialize_alert(data), count=False)
+            # File rollups (alert_rollups_path) có thể mới hơn snapshot - giữ nguồn mới hơn
+            if snapshot["seq"] >= self.rollups.seq:
+                self.rollups.restore(snapshot["rollups"], seq=snapshot["seq"])
+        
+        # Thao tác có seq <= rollups.seq đã nằm trong bộ đếm được nạp, chỉ dựng lại lịch sử
+        for op in ops:
+            self._replay_seq = op["seq"]
+            try:
+                self._apply_op(op)
+            finally:
+                self._replay_seq = None
+            if op["op"] == "add" and op["alert"]["id"].startswith(self._id_prefix):
+                suffix = op["alert"]["id"][len(self._id_prefix):]
+                if suffix.isdigit():
+                    self._next_alert_id = max(self._next_alert_id, int(suffix) + 1)
+        
+        if self.rollups.seq > self.log.seq:
+            # Bộ đếm được lưu với một log khác (thư mục log bị xóa / đổi) - seq của log này bắt đầu lại
+            self.rollups.seq = self.log.seq
+        
+        if snapshot is not None or ops:
+            print(f"✅ Recovered {len(self._alerts_by_id)} alerts "
+                  f"({len(ops)} log ops) in {self.log.stats['recovery_ms']} ms")
+    
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """Trạng thái gọn để ghi snapshot: các alert còn hiệu lực (theo thứ tự) và bộ đếm"""
+        return {
+            "next_alert_id": self._next_alert_id,
+            "alerts": [self._serialize_alert(alert) for alert in self.alert_history if self._is_live(alert)],
+            "rollups": self.rollups.to_dict()
+        }
     
     def _load_default_settings(self):
         """Tải cài đặt mặc định cho các loại cảnh báo"""
@@ -39,6 +146,27 @@ class AlertService:
             }
         }
     
+    def register_sound_type(self, sound_type: str, sensitivity: float, priority: str = "medium",
+                            notification_method: Optional[List[str]] = None):
+        """
+        Thêm sound type ngoài danh sách mặc định (ví dụ custom sound do người dùng đăng ký)
+        """
+        if sound_type in self.alert_settings:
+            return
+        self.alert_settings[sound_type] = {
+            "enabled": True,
+            "sensitivity": sensitivity,
+            "notification_method": notification_method or ["visual"],
+            "priority": priority
+        }
+        self.profiles.add_sound_type(sound_type, sensitivity)
+    
+    def unregister_sound_type(self, sound_type: str) -> bool:
+        """
+        Bỏ sound type; phát hiện sau đó bị coi là "Unknown sound type" (cột trong profile và lịch sử được giữ)
+        """
+        return self.alert_settings.pop(sound_type, None) is not None
+    
     async def configure_alerts(self, settings: List[Dict]) -> Dict[str, Any]:
         """
         Cấu hình cài đặt cảnh báo
@@ -53,6 +181,12 @@ class AlertService:
                         "notification_method": setting.get("notification_method", ["visual"])
                     })
             
+            # Profile mặc định luôn khớp với cài đặt chung
+            self.profiles.set_profile(DEFAULT_PROFILE, [
+                {"sound_type": sound_type, "enabled": setting["enabled"], "sensitivity": setting["sensitivity"]}
+                for sound_type, setting in self.alert_settings.items()
+            ])
+            
             return {"success": True, "updated_settings": len(settings)}
             
         except Exception as e:
@@ -64,65 +198,287 @@ class AlertService:
         """
         return self.alert_settings
     
-    async def trigger_alert(self, sound_type: str, confidence: float, location: Optional[str] = None) -> Dict[str, Any]:
+    async def trigger_alert(self, sound_type: str, confidence: float, location: Optional[str] = None,
+                            detected_at: Optional[float] = None, device_id: Optional[str] = None) -> Dict[str, Any]:
         """
-        Kích hoạt cảnh báo cho âm thanh được phát hiện
+        Kích hoạt cảnh báo cho âm thanh được phát hiện.
+        detected_at (time.time()) là thời điểm phát hiện, dùng để đo độ trễ tới lúc thông báo được gửi.
+        Các phát hiện liên tiếp của cùng (device_id, sound_type) được gộp vào một alert duy nhất.
         """
+        started = time.perf_counter()
         try:
             if sound_type not in self.alert_settings:
+                DETECTIONS["unknown"].inc()
                 return {"triggered": False, "reason": "Unknown sound type"}
             
             setting = self.alert_settings[sound_type]
+            # Profile của device (hoặc profile mặc định) quyết định bật/tắt và ngưỡng
+            profile_setting = self.profiles.get_setting(device_id, sound_type)
             
-            if not setting["enabled"]:
+            if not profile_setting["enabled"]:
+                DETECTIONS["disabled"].inc()
                 return {"triggered": False, "reason": "Alert disabled"}
             
-            if confidence < setting["sensitivity"]:
+            event_key = (device_id or location or "default", sound_type)
+            outcome, event = self.debouncer.observe(event_key, confidence, profile_setting["sensitivity"])
+            
+            if outcome == EVENT_MERGED:
+                alert_record = event["alert"]
+                alert_record["end_time"] = datetime.now()
+                alert_record["peak_confidence"] = max(alert_record["peak_confidence"], confidence)
+                alert_record["detections"] += 1
+                self._record_update(alert_record)
+                DETECTIONS["merged"].inc()
+                return {
+                    "triggered": False,
+                    "reason": "Merged into active event",
+                    "alert_id": alert_record["id"]
+                }
+            
+            if outcome == EVENT_CLOSED:
+                DETECTIONS["closed"].inc()
+                return {
+                    "triggered": False,
+                    "reason": "Event ended",
+                    "alert_id": event["alert"]["id"]
+                }
+            
+            if outcome != EVENT_OPEN:
+                DETECTIONS["ignored"].inc()
                 return {"triggered": False, "reason": "Below sensitivity threshold"}
             
             # Tạo alert record
+            now = datetime.now()
             alert_record = {
-                "id": f"alert_{len(self.alert_history) + 1}",
+                "id": f"{self._id_prefix}{self._next_alert_id}",
                 "sound_type": sound_type,
                 "confidence": confidence,
-                "timestamp": datetime.now(),
+                "timestamp": now,
+                "end_time": now,
+                "peak_confidence": confidence,
+                "detections": 1,
                 "location": location,
+                "device_id": device_id,
                 "priority": setting["priority"],
                 "notification_method": setting["notification_method"]
             }
+            event["alert"] = alert_record
             
             # Lưu vào lịch sử
-            self.alert_history.append(alert_record)
+            self._next_alert_id += 1
+            self._append_history(alert_record)
+            self._record_op(
+                {"op": "add", "alert": self._serialize_alert(alert_record)},
+                urgent=alert_record["priority"] == "critical"
+            )
+            
+            # Đưa vào hàng đợi phân phối, không chờ gửi xong
+            channels = self.dispatcher.dispatch(alert_record, detected_at)
+            DETECTIONS["opened"].inc()
             
             return {
                 "triggered": True,
                 "alert_id": alert_record["id"],
                 "priority": setting["priority"],
-                "notification_method": setting["notification_method"]
+                "notification_method": setting["notification_method"],
+                "dispatched_channels": channels
             }
             
         except Exception as e:
             raise Exception(f"Lỗi kích hoạt cảnh báo: {str(e)}")
+        finally:
+            TRIGGER_SECONDS.observe(time.perf_counter() - started)
     
-    async def get_alert_history(self, limit: int = 50, sound_type: Optional[str] = None) -> List[Dict]:
+    async def evaluate_batch(self, device_ids: List[Optional[str]], scores: np.ndarray,
+                             sound_types: Optional[List[str]] = None,
+                             detected_at: Optional[float] = None) -> Dict[str, Any]:
         """
-        Lấy lịch sử cảnh báo
+        Đánh giá điểm số của nhiều stream cùng lúc với profile của từng device.
+        scores có dạng [số stream, số sound type]; sound_types là thứ tự cột (mặc định theo profile store).
+        Chỉ các ô vượt ngưỡng tắt (ngưỡng - hysteresis) hoặc thuộc sự kiện đang diễn ra mới đi qua
+        trigger_alert (điểm thấp kết thúc sự kiện), phần còn lại bị loại trong một phép so sánh vector hóa.
+        Payload sai kích thước gây ValueError.
         """
         try:
-            history = self.alert_history.copy()
+            snap = self.profiles.snapshot
+            scores = np.asarray(scores, dtype=np.float32)
+            columns = len(sound_types) if sound_types is not None else len(snap.sound_types)
+            if scores.ndim != 2 or scores.shape != (len(device_ids), columns):
+                raise ValueError(
+                    f"scores phải có dạng [{len(device_ids)}, {columns}] (số device_ids x số sound_types), "
+                    f"nhận được {list(scores.shape)}"
+                )
             
-            # Filter by sound type if specified
-            if sound_type:
-                history = [alert for alert in history if alert["sound_type"] == sound_type]
+            if sound_types is not None and tuple(sound_types) != snap.sound_types:
+                # Sắp lại cột theo thứ tự của snapshot, sound type không biết thì bỏ qua
+                aligned = np.full((scores.shape[0], len(snap.sound_types)), -np.inf, dtype=np.float32)
+                for col, sound_type in enumerate(sound_types):
+                    target = snap.type_index.get(sound_type)
+                    if target is not None:
+                        aligned[:, target] = scores[:, col]
+                scores = aligned
             
-            # Sort by timestamp (newest first)
-            history.sort(key=lambda x: x["timestamp"], reverse=True)
+            mask = self.profiles.evaluate(device_ids, scores, margin=settings.alert_hysteresis, snap=snap)
+            # Sự kiện đang diễn ra nhận cả điểm dưới ngưỡng tắt để debouncer kết thúc chúng ngay
+            # (cột không có trong payload - điểm -inf - không được coi là bằng chứng)
+            active = self.debouncer.active_by_device()
+            if active:
+                for stream, device_id in enumerate(device_ids):
+                    for sound_type in active.get(device_id or "default", ()):
+                        col = snap.type_index.get(sound_type)
+                        if col is not None and np.isfinite(scores[stream, col]):
+                            mask[stream, col] = True
+            candidates = np.argwhere(mask)
             
-            # Convert datetime to string for JSON serialization
-            for alert in history[:limit]:
-                alert["timestamp"] = alert["timestamp"].isoformat()
+            alerts = []
+            for stream, col in candidates:
+                result = await self.trigger_alert(
+                    snap.sound_types[col], float(scores[stream, col]),
+                    detected_at=detected_at, device_id=device_ids[stream]
+                )
+                if result["triggered"]:
+                    alerts.append({"device_id": device_ids[stream], **result})
             
-            return history[:limit]
+            return {
+                "streams": len(device_ids),
+                "candidates": len(candidates),
+                "triggered": len(alerts),
+                "alerts": alerts
+            }
+            
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Lỗi đánh giá batch: {str(e)}")
+    
+    def _append_history(self, alert_record: Dict[str, Any], count: bool = True):
+        """
+        Thêm alert vào ring buffer và các index, đẩy alert cũ nhất ra nếu đầy.
+        count=False khi nạp từ snapshot (bộ đếm đã có trong snapshot).
+        """
+        if len(self.alert_history) == self.alert_history.maxlen:
+            evicted = self.alert_history[0]
+            self._history_by_type[evicted["sound_type"]].popleft()
+            if self._alerts_by_id.get(evicted["id"]) is evicted:
+                del self._alerts_by_id[evicted["id"]]
+        
+        self.alert_history.append(alert_record)
+        type_history = self._history_by_type.get(alert_record["sound_type"])
+        if type_history is None:
+            type_history = self._history_by_type[alert_record["sound_type"]] = deque()
+        type_history.append(alert_record)
+        self._alerts_by_id[alert_record["id"]] = alert_record
+        if count:
+            self._count(alert_record, 1)
+    
+    def _count(self, alert: Dict[str, Any], delta: int):
+        """Cập nhật bộ đếm thống kê, ghi kèm seq log của thao tác để replay không đếm lại"""
+        if self.log is None:
+            self.rollups.record(alert["timestamp"], alert["sound_type"], delta)
+            return
+        # Thao tác mới luôn được ghi vào log ngay sau khi áp dụng, với seq kế tiếp
+        seq = self._replay_seq if self._replay_seq is not None else self.log.seq + 1
+        if seq <= self.rollups.seq:
+            return
+        self.rollups.record(alert["timestamp"], alert["sound_type"], delta, seq=seq)
+    
+    def _record_update(self, alert: Dict[str, Any]):
+        self._record_op({
+            "op": "update",
+            "id": alert["id"],
+            "end_time": alert["end_time"].isoformat(),
+            "peak_confidence": alert["peak_confidence"],
+            "detections": alert["detections"]
+        })
+    
+    def _finalize_event(self, event: Dict[str, Any], closed_at: float):
+        """Sự kiện kết thúc (điểm thấp hoặc im lặng quá alert_event_gap_seconds): chốt end_time của alert"""
+        alert = event["alert"]
+        if not self._is_live(alert):
+            return
+        end_time = datetime.fromtimestamp(time.time() - (time.monotonic() - closed_at))
+        if end_time > alert["end_time"]:
+            alert["end_time"] = end_time
+        self._record_update(alert)
+    
+    def _record_op(self, op: Dict[str, Any], urgent: bool = False):
+        """Ghi thao tác vào log (nếu bật) và chia sẻ với worker khác (nếu có bus)"""
+        if self.log is not None:
+            self.log.append(op, urgent)
+            self._maybe_snapshot()
+        if self.bus is not None:
+            self.bus.queue_write(op)
+    
+    def _maybe_snapshot(self):
+        if self.log.needs_snapshot():
+            try:
+                self.log.schedule_snapshot(self._snapshot_state)
+            except RuntimeError:
+                # Không có event loop đang chạy (ví dụ khi dùng từ CLI) - để lần sau
+                pass
+    
+    async def _apply_remote(self, message: Dict[str, Any]):
+        """
+        Áp dụng batch thay đổi lịch sử từ worker khác (không phân phối lại thông báo - worker gốc đã làm)
+        """
+        for op in message.get("ops", []):
+            self._apply_op(op)
+            if self.log is not None:
+                self.log.append(op)
+        if self.log is not None:
+            self._maybe_snapshot()
+    
+    def _apply_op(self, op: Dict[str, Any]):
+        """Áp dụng một thao tác lịch sử (từ worker khác hoặc khi replay log)"""
+        if op["op"] == "add":
+            alert = self._deserialize_alert(op["alert"])
+            if alert["id"] not in self._alerts_by_id:
+                self._append_history(alert)
+        elif op["op"] == "update":
+            alert = self._alerts_by_id.get(op["id"])
+            if alert is not None:
+                alert["end_time"] = datetime.fromisoformat(op["end_time"])
+                alert["peak_confidence"] = op["peak_confidence"]
+                alert["detections"] = op["detections"]
+        elif op["op"] == "delete":
+            self._remove_alert(op["id"])
+    
+    @staticmethod
+    def _deserialize_alert(data: Dict[str, Any]) -> Dict[str, Any]:
+        alert = dict(data)
+        alert["timestamp"] = datetime.fromisoformat(data["timestamp"])
+        alert["end_time"] = datetime.fromisoformat(data["end_time"])
+        return alert
+    
+    def _is_live(self, alert: Dict[str, Any]) -> bool:
+        return self._alerts_by_id.get(alert["id"]) is alert
+    
+    @staticmethod
+    def _serialize_alert(alert: Dict[str, Any]) -> Dict[str, Any]:
+        """Bản sao của alert để trả về API - không bao giờ sửa bản ghi gốc"""
+        alert_copy = dict(alert)
+        alert_copy["timestamp"] = alert["timestamp"].isoformat()
+        alert_copy["end_time"] = alert["end_time"].isoformat()
+        return alert_copy
+    
+    async def get_alert_history(self, limit: int = 50, sound_type: Optional[str] = None) -> List[Dict]:
+        """
+        Lấy lịch sử cảnh báo (mới nhất trước)
+        """
+        try:
+            if sound_type:
+                source = self._history_by_type.get(sound_type, ())
+            else:
+                source = self.alert_history
+            
+            history = []
+            for alert in reversed(source):
+                if len(history) >= limit:
+                    break
+                if self._is_live(alert):
+                    history.append(self._serialize_alert(alert))
+            
+            return history
             
         except Exception as e:
             raise Exception(f"Lỗi lấy lịch sử cảnh báo: {str(e)}")
@@ -132,25 +488,33 @@ class AlertService:
         Xóa một cảnh báo khỏi lịch sử
         """
         try:
-            for i, alert in enumerate(self.alert_history):
-                if alert["id"] == alert_id:
-                    del self.alert_history[i]
-                    return True
-            return False
+            if not self._remove_alert(alert_id):
+                return False
+            self._record_op({"op": "delete", "id": alert_id})
+            return True
             
         except Exception as e:
             raise Exception(f"Lỗi xóa cảnh báo: {str(e)}")
     
+    def _remove_alert(self, alert_id: str) -> bool:
+        alert = self._alerts_by_id.pop(alert_id, None)
+        if alert is None:
+            return False
+        self._count(alert, -1)
+        return True
+    
     async def test_alert_system(self) -> Dict[str, Any]:
         """
         Test hệ thống cảnh báo
         """
         try:
             tested_components = []
+            # Device riêng cho mỗi lần test để không bị gộp vào sự kiện của lần test trước
+            test_device = f"test_{self._next_alert_id}"
             
             # Test each alert type
             for sound_type in self.alert_settings.keys():
-                test_result = await self.trigger_alert(sound_type, 0.9, "Test Location")
+                test_result = await self.trigger_alert(sound_type, 0.9, "Test Location", device_id=test_device)
                 tested_components.append({
                     "component": sound_type,
                     "status": "success" if test_result["triggered"] else "failed",
@@ -171,51 +535,7 @@ class AlertService:
         Thống kê cảnh báo theo thời gian
         """
         try:
-            now = datetime.now()
-            
-            # Daily stats (last 7 days)
-            daily_stats = {}
-            for i in range(7):
-                date = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-                daily_stats[date] = len([
-                    alert for alert in self.alert_history
-                    if alert["timestamp"].strftime("%Y-%m-%d") == date
-                ])
-            
-            # Weekly stats (last 4 weeks)
-            weekly_stats = {}
-            for i in range(4):
-                week_start = now - timedelta(weeks=i)
-                week_key = f"Week {i+1}"
-                weekly_stats[week_key] = len([
-                    alert for alert in self.alert_history
-                    if alert["timestamp"] >= week_start - timedelta(days=7) and
-                       alert["timestamp"] < week_start
-                ])
-            
-            # Monthly stats (last 6 months)
-            monthly_stats = {}
-            for i in range(6):
-                month = (now - timedelta(days=30*i)).strftime("%Y-%m")
-                monthly_stats[month] = len([
-                    alert for alert in self.alert_history
-                    if alert["timestamp"].strftime("%Y-%m") == month
-                ])
-            
-            # Most common alert types
-            sound_counts = {}
-            for alert in self.alert_history:
-                sound_type = alert["sound_type"]
-                sound_counts[sound_type] = sound_counts.get(sound_type, 0) + 1
-            
-            common_types = sorted(sound_counts.items(), key=lambda x: x[1], reverse=True)
-            
-            return {
-                "daily": daily_stats,
-                "weekly": weekly_stats,
-                "monthly": monthly_stats,
-                "common_types": common_types[:5]  # Top 5
-            }
+            return self.rollups.report()
             
         except Exception as e:
-            raise Exception(f"Lỗi lấy thống kê: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Lỗi lấy thống kê: {str(e)}")
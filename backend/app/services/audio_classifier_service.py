@@ -1,26 +1,70 @@
 import asyncio
+import os
 import numpy as np
-import tensorflow as tf
-import tensorflow_hub as hub
-import librosa
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, check_deadline, run_before_deadline
+from app.core.fair_scheduler import audio_cost, current_work, inference_scheduler
+from app.core.metrics import REGISTRY
+from app.services.custom_sounds import EMBEDDING_DIM
+from app.services.yamnet_ontology import OntologyIndex, load_ontology
+
+AUDIO_DECODE_SECONDS = REGISTRY.histogram("audio_decode_seconds", "Thời gian đọc / giải mã audio", {"service": "classifier"})
+INFERENCE_SECONDS = {
+    method: REGISTRY.histogram("classifier_inference_seconds", "Thời gian suy luận YAMNet", {"method": method})
+    for method in ("file", "stream", "critical", "embed")
+}
+# Cửa sổ / bước của YAMNet (0.96s / 0.48s ở 16kHz)
+EMBED_WINDOW = 15360
+EMBED_HOP = 7680
+
+# Loại âm thanh cần cảnh báo -> các node trong ontology; điểm của loại = điểm cao nhất của mọi class
+# thuộc các node đó (kể cả class con, ví dụ "Doorbell" gồm "Ding-dong")
+CRITICAL_SOUND_CLASSES = {
+    "fire_alarm": ["Smoke detector, smoke alarm", "Fire alarm"],
+    "doorbell": ["Doorbell", "Knock"],
+    "baby_cry": ["Baby cry, infant cry", "Child speech, kid speaking"],
+    "phone_ring": ["Telephone bell ringing", "Ringtone"],
+}
 
 class AudioClassifierService:
-    def __init__(self):
+    def __init__(self, executor=None, custom_sounds=None):
         self.model = None
         self.class_names = None
+        self.ontology = None
+        # InferenceExecutor: suy luận chạy trong thread pool có ngân sách CPU riêng (None = chạy trực tiếp)
+        self.executor = executor
+        # CustomSoundStore: custom sound của từng tenant, so khớp cùng lúc với phát hiện âm thanh nguy hiểm
+        self.custom_sounds = custom_sounds
+        # Mock embedding: phép chiếu cố định từ năng lượng 64 dải tần lên 1024 chiều
+        self._mock_projection = np.random.default_rng(0).standard_normal((64, EMBEDDING_DIM)).astype(np.float32)
         self._load_model()
     
     def _load_model(self):
         """Tải YAMNet model từ TensorFlow Hub"""
         try:
-            # TODO: Load YAMNet model
+            # TODO: Load YAMNet model (import tensorflow / tensorflow_hub tại đây, không ở đầu module)
+            # import tensorflow as tf
+            # if self.executor is not None:
+            #     self.executor.configure_tensorflow(tf)  # ngân sách intra/inter-op trước lần chạy đầu
+            # import tensorflow_hub as hub
             # self.model = hub.load(settings.yamnet_model_url)
             print("YAMNet model loaded (mock)")
             
             # Mock class names - YAMNet có 521 classes
+            # (model thật: class map ở self.model.class_map_path().numpy())
             self.class_names = self._get_yamnet_class_names()
+            self.ontology = load_ontology(self.class_names, settings.yamnet_class_map_path,
+                                          settings.audioset_ontology_path)
+            self.class_names = self.ontology.class_names
+            
+            # Điểm của các loại cảnh báo và nhóm rộng được tính cùng một lần trên output của model
+            critical_keys, critical_matrix = self.ontology.group_matrix(CRITICAL_SOUND_CLASSES)
+            category_keys = [name for name in settings.yamnet_rollup_categories if self.ontology.resolve(name)]
+            _, category_matrix = self.ontology.group_matrix({name: [name] for name in category_keys})
+            self._critical_keys = critical_keys
+            self._category_keys = category_keys
+            self._rollup_matrix = np.vstack([critical_matrix, category_matrix])
             
         except Exception as e:
             print(f"Error loading YAMNet model: {e}")
@@ -117,6 +161,8 @@ class AudioClassifierService:
             "Vacuum cleaner", "Zipper (clothing)", "Keys jangling", "Coin (dropping)",
             "Scissors", "Electric shaver, electric razor", "Shuffling cards",
             "Typing", "Typewriter", "Computer keyboard", "Writing", "Alarm",
+            "Telephone", "Telephone bell ringing", "Ringtone", "Telephone dialing, DTMF",
+            "Dial tone", "Busy signal",
             "Smoke detector, smoke alarm", "Fire alarm", "Foghorn", "Buzzer",
             "Smoke detector beep", "Alarm clock", "Siren", "Civil defense siren",
             "Screaming siren", "Air raid siren", "Reverb", "Echo", "Noise",
@@ -125,22 +171,98 @@ class AudioClassifierService:
             "Television", "Radio", "Field recording", "Dental drill", "Jackhammer"
         ]
     
+    async def _run_inference(self, method: str, predict, audio):
+        """
+        Chạy hàm suy luận trong inference executor để không tranh CPU với event loop
+        """
+        check_deadline("inference")
+        with INFERENCE_SECONDS[method].time():
+            if self.executor is None:
+                return predict(audio)
+            return await run_before_deadline("inference", self.executor.run(predict, audio))
+    
+    def _predict_file(self, audio_data: np.ndarray) -> List[Dict[str, Any]]:
+        # TODO: scores, embeddings, spectrogram = self.model(audio_data)
+        # Mock classification results
+        return [
+            {"class": "Speech", "confidence": 0.85},
+            {"class": "Conversation", "confidence": 0.72},
+            {"class": "Male singing", "confidence": 0.45},
+            {"class": "Music", "confidence": 0.38},
+            {"class": "Background noise", "confidence": 0.22}
+        ]
+    
+    def _predict_stream(self, audio_chunk: bytes) -> Dict[str, Any]:
+        # Mock real-time classification
+        return {
+            "class": "Speech",
+            "confidence": 0.82,
+            "timestamp": "real-time"
+        }
+    
+    def _predict_critical(self, audio_chunk: bytes) -> np.ndarray:
+        # TODO: scores = self.model(waveform)[0].numpy().mean(axis=0)  # [số class]
+        # Mock critical sound detection: output của model với điểm cố định cho vài class
+        scores = np.zeros(self.ontology.num_classes, dtype=np.float32)
+        for name, score in (("Fire alarm", 0.05), ("Doorbell", 0.15), ("Baby cry, infant cry", 0.08),
+                            ("Telephone bell ringing", 0.12)):
+            node_id = self.ontology.resolve(name)
+            if node_id is not None and self.ontology.nodes[node_id]["index"] is not None:
+                scores[self.ontology.nodes[node_id]["index"]] = score
+        # Rollup chạy trong worker cùng với suy luận: một phép tính cho mọi loại cảnh báo và nhóm
+        return OntologyIndex.apply(self._rollup_matrix, scores)
+    
+    def _predict_embeddings(self, waveform: np.ndarray) -> np.ndarray:
+        """Embedding YAMNet của các frame: [số frame, 1024]"""
+        # TODO: _, embeddings, _ = self.model(waveform); return embeddings.numpy()
+        # Mock: phổ năng lượng theo dải của từng frame chiếu lên 1024 chiều - âm thanh giống nhau
+        # cho embedding gần nhau, đủ để thử đăng ký / so khớp custom sound
+        waveform = np.asarray(waveform, dtype=np.float32)
+        if len(waveform) < EMBED_WINDOW:
+            waveform = np.pad(waveform, (0, EMBED_WINDOW - len(waveform)))
+        frames = np.lib.stride_tricks.sliding_window_view(waveform, EMBED_WINDOW)[::EMBED_HOP]
+        spectrum = np.abs(np.fft.rfft(frames * np.hanning(EMBED_WINDOW), axis=1))
+        bands = np.log1p(np.add.reduceat(spectrum, np.linspace(0, spectrum.shape[1], 65)[:-1].astype(int), axis=1))
+        bands -= bands.mean(axis=1, keepdims=True)
+        return bands.astype(np.float32) @ self._mock_projection
+    
+    @staticmethod
+    def _pcm16_to_float(audio_chunk: bytes) -> np.ndarray:
+        return np.frombuffer(audio_chunk[:len(audio_chunk) & ~1], dtype="<i2").astype(np.float32) / 32768.0
+    
+    async def embed_audio_file(self, file_path: str) -> np.ndarray:
+        """
+        Embedding YAMNet của các frame trong file (dùng khi đăng ký custom sound)
+        """
+        try:
+            import librosa
+            
+            async with inference_scheduler.slot(audio_cost(os.path.getsize(file_path))):
+                check_deadline("decode")
+                with AUDIO_DECODE_SECONDS.time():
+                    audio_data, _ = await asyncio.to_thread(librosa.load, file_path, sr=16000)
+                return await self._run_inference("embed", self._predict_embeddings, audio_data)
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            raise Exception(f"Lỗi tính embedding: {str(e)}")
+    
     async def classify_audio_file(self, file_path: str, top_k: int = 5) -> Dict[str, Any]:
         """
         Phân loại âm thanh từ file
         """
         try:
-            # Đọc và xử lý file âm thanh
-            audio_data, sample_rate = librosa.load(file_path, sr=16000)
+            import librosa
             
-            # Mock classification results
-            mock_results = [
-                {"class": "Speech", "confidence": 0.85},
-                {"class": "Conversation", "confidence": 0.72},
-                {"class": "Male singing", "confidence": 0.45},
-                {"class": "Music", "confidence": 0.38},
-                {"class": "Background noise", "confidence": 0.22}
-            ]
+            # Chờ slot inference theo lịch công bằng giữa các tenant; phần nặng chạy trong thread
+            async with inference_scheduler.slot(audio_cost(os.path.getsize(file_path))):
+                # Đọc và xử lý file âm thanh
+                check_deadline("decode")
+                with AUDIO_DECODE_SECONDS.time():
+                    audio_data, sample_rate = await asyncio.to_thread(librosa.load, file_path, sr=16000)
+                
+                mock_results = await self._run_inference("file", self._predict_file, audio_data)
             
             return {
                 "classifications": mock_results[:top_k],
@@ -148,6 +270,8 @@ class AudioClassifierService:
                 "processing_time": 0.15
             }
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi phân loại âm thanh: {str(e)}")
     
@@ -156,12 +280,10 @@ class AudioClassifierService:
         Phân loại âm thanh real-time từ stream
         """
         try:
-            # Mock real-time classification
-            return {
-                "class": "Speech",
-                "confidence": 0.82,
-                "timestamp": "real-time"
-            }
+            async with inference_scheduler.slot(audio_cost(len(audio_chunk))):
+                return await self._run_inference("stream", self._predict_stream, audio_chunk)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi phân loại stream: {str(e)}")
     
@@ -170,15 +292,26 @@ class AudioClassifierService:
         Phát hiện các âm thanh quan trọng cần cảnh báo
         """
         try:
-            # Mock critical sound detection
-            critical_sounds = {
-                "fire_alarm": 0.05,
-                "doorbell": 0.15,
-                "baby_cry": 0.08,
-                "phone_ring": 0.12
-            }
+            tenant = current_work()[0]
+            custom = self.custom_sounds if self.custom_sounds is not None and self.custom_sounds.has_sounds(tenant) else None
+            
+            def predict(chunk):
+                # Một lần suy luận cho cả điểm class (rollup) và embedding (custom sound)
+                rolled = self._predict_critical(chunk)
+                if custom is None:
+                    return rolled, []
+                embeddings = self._predict_embeddings(self._pcm16_to_float(chunk))
+                return rolled, custom.match(tenant, embeddings, margin=settings.alert_hysteresis)
+            
+            async with inference_scheduler.slot(audio_cost(len(audio_chunk))):
+                rolled, custom_matches = await self._run_inference("critical", predict, audio_chunk)
+            
+            split = len(self._critical_keys)
+            critical_sounds = {name: round(score, 4) for name, score in zip(self._critical_keys, rolled[:split].tolist())}
+            categories = {name: round(score, 4) for name, score in zip(self._category_keys, rolled[split:].tolist())}
             
-            # Tìm âm thanh có confidence cao nhất
+            # Tìm âm thanh có confidence cao nhất (để hiển thị); cảnh báo được đánh giá trên toàn bộ
+            # "scores" theo ngưỡng của từng loại, không chỉ loại cao nhất
             max_sound = max(critical_sounds.items(), key=lambda x: x[1])
             
             if max_sound[1] > 0.1:  # Threshold
@@ -186,11 +319,17 @@ class AudioClassifierService:
                     "detected": True,
                     "sound_type": max_sound[0],
                     "confidence": max_sound[1],
-                    "alert_level": "medium"
+                    "alert_level": "medium",
+                    "scores": critical_sounds,
+                    "categories": categories,
+                    "custom_matches": custom_matches
                 }
             
-            return {"detected": False}
+            return {"detected": False, "scores": critical_sounds, "categories": categories,
+                    "custom_matches": custom_matches}
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi phát hiện critical sounds: {str(e)}")
     
@@ -200,6 +339,13 @@ class AudioClassifierService:
         """
         return self.class_names
     
+    async def search_classes(self, query: Optional[str] = None, parent: Optional[str] = None,
+                             offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """
+        Tìm class theo tiền tố tên (và / hoặc nhóm cha trong ontology), có phân trang
+        """
+        return self.ontology.page(query, parent, offset, limit)
+    
     async def check_model_status(self) -> bool:
         """
         Kiểm tra trạng thái model YAMNet
@@ -0,0 +1,240 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+from typing import Dict, Any, Iterator, List, Optional
+from datetime import datetime
+from app.core.config import settings
+
+# Một bản ghi index cho mỗi frame: seq, số segment, offset trong segment, độ dài, thời điểm thu (us)
+INDEX_RECORD = struct.Struct("<IIQIQ")
+
+INDEX_FILE = "index.bin"
+META_FILE = "meta.json"
+
+
+def _segment_name(segment_no: int) -> str:
+    return f"seg-{segment_no:06d}.pcm"
+
+
+class JournalWriter:
+    """
+    Ghi append-only các frame PCM của một session vào các file segment
+    """
+
+    def __init__(self, session_dir: str, segment_bytes: int, buffer_bytes: int):
+        self.session_dir = session_dir
+        self.segment_bytes = segment_bytes
+        self.buffer_bytes = buffer_bytes
+        self.segment_no = 0
+        self.segment_offset = 0
+        self.frames = 0
+        self.bytes_written = 0
+        self._segment = open(os.path.join(session_dir, _segment_name(0)), "ab", buffering=buffer_bytes)
+        self._index = open(os.path.join(session_dir, INDEX_FILE), "ab", buffering=buffer_bytes)
+
+    def append(self, pcm: bytes, seq: Optional[int] = None, capture_ts_us: Optional[int] = None):
+        if not pcm:
+            return
+        if self.segment_offset and self.segment_offset + len(pcm) > self.segment_bytes:
+            self._rotate()
+
+        self._segment.write(pcm)
+        self._index.write(INDEX_RECORD.pack(
+            self.frames if seq is None else seq,
+            self.segment_no,
+            self.segment_offset,
+            len(pcm),
+            capture_ts_us or time.time_ns() // 1000
+        ))
+        self.segment_offset += len(pcm)
+        self.frames += 1
+        self.bytes_written += len(pcm)
+
+    def _rotate(self):
+        self._segment.close()
+        self.segment_no += 1
+        self.segment_offset = 0
+        self._segment = open(os.path.join(self.session_dir, _segment_name(self.segment_no)), "ab", buffering=self.buffer_bytes)
+
+    def flush(self):
+        self._segment.flush()
+        self._index.flush()
+
+    def close(self):
+        self._segment.close()
+        self._index.close()
+
+
+class AudioJournal:
+    """
+    Journal audio trên đĩa theo từng session, dùng để replay / transcribe lại
+    """
+
+    def __init__(self, journal_dir: Optional[str] = None):
+        self.journal_dir = journal_dir or settings.audio_journal_dir
+        self.writers = {}
+        self._last_retention = 0.0
+
+    def _session_dir(self, session_id: str) -> str:
+        if not session_id or os.path.basename(session_id) != session_id or session_id.startswith("."):
+            raise ValueError(f"Session id không hợp lệ: {session_id}")
+        return os.path.join(self.journal_dir, session_id)
+
+    def open_session(self, session_id: str, sample_rate: int, language: str):
+        """
+        Tạo thư mục journal cho session và mở writer
+        """
+        session_dir = self._session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        with open(os.path.join(session_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "session_id": session_id,
+                "sample_rate": sample_rate,
+                "sample_width": 2,
+                "language": language,
+                "created_at": datetime.now().isoformat()
+            }, f)
+        self.writers[session_id] = JournalWriter(
+            session_dir, settings.audio_journal_segment_bytes, settings.audio_journal_buffer_bytes
+        )
+
+    def append(self, session_id: str, pcm: bytes, seq: Optional[int] = None, capture_ts_us: Optional[int] = None):
+        writer = self.writers.get(session_id)
+        if writer is not None:
+            writer.append(pcm, seq, capture_ts_us)
+
+    def close_session(self, session_id: str):
+        writer = self.writers.pop(session_id, None)
+        if writer is not None:
+            writer.close()
+
+    def has_session(self, session_id: str) -> bool:
+        return os.path.exists(os.path.join(self._session_dir(session_id), META_FILE))
+
+    def get_meta(self, session_id: str) -> Dict[str, Any]:
+        with open(os.path.join(self._session_dir(session_id), META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_frames(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Đọc lại các frame theo thứ tự ghi, dùng mmap cho cả index và segment
+        """
+        writer = self.writers.get(session_id)
+        if writer is not None:
+            writer.flush()
+
+        session_dir = self._session_dir(session_id)
+        index_path = os.path.join(session_dir, INDEX_FILE)
+        if not os.path.exists(index_path) or os.path.getsize(index_path) == 0:
+            return
+
+        segments = {}
+        try:
+            with open(index_path, "rb") as index_file, \
+                    mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                record_count = len(index) // INDEX_RECORD.size
+                for i in range(record_count):
+                    seq, segment_no, offset, length, capture_ts_us = INDEX_RECORD.unpack_from(index, i * INDEX_RECORD.size)
+
+                    segment = segments.get(segment_no)
+                    if segment is None:
+                        with open(os.path.join(session_dir, _segment_name(segment_no)), "rb") as f:
+                            segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        segments[segment_no] = segment
+
+                    yield {
+                        "seq": seq,
+                        "capture_ts_us": capture_ts_us,
+                        "pcm": segment[offset:offset + length]
+                    }
+        finally:
+            for segment in segments.values():
+                segment.close()
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """
+        Danh sách các session trong journal (cũ nhất trước) kèm dung lượng trên đĩa
+        """
+        if not os.path.isdir(self.journal_dir):
+            return []
+
+        sessions = []
+        for entry in os.scandir(self.journal_dir):
+            if not entry.is_dir():
+                continue
+            size = 0
+            modified_at = entry.stat().st_mtime
+            for file_entry in os.scandir(entry.path):
+                stat = file_entry.stat()
+                size += stat.st_size
+                modified_at = max(modified_at, stat.st_mtime)
+            sessions.append({
+                "session_id": entry.name,
+                "bytes": size,
+                "modified_at": modified_at,
+                "open": entry.name in self.writers
+            })
+
+        sessions.sort(key=lambda x: x["modified_at"])
+        return sessions
+
+    def delete_session(self, session_id: str) -> bool:
+        self.close_session(session_id)
+        session_dir = self._session_dir(session_id)
+        if not os.path.isdir(session_dir):
+            return False
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return True
+
+    def apply_retention(self, now: Optional[float] = None) -> List[str]:
+        """
+        Xóa các session quá hạn lưu trữ, sau đó xóa cũ nhất cho đến khi tổng dung lượng nằm trong giới hạn.
+        Session đang ghi không bao giờ bị xóa.
+        """
+        now = time.time() if now is None else now
+        max_age = settings.audio_journal_retention_hours * 3600
+        removed = []
+
+        sessions = [s for s in self.list_sessions() if not s["open"]]
+        total_bytes = sum(s["bytes"] for s in sessions)
+
+        for session in sessions:
+            too_old = max_age > 0 and now - session["modified_at"] > max_age
+            over_budget = total_bytes > settings.audio_journal_max_bytes
+            if not (too_old or over_budget):
+                continue
+            # Có thể chạy trong worker thread: session vừa được mở lại trong lúc quét thì giữ nguyên
+            if session["session_id"] in self.writers:
+                continue
+            shutil.rmtree(self._session_dir(session["session_id"]), ignore_errors=True)
+            total_bytes -= session["bytes"]
+            removed.append(session["session_id"])
+
+        self._last_retention = now
+        return removed
+
+    def retention_due(self) -> bool:
+        """
+        Đã tới lượt chạy retention chưa (tối đa một lần mỗi audio_journal_retention_interval_seconds).
+        Trả về True thì lượt này được giữ chỗ - lời gọi khác trong cùng khoảng nhận False.
+        """
+        now = time.time()
+        if now - self._last_retention < settings.audio_journal_retention_interval_seconds:
+            return False
+        self._last_retention = now
+        return True
+
+    def run_retention(self):
+        """apply_retention nhưng chỉ ghi log khi lỗi (quét đĩa + rmtree: gọi qua asyncio.to_thread)"""
+        try:
+            self.apply_retention()
+        except Exception as e:
+            print(f"Error applying audio journal retention: {e}")
+
+    def maybe_apply_retention(self):
+        """Chạy retention tối đa một lần mỗi audio_journal_retention_interval_seconds"""
+        if self.retention_due():
+            self.run_retention()
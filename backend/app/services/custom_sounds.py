@@ -0,0 +1,395 @@
+"""
+Âm thanh tự đăng ký (custom sound) theo từng hộ gia đình / thiết bị.
+
+Người dùng ghi vài clip mẫu cho một âm thanh riêng (chuông cửa, lò vi sóng của nhà mình). Mỗi clip được
+chuyển thành embedding YAMNet (1024 chiều, trung bình các frame rồi chuẩn hóa L2) và lưu trong một ma
+trận liên tục của tenant (float32, hoặc float16 để giảm một nửa bộ nhớ). Khi so khớp, embedding của cửa
+sổ audio live được nhân với toàn bộ ma trận (cosine = tích vô hướng vì đã chuẩn hóa), rồi lấy top-k âm
+thanh bằng argpartition - không có vòng lặp Python theo số mẫu.
+
+Tenant có nhiều mẫu (>= custom_sound_ann_min_vectors) dùng thêm chỉ mục xấp xỉ IVF: các vector được
+chia vào ~sqrt(N) cụm (k-means trên mặt cầu), truy vấn chỉ quét custom_sound_ann_probes cụm gần nhất,
+nên độ trễ gần như không tăng theo số mẫu. Chỉ mục được dựng lại khi đăng ký / xóa (ngoài đường truy vấn).
+
+Truy vấn không cần khóa: mỗi thay đổi công bố một _View mới gồm cả ma trận lẫn danh sách âm thanh (ma trận
+chỉ được ghi thêm vào phần ngoài `size` của view cũ hoặc được sao chép khi xóa, metadata không bao giờ bị
+sửa tại chỗ), còn truy vấn (chạy trong inference executor) chỉ dùng view lấy được lúc bắt đầu. Các thao tác
+ghi được tuần tự hóa bằng một khóa của store và được gọi ngoài event loop (dựng IVF, ghi file .npz).
+
+Khớp được gửi tới AlertService như sound type "custom:<sound_id>", với ngưỡng là độ tương đồng cosine.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import REGISTRY, FAST_LATENCY_BUCKETS
+
+SOUND_TYPE_PREFIX = "custom:"
+# Chiều embedding của YAMNet
+EMBEDDING_DIM = 1024
+# Số hàng mỗi khối khi nhân với ma trận float16 (ép kiểu từng khối thay vì cả ma trận)
+FLOAT16_BLOCK_ROWS = 4096
+# Số vòng k-means khi dựng chỉ mục IVF
+KMEANS_ITERATIONS = 8
+
+MATCH_SECONDS = REGISTRY.histogram("custom_sound_match_seconds", "Thời gian so khớp embedding với custom sound",
+                                   buckets=FAST_LATENCY_BUCKETS)
+
+
+def sound_type_for(sound_id: str) -> str:
+    return f"{SOUND_TYPE_PREFIX}{sound_id}"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def clip_embedding(frame_embeddings: np.ndarray) -> np.ndarray:
+    """Embedding của một clip mẫu: trung bình các frame, chuẩn hóa L2"""
+    frame_embeddings = np.atleast_2d(np.asarray(frame_embeddings, dtype=np.float32))
+    return normalize(normalize(frame_embeddings).mean(axis=0))
+
+
+class _IVF(NamedTuple):
+    centroids: np.ndarray  # [số cụm, dim] float32, đã chuẩn hóa
+    lists: List[np.ndarray]  # hàng thuộc từng cụm
+    size: int  # số hàng lúc dựng - các hàng sau đó luôn được quét toàn bộ
+
+
+class _View(NamedTuple):
+    vectors: np.ndarray  # [capacity, dim]; chỉ `size` hàng đầu có nghĩa
+    labels: np.ndarray  # [capacity] slot của âm thanh
+    size: int
+    ivf: Optional[_IVF]
+    sounds: Tuple[Dict[str, Any], ...]  # slot -> metadata của âm thanh
+    slots: Dict[str, int]  # sound_id -> slot
+
+
+class TenantSoundIndex:
+    """
+    Ma trận embedding và danh sách âm thanh của một tenant
+    """
+
+    def __init__(self, tenant: str, dim: int = EMBEDDING_DIM, dtype: str = "float32"):
+        self.tenant = tenant
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.view = _View(np.zeros((0, dim), dtype=self.dtype), np.zeros(0, dtype=np.int32), 0, None, (), {})
+
+    @property
+    def sounds(self) -> Tuple[Dict[str, Any], ...]:
+        return self.view.sounds
+
+    @property
+    def slots(self) -> Dict[str, int]:
+        return self.view.slots
+
+    # --- Ghi (chỉ từ một thread tại một thời điểm, xem CustomSoundStore) ---
+
+    def add_sound(self, sound: Dict[str, Any], embeddings: np.ndarray) -> Dict[str, Any]:
+        view = self.view
+        slot = len(view.sounds)
+        view = view._replace(sounds=view.sounds + (sound,), slots={**view.slots, sound["id"]: slot})
+        self.view = self._appended(view, slot, embeddings)
+        return self.view.sounds[slot]
+
+    def append(self, sound_id: str, embeddings: np.ndarray) -> Dict[str, Any]:
+        slot = self.view.slots[sound_id]
+        self.view = self._appended(self.view, slot, embeddings)
+        return self.view.sounds[slot]
+
+    def _appended(self, view: _View, slot: int, embeddings: np.ndarray) -> _View:
+        embeddings = normalize(np.atleast_2d(embeddings)).astype(self.dtype)
+        size = view.size + len(embeddings)
+        vectors, labels = view.vectors, view.labels
+        if size > len(vectors):
+            # Tăng gấp đôi dung lượng: chi phí sao chép được chia đều cho các lần ghi
+            capacity = max(16, size, 2 * len(vectors))
+            vectors = np.zeros((capacity, self.dim), dtype=self.dtype)
+            labels = np.zeros(capacity, dtype=np.int32)
+            vectors[:view.size] = view.vectors[:view.size]
+            labels[:view.size] = view.labels[:view.size]
+        vectors[view.size:size] = embeddings
+        labels[view.size:size] = slot
+        sounds = list(view.sounds)
+        sounds[slot] = {**sounds[slot], "examples": sounds[slot]["examples"] + len(embeddings)}
+        return self._with_index(view._replace(vectors=vectors, labels=labels, size=size, sounds=tuple(sounds)))
+
+    def remove_sound(self, sound_id: str) -> bool:
+        view = self.view
+        slot = view.slots.get(sound_id)
+        if slot is None:
+            return False
+        # Nén lại: bỏ hàng của âm thanh đã xóa và đánh số lại các slot sau nó
+        sounds = view.sounds[:slot] + view.sounds[slot + 1:]
+        remap = np.arange(len(view.sounds), dtype=np.int32)
+        remap[slot + 1:] -= 1
+        keep = view.labels[:view.size] != slot
+        vectors = view.vectors[:view.size][keep].copy()
+        labels = remap[view.labels[:view.size][keep]]
+        slots = {sound["id"]: index for index, sound in enumerate(sounds)}
+        self.view = self._with_index(_View(vectors, labels, len(vectors), None, sounds, slots))
+        return True
+
+    def _with_index(self, view: _View) -> _View:
+        if not settings.custom_sound_ann_enabled or view.size < settings.custom_sound_ann_min_vectors:
+            return view._replace(ivf=None)
+        # Dựng lại khi số hàng tăng gấp đôi hoặc sau khi nén; hàng mới trước đó được quét toàn bộ
+        if view.ivf is not None and view.size < 2 * view.ivf.size:
+            return view
+        return view._replace(ivf=self._build_ivf(view))
+
+    def _build_ivf(self, view: _View) -> _IVF:
+        vectors = view.vectors[:view.size].astype(np.float32)
+        count = max(1, int(np.sqrt(view.size)))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(view.size, count, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            empty = ~np.bincount(assignment, minlength=count).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(count + 1))
+        lists = [order[bounds[i]:bounds[i + 1]] for i in range(count)]
+        return _IVF(centroids, lists, view.size)
+
+    # --- Đọc ---
+
+    def _similarities(self, view: _View, rows: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """Cosine lớn nhất giữa các frame truy vấn và từng hàng (rows = None: mọi hàng)"""
+        matrix = view.vectors[:view.size] if rows is None else view.vectors[rows]
+        if self.dtype == np.float32:
+            return (queries @ matrix.T).max(axis=0)
+        # float16: numpy không có BLAS cho float16, ép kiểu theo khối để bộ nhớ tạm nhỏ
+        result = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), FLOAT16_BLOCK_ROWS):
+            block = matrix[start:start + FLOAT16_BLOCK_ROWS].astype(np.float32)
+            result[start:start + len(block)] = (queries @ block.T).max(axis=0)
+        return result
+
+    def _candidate_rows(self, view: _View, queries: np.ndarray) -> Optional[np.ndarray]:
+        if view.ivf is None:
+            return None
+        probes = min(settings.custom_sound_ann_probes, len(view.ivf.centroids))
+        nearest = np.argpartition(-(queries @ view.ivf.centroids.T).max(axis=0), probes - 1)[:probes]
+        tail = np.arange(view.ivf.size, view.size)
+        return np.concatenate([view.ivf.lists[i] for i in nearest] + [tail])
+
+    def search(self, frame_embeddings: np.ndarray, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Top-k âm thanh giống nhất với các frame (điểm của âm thanh = cosine cao nhất trên các mẫu của nó)
+        """
+        view = self.view
+        sounds = view.sounds
+        if view.size == 0:
+            return []
+        queries = normalize(np.atleast_2d(frame_embeddings))
+        rows = self._candidate_rows(view, queries)
+        similarities = self._similarities(view, rows, queries)
+        labels = view.labels[:view.size] if rows is None else view.labels[rows]
+
+        # k âm thanh khác nhau chắc chắn nằm trong k * (số mẫu tối đa mỗi âm thanh) hàng cao nhất
+        take = min(len(similarities), k * settings.custom_sound_max_examples)
+        top = np.argpartition(-similarities, take - 1)[:take] if take < len(similarities) else np.arange(take)
+        top = top[np.argsort(-similarities[top], kind="stable")]
+
+        results, seen = [], set()
+        for row in top:
+            slot = int(labels[row])
+            if slot in seen:
+                continue
+            seen.add(slot)
+            sound = sounds[slot]
+            results.append({
+                "sound_id": sound["id"],
+                "name": sound["name"],
+                "sound_type": sound_type_for(sound["id"]),
+                "score": round(float(similarities[row]), 4),
+                "threshold": sound["threshold"],
+            })
+            if len(results) == k:
+                break
+        return results
+
+    def list_sounds(self) -> List[Dict[str, Any]]:
+        return [dict(sound) for sound in self.view.sounds]
+
+    # --- Lưu trữ ---
+
+    def save(self, path: str):
+        view = self.view
+        meta = {"tenant": self.tenant, "dtype": self.dtype.name, "sounds": list(view.sounds)}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=view.vectors[:view.size], labels=view.labels[:view.size],
+                     meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TenantSoundIndex":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["tenant"], data["vectors"].shape[1], meta["dtype"])
+            sounds = tuple(meta["sounds"])
+            slots = {sound["id"]: slot for slot, sound in enumerate(sounds)}
+            vectors = data["vectors"].astype(index.dtype)
+            index.view = index._with_index(
+                _View(vectors, data["labels"].astype(np.int32), len(vectors), None, sounds, slots))
+        return index
+
+
+class CustomSoundStore:
+    """
+    Chỉ mục custom sound của mọi tenant, lưu xuống settings.custom_sounds_dir (mỗi tenant một file .npz).
+    enroll / add_examples / remove chặn (dựng IVF, ghi file) - gọi qua asyncio.to_thread từ handler async.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory if directory is not None else settings.custom_sounds_dir
+        self.tenants: Dict[str, TenantSoundIndex] = {}
+        self.stats = {"matches": 0, "searches": 0}
+        # Tuần tự hóa các thao tác ghi; truy vấn không lấy khóa
+        self._write_lock = threading.Lock()
+        if self.directory:
+            self._load_all()
+        REGISTRY.gauge("custom_sound_vectors", "Số embedding mẫu của custom sound đang giữ trong bộ nhớ",
+                       function=lambda: sum(index.view.size for index in self.tenants.values()))
+
+    def _path(self, tenant: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:16] + ".npz")
+
+    def _load_all(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".npz"):
+                continue
+            try:
+                index = TenantSoundIndex.load(os.path.join(self.directory, filename))
+                self.tenants[index.tenant] = index
+            except Exception as e:
+                print(f"⚠️ Could not load custom sounds from {filename}: {e}")
+        if self.tenants:
+            print(f"✅ Loaded custom sounds for {len(self.tenants)} tenants")
+
+    def _persist(self, index: TenantSoundIndex):
+        if not self.directory:
+            return
+        if index.slots:
+            index.save(self._path(index.tenant))
+        elif os.path.exists(self._path(index.tenant)):
+            os.remove(self._path(index.tenant))
+
+    def has_sounds(self, tenant: str) -> bool:
+        index = self.tenants.get(tenant)
+        return index is not None and index.view.size > 0
+
+    def all_sounds(self) -> List[Dict[str, Any]]:
+        return [sound for index in self.tenants.values() for sound in index.list_sounds()]
+
+    def enroll(self, tenant: str, name: str, clip_embeddings: List[np.ndarray],
+               threshold: Optional[float] = None, priority: str = "medium") -> Dict[str, Any]:
+        """
+        Đăng ký âm thanh mới từ embedding của các clip mẫu (mỗi phần tử: [số frame, dim]).
+        priority được lưu cùng âm thanh để alert giữ mức ưu tiên sau khi khởi động lại.
+        """
+        try:
+            if not clip_embeddings:
+                raise ValueError("Cần ít nhất một clip mẫu")
+            if len(clip_embeddings) > settings.custom_sound_max_examples:
+                raise ValueError(f"Tối đa {settings.custom_sound_max_examples} clip mẫu cho mỗi âm thanh")
+            embeddings = np.stack([clip_embedding(e) for e in clip_embeddings])
+
+            with self._write_lock:
+                index = self.tenants.get(tenant)
+                if index is not None and len(index.slots) >= settings.custom_sound_max_per_tenant:
+                    raise ValueError(f"Tối đa {settings.custom_sound_max_per_tenant} custom sound cho mỗi tenant")
+                if index is None:
+                    index = TenantSoundIndex(tenant, dtype=settings.custom_sound_dtype)
+
+                sound = index.add_sound({
+                    "id": uuid.uuid4().hex[:12],
+                    "name": name,
+                    "tenant": tenant,
+                    "threshold": settings.custom_sound_threshold if threshold is None else threshold,
+                    "priority": priority,
+                    "examples": 0,
+                    "created_at": datetime.now().isoformat(),
+                }, embeddings)
+                # Chỉ công bố index của tenant mới khi nó đã có âm thanh
+                self.tenants[tenant] = index
+                self._persist(index)
+            return {**sound, "sound_type": sound_type_for(sound["id"])}
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Lỗi đăng ký custom sound: {str(e)}")
+
+    def add_examples(self, tenant: str, sound_id: str, clip_embeddings: List[np.ndarray]) -> Optional[Dict[str, Any]]:
+        embeddings = np.stack([clip_embedding(e) for e in clip_embeddings])
+        with self._write_lock:
+            index = self.tenants.get(tenant)
+            if index is None or sound_id not in index.slots:
+                return None
+            sound = index.sounds[index.slots[sound_id]]
+            if sound["examples"] + len(embeddings) > settings.custom_sound_max_examples:
+                raise ValueError(f"Tối đa {settings.custom_sound_max_examples} clip mẫu cho mỗi âm thanh")
+            sound = index.append(sound_id, embeddings)
+            self._persist(index)
+        return {**sound, "sound_type": sound_type_for(sound_id)}
+
+    def remove(self, tenant: str, sound_id: str) -> bool:
+        with self._write_lock:
+            index = self.tenants.get(tenant)
+            if index is None or not index.remove_sound(sound_id):
+                return False
+            self._persist(index)
+            if not index.slots:
+                del self.tenants[tenant]
+        return True
+
+    def list_sounds(self, tenant: str) -> List[Dict[str, Any]]:
+        index = self.tenants.get(tenant)
+        if index is None:
+            return []
+        return [{**sound, "sound_type": sound_type_for(sound["id"])} for sound in index.list_sounds()]
+
+    def search(self, tenant: str, frame_embeddings: np.ndarray, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Top-k custom sound của tenant cho các frame, kể cả dưới ngưỡng. An toàn khi gọi từ worker thread."""
+        index = self.tenants.get(tenant)
+        if index is None:
+            return []
+        started = time.perf_counter()
+        results = index.search(frame_embeddings, k or settings.custom_sound_top_k)
+        MATCH_SECONDS.observe(time.perf_counter() - started)
+        self.stats["searches"] += 1
+        return results
+
+    def match(self, tenant: str, frame_embeddings: np.ndarray, k: Optional[int] = None,
+              margin: float = 0.0) -> List[Dict[str, Any]]:
+        """Như search, chỉ giữ kết quả có điểm >= ngưỡng của âm thanh - margin"""
+        matches = [result for result in self.search(tenant, frame_embeddings, k)
+                   if result["score"] >= result["threshold"] - margin]
+        self.stats["matches"] += len(matches)
+        return matches
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tenants": len(self.tenants),
+            "sounds": sum(len(index.slots) for index in self.tenants.values()),
+            "vectors": sum(index.view.size for index in self.tenants.values()),
+            "ann_tenants": sum(1 for index in self.tenants.values() if index.view.ivf is not None),
+            "match_p95_ms": round(MATCH_SECONDS.quantile(0.95) * 1000, 3) if MATCH_SECONDS.count else None,
+            **self.stats,
+        }
@@ -0,0 +1,181 @@
+import time
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+
+# Trọng số EWMA của các phép đo (độ trễ, mức sử dụng)
+EWMA_ALPHA = 0.2
+# Số frame tối thiểu sau mỗi lần điều chỉnh trước khi đánh giá lại
+MIN_SAMPLES = 5
+# Không có frame trong khoảng này (giây) thì coi như client tạm dừng, không tính là bị trễ
+PAUSE_GAP_SECONDS = 2.0
+
+
+class FlowController:
+    """
+    Điều khiển luồng audio live của một kết nối: thương lượng độ dài frame lúc bắt đầu phiên, đo độ
+    trễ và mức sử dụng xử lý (thời gian xử lý / độ dài audio của frame), rồi gửi message
+    flow_control để client điều chỉnh:
+
+    - increase_frame: chi phí cố định mỗi frame chiếm phần lớn thời gian xử lý, hoặc mạng chậm
+      (ít frame lớn thay vì nhiều frame nhỏ)
+    - lower_sample_rate: bị trễ trong khi server còn dư năng lực - đường truyền là nút thắt
+      (chỉ với binary-v1, vì frame tự mô tả sample rate)
+    - slow_down: frame đã lớn nhất mà vẫn trễ; max_rate là tỉ lệ thời gian thực server theo kịp
+    - decrease_frame: đã hết trễ và còn dư năng lực, quay về frame nhỏ hơn để giảm độ trễ
+
+    Độ trễ theo timestamp thu là phần vượt trên độ trễ nhỏ nhất đã thấy trong phiên (base delay),
+    nên độ lệch cố định giữa đồng hồ client và server bị triệt tiêu; timestamp lệch quá
+    stream_clock_skew_seconds thì không dùng, đo theo thời điểm frame tới server.
+    """
+
+    def __init__(self, sample_rate: Optional[int] = None, can_change_sample_rate: bool = False):
+        self.service_rate = sample_rate or settings.sample_rate
+        self.can_change_sample_rate = can_change_sample_rate
+        self.enabled = settings.flow_control_enabled
+        self.min_frame_ms = settings.live_frame_ms_min
+        self.max_frame_ms = settings.live_frame_ms_max
+        self.preferred_frame_ms = settings.live_frame_ms
+        self.frame_ms = settings.live_frame_ms
+        self.sample_rate = self.service_rate
+
+        self.utilization = None
+        self.lag = None
+        # Độ trễ một chiều nhỏ nhất (gồm cả độ lệch đồng hồ client) - mốc để tính độ trễ xếp hàng
+        self.base_delay = None
+        self.samples = 0
+        self.first_frame_at = None
+        self.last_frame_at = None
+        self.audio_seconds = 0.0
+        self.last_action_at = None
+        self.last_eval_at = None
+        self.stats = {
+            "increase_frame": 0,
+            "decrease_frame": 0,
+            "lower_sample_rate": 0,
+            "slow_down": 0,
+        }
+
+    def negotiate(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Chọn độ dài frame (trong giới hạn server) và sample rate từ cấu hình client
+        """
+        requested = config.get("frame_ms") or settings.live_frame_ms
+        self.frame_ms = self.preferred_frame_ms = self._clamp_frame_ms(requested)
+        rate = config.get("sample_rate")
+        if self.can_change_sample_rate and rate in settings.live_sample_rates:
+            self.sample_rate = rate
+        return self._frame_params()
+
+    def observe(self, pcm_bytes: int, processing_seconds: float, capture_ts_us: Optional[int] = None,
+                now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ghi nhận một frame đã xử lý xong; trả về message flow_control cần gửi (hoặc None)
+        """
+        now = time.time() if now is None else now
+        duration = pcm_bytes / (self.service_rate * 2)
+        if duration <= 0:
+            return None
+
+        if self.first_frame_at is None or now - self.last_frame_at > PAUSE_GAP_SECONDS:
+            self.first_frame_at = now - duration
+            self.audio_seconds = 0.0
+            self.base_delay = None
+        self.last_frame_at = now
+        self.audio_seconds += duration
+
+        # Độ trễ: theo timestamp thu nếu dùng được, nếu không thì độ chậm so với thời gian thực
+        # của audio đã tới server
+        delay = now - capture_ts_us / 1_000_000 - duration if capture_ts_us else None
+        if delay is not None and abs(delay) <= settings.stream_clock_skew_seconds:
+            self.base_delay = delay if self.base_delay is None else min(self.base_delay, delay)
+            lag = delay - self.base_delay
+        else:
+            lag = now - self.first_frame_at - self.audio_seconds
+        self.lag = _ewma(self.lag, max(0.0, lag))
+        self.utilization = _ewma(self.utilization, processing_seconds / duration)
+        self.samples += 1
+
+        if not self.enabled or self.samples < MIN_SAMPLES:
+            return None
+        if self.last_eval_at is not None and now - self.last_eval_at < settings.flow_eval_interval_seconds:
+            return None
+        self.last_eval_at = now
+        if self.last_action_at is not None and now - self.last_action_at < settings.flow_cooldown_seconds:
+            return None
+
+        action = self._decide()
+        if action is None:
+            return None
+        self.last_action_at = now
+        self.stats[action["action"]] += 1
+        # Đo lại từ đầu với cấu hình mới
+        self.samples = 0
+        self.utilization = None
+        return action
+
+    def _decide(self) -> Optional[Dict[str, Any]]:
+        lag_high = settings.flow_lag_high_ms / 1000
+        lag_low = settings.flow_lag_low_ms / 1000
+
+        # Chi phí mỗi frame quá lớn so với độ dài audio: gộp thành frame lớn hơn
+        if self.utilization >= settings.flow_utilization_high and self.frame_ms < self.max_frame_ms:
+            return self._resize(self.frame_ms * 2, "increase_frame")
+
+        if self.lag > lag_high:
+            if self.utilization < settings.flow_utilization_high:
+                # Server còn dư năng lực - đường truyền / client là nút thắt
+                lower = self._lower_sample_rate()
+                if lower is not None:
+                    self.sample_rate = lower
+                    return self._message("lower_sample_rate")
+                if self.frame_ms < self.max_frame_ms:
+                    return self._resize(self.frame_ms * 2, "increase_frame")
+            message = self._message("slow_down")
+            message["max_rate"] = round(min(1.0, 1.0 / self.utilization), 2) if self.utilization > 0 else 1.0
+            return message
+
+        if (self.lag < lag_low and self.utilization < settings.flow_utilization_low
+                and self.frame_ms > self.preferred_frame_ms):
+            return self._resize(max(self.preferred_frame_ms, self.frame_ms // 2), "decrease_frame")
+        return None
+
+    def _resize(self, frame_ms: int, action: str) -> Dict[str, Any]:
+        self.frame_ms = self._clamp_frame_ms(frame_ms)
+        return self._message(action)
+
+    def _lower_sample_rate(self) -> Optional[int]:
+        if not self.can_change_sample_rate:
+            return None
+        lower: List[int] = [rate for rate in settings.live_sample_rates if rate < self.sample_rate]
+        return max(lower) if lower else None
+
+    def _clamp_frame_ms(self, frame_ms) -> int:
+        return int(min(self.max_frame_ms, max(self.min_frame_ms, int(frame_ms))))
+
+    def _frame_params(self) -> Dict[str, Any]:
+        return {
+            "frame_ms": self.frame_ms,
+            "frame_samples": self.sample_rate * self.frame_ms // 1000,
+            "sample_rate": self.sample_rate,
+        }
+
+    def _message(self, action: str) -> Dict[str, Any]:
+        return {
+            "type": "flow_control",
+            "action": action,
+            **self._frame_params(),
+            "lag_ms": round(self.lag * 1000, 1),
+            "utilization": round(self.utilization, 3),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._frame_params(),
+            "lag_ms": round(self.lag * 1000, 1) if self.lag is not None else None,
+            "utilization": round(self.utilization, 3) if self.utilization is not None else None,
+            "flow_actions": dict(self.stats),
+        }
+
+
+def _ewma(current: Optional[float], value: float) -> float:
+    return value if current is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * current
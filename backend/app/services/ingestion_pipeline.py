@@ -0,0 +1,280 @@
+import asyncio
+import time
+from typing import Dict, Any, Callable, Awaitable, Optional
+from app.core.admission import LIVE
+from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, check_deadline, deadline_context, frame_deadline
+from app.core.fair_scheduler import work_context
+from app.core.live_protocol import LiveProtocol, ProtocolError, negotiate_protocol
+from app.core.metrics import Histogram, REGISTRY
+from app.services.flow_control import FlowController
+from app.services.result_stabilizer import ResultStabilizer
+
+# Các giai đoạn xử lý một frame, mỗi giai đoạn có histogram độ trễ riêng
+STAGES = ("decode", "stt", "classify", "alert", "emit", "total")
+
+# (event, payload) -> gửi tới client của pipeline
+Emitter = Callable[[str, Any], Awaitable[None]]
+
+
+def load_audio_classifier(executor=None, custom_sounds=None):
+    """
+    Tạo AudioClassifierService nếu môi trường có TensorFlow, ngược lại trả về None
+    (pipeline vẫn chạy transcription, chỉ bỏ qua nhánh phát hiện âm thanh)
+    """
+    try:
+        from app.services.audio_classifier_service import AudioClassifierService
+    except ImportError as e:
+        print(f"⚠️ Audio classifier unavailable, sound alerts disabled for live ingestion: {e}")
+        return None
+    return AudioClassifierService(executor=executor, custom_sounds=custom_sounds)
+
+
+async def load_audio_classifier_async(executor=None, custom_sounds=None):
+    """load_audio_classifier trong thread - nạp TensorFlow / model không chặn event loop"""
+    return await asyncio.to_thread(load_audio_classifier, executor, custom_sounds)
+
+
+class IngestionPipeline:
+    """
+    Pipeline xử lý audio real-time của một kết nối Socket.IO.
+    Mỗi frame chỉ được giải mã một lần, rồi cùng lúc đưa vào STT streaming và bộ phân loại âm thanh;
+    phát hiện của bộ phân loại được chuyển thẳng tới AlertService.
+    """
+
+    def __init__(self, sid: str, emit: Emitter, transcription_service, alert_service,
+                 classifier=None, stage_latency: Optional[Dict[str, Histogram]] = None):
+        self.sid = sid
+        self.emit = emit
+        self.transcription_service = transcription_service
+        self.alert_service = alert_service
+        self.classifier = classifier
+        self.stage_latency = stage_latency if stage_latency is not None else {stage: Histogram() for stage in STAGES}
+
+        self.session_id = None
+        self.device_id = sid
+        self.protocol = LiveProtocol()
+        self.stabilizer = None
+        self.flow = FlowController()
+        # Ngân sách từ lúc thu frame tới lúc gửi caption (None = settings.stream_deadline_ms)
+        self.deadline_ms = None
+
+        # Buffer audio dùng chung cho cửa sổ phân loại (PCM16)
+        self._classify_buffer = bytearray()
+        self._window_bytes = 0
+        self._hop_bytes = 0
+        # Frame của cùng một kết nối phải được xử lý tuần tự để giữ thứ tự transcript
+        self._lock = asyncio.Lock()
+        self.stats = {"frames": 0, "frames_rejected": 0, "frames_expired": 0,
+                      "windows_classified": 0, "detections": 0, "alerts": 0}
+
+    async def start(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Bắt đầu phiên: thương lượng giao thức, mở session transcription
+        """
+        language = config.get("language", settings.default_language)
+        self.device_id = config.get("device_id") or self.sid
+        self.protocol = LiveProtocol(negotiate_protocol(config), settings.sample_rate)
+        self.stabilizer = ResultStabilizer(delta=config.get("interim") == "delta")
+        self.deadline_ms = config.get("deadline_ms")
+        # Chỉ frame binary-v1 tự mô tả sample rate nên client mới có thể đổi sample rate giữa phiên
+        self.flow = FlowController(settings.sample_rate, can_change_sample_rate=self.protocol.is_binary)
+        frame_params = self.flow.negotiate(config)
+
+        bytes_per_ms = settings.sample_rate * 2 / 1000
+        self._window_bytes = int(settings.ingest_classify_window_ms * bytes_per_ms) & ~1
+        self._hop_bytes = max(2, int(settings.ingest_classify_hop_ms * bytes_per_ms) & ~1)
+
+        self.session_id = await self.transcription_service.start_session(language)
+        return {
+            "status": "started",
+            "session_id": self.session_id,
+            "language": language,
+            "device_id": self.device_id,
+            "protocol": self.protocol.protocol,
+            "interim": "delta" if self.stabilizer.delta else "full",
+            "sound_alerts": self.classifier is not None,
+            **frame_params
+        }
+
+    async def process_frame(self, data: bytes):
+        """
+        Xử lý một frame audio từ client
+        """
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                frame = self.protocol.decode_audio(data)
+            except ProtocolError as e:
+                self.stats["frames_rejected"] += 1
+                await self._send("error", {"type": "error", "message": f"Frame không hợp lệ: {str(e)}"})
+                return
+            self._observe("decode", started)
+            self.stats["frames"] += 1
+
+            # Inference của stream được lập lịch theo thiết bị, với ưu tiên live
+            with work_context(self.device_id, LIVE):
+                await asyncio.gather(self._transcribe(frame), self._classify(frame))
+            self._observe("total", started)
+
+            adjustment = self.flow.observe(len(frame["pcm"]), time.perf_counter() - started, frame["capture_ts_us"])
+            if adjustment is not None:
+                await self._send("flow_control", adjustment)
+
+    async def _transcribe(self, frame: Dict[str, Any]):
+        # Chỉ nhánh caption bị ràng buộc bởi deadline; nhánh phát hiện âm thanh luôn chạy hết
+        with deadline_context(frame_deadline(frame["capture_ts_us"], self.deadline_ms)):
+            started = time.perf_counter()
+            try:
+                result = await self.transcription_service.process_audio_chunk(
+                    self.session_id, frame["pcm"], frame["seq"], frame["capture_ts_us"]
+                )
+                self._observe("stt", started)
+
+                if result and result["text"]:
+                    # Kiểm tra trước khi đưa vào stabilizer để trạng thái delta khớp với những gì client nhận
+                    check_deadline("emit")
+                    emitted = self.stabilizer.push(result, meta=frame)
+                    if emitted is not None:
+                        await self._send("transcription", self.protocol.transcription_message(emitted, frame))
+                    self.stabilizer.schedule_flush(self._send_transcription)
+            except DeadlineExceeded:
+                self.stats["frames_expired"] += 1
+
+    async def _classify(self, frame: Dict[str, Any]):
+        if self.classifier is None:
+            return
+
+        buffer = self._classify_buffer
+        buffer.extend(frame["pcm"])
+        if len(buffer) < self._window_bytes:
+            return
+
+        # Chỉ phân loại cửa sổ mới nhất - nếu bị chậm thì bỏ các cửa sổ cũ thay vì dồn việc
+        window = bytes(buffer[-self._window_bytes:])
+        keep = self._window_bytes - self._hop_bytes
+        del buffer[:len(buffer) - keep]
+
+        started = time.perf_counter()
+        detection = await self.classifier.detect_critical_sounds(window)
+        self._observe("classify", started)
+        self.stats["windows_classified"] += 1
+
+        # Mọi điểm critical của YAMNet và custom sound của thiết bị được đánh giá cùng lúc với profile
+        # của thiết bị (mỗi loại theo ngưỡng riêng - báo cháy không bị che bởi chuông cửa điểm cao hơn;
+        # điểm thấp kết thúc sự kiện đang diễn ra)
+        scores = dict(detection.get("scores", {}))
+        for match in detection.get("custom_matches", []):
+            scores[match["sound_type"]] = match["score"]
+        if not scores:
+            return
+
+        detected_at = frame["capture_ts_us"] / 1_000_000 if frame["capture_ts_us"] else time.time()
+        started = time.perf_counter()
+        result = await self.alert_service.evaluate_batch(
+            [self.device_id], [list(scores.values())], list(scores), detected_at=detected_at
+        )
+        self._observe("alert", started)
+        self.stats["detections"] += result["candidates"]
+        self.stats["alerts"] += result["triggered"]
+
+    async def _send_transcription(self, emitted: Dict[str, Any], frame: Dict[str, Any]):
+        await self._send("transcription", self.protocol.transcription_message(emitted, frame))
+
+    async def _send(self, event: str, message: Dict[str, Any]):
+        started = time.perf_counter()
+        await self.emit(event, self.protocol.encode_message(message))
+        self._observe("emit", started)
+
+    def _observe(self, stage: str, started: float):
+        self.stage_latency[stage].observe(time.perf_counter() - started)
+
+    async def stop(self) -> Optional[Dict[str, Any]]:
+        """
+        Kết thúc phiên transcription (nếu reaper chưa kết thúc nó)
+        """
+        async with self._lock:
+            if self.stabilizer is not None:
+                self.stabilizer.close()
+            if self.session_id and self.transcription_service.is_active(self.session_id):
+                return await self.transcription_service.end_session(self.session_id)
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "device_id": self.device_id,
+            **self.protocol.stats(),
+            **self.stats,
+            "flow": self.flow.get_stats()
+        }
+
+
+class IngestionManager:
+    """
+    Quản lý pipeline theo từng kết nối (sid) và gom thống kê độ trễ của các giai đoạn
+    """
+
+    def __init__(self, transcription_service, alert_service,
+                 classifier_factory: Optional[Callable[[], Awaitable]] = load_audio_classifier_async):
+        self.transcription_service = transcription_service
+        self.alert_service = alert_service
+        self.classifier_factory = classifier_factory
+        self._classifier = None
+        self._classifier_loaded = False
+        self._classifier_lock = asyncio.Lock()
+        self.pipelines = {}
+        self.stage_latency = {
+            stage: REGISTRY.register("ingest_stage_seconds", "Độ trễ từng giai đoạn của pipeline audio Socket.IO",
+                                     Histogram(), {"stage": stage})
+            for stage in STAGES
+        }
+        self.stats = {"pipelines_started": 0, "pipelines_stopped": 0, "frames_without_session": 0}
+        REGISTRY.gauge("ingest_active_pipelines", "Số kết nối Socket.IO đang gửi audio",
+                       function=lambda: len(self.pipelines))
+
+    async def get_classifier(self):
+        # Model chỉ được tải khi có kết nối đầu tiên (hoặc trong warm_up), ngoài event loop
+        if not self._classifier_loaded:
+            async with self._classifier_lock:
+                if not self._classifier_loaded:
+                    self._classifier = await self.classifier_factory() if self.classifier_factory else None
+                    self._classifier_loaded = True
+        return self._classifier
+
+    async def start(self, sid: str, config: Dict[str, Any], emit: Emitter) -> Dict[str, Any]:
+        if sid in self.pipelines:
+            await self.stop(sid)
+        pipeline = IngestionPipeline(
+            sid, emit, self.transcription_service, self.alert_service,
+            classifier=await self.get_classifier(), stage_latency=self.stage_latency
+        )
+        started = await pipeline.start(config)
+        self.pipelines[sid] = pipeline
+        self.stats["pipelines_started"] += 1
+        return started
+
+    async def feed(self, sid: str, data: bytes) -> bool:
+        pipeline = self.pipelines.get(sid)
+        if pipeline is None:
+            self.stats["frames_without_session"] += 1
+            return False
+        await pipeline.process_frame(data)
+        return True
+
+    async def stop(self, sid: str) -> Optional[Dict[str, Any]]:
+        pipeline = self.pipelines.pop(sid, None)
+        if pipeline is None:
+            return None
+        self.stats["pipelines_stopped"] += 1
+        result = await pipeline.stop()
+        return {**pipeline.get_stats(), "transcript": result}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_pipelines": len(self.pipelines),
+            "sound_alerts": self._classifier is not None,
+            **self.stats,
+            "stages": {stage: histogram.snapshot() for stage, histogram in self.stage_latency.items()},
+            "pipelines": [pipeline.get_stats() for pipeline in self.pipelines.values()]
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.core.config import settings
+
+class ResultStabilizer:
+    """
+    Ổn định kết quả interim của một phiên live transcription:
+    bỏ các partial trùng lặp, giới hạn tần suất gửi partial, gửi final ngay lập tức
+    và (tùy chọn) chỉ gửi phần text thay đổi so với giả thuyết client đã nhận.
+
+    Partial bị giới hạn tần suất không bị bỏ: partial mới nhất được giữ lại và gửi khi cửa sổ
+    giới hạn mở lại (flush / schedule_flush), để client không phải chờ tới final mới thấy giả thuyết mới.
+    """
+
+    def __init__(self, max_partial_rate: Optional[float] = None, delta: bool = False):
+        rate = settings.partial_max_rate_hz if max_partial_rate is None else max_partial_rate
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.delta = delta
+        self.acked_text = ""
+        self.last_partial_at = None
+        # (result, meta) của partial mới nhất bị giữ lại do giới hạn tần suất
+        self.pending = None
+        self._flush_task = None
+        self.stats = {
+            "partials_in": 0,
+            "partials_sent": 0,
+            "duplicates_dropped": 0,
+            "rate_limited": 0,
+            "finals_sent": 0,
+            "partials_flushed": 0,
+        }
+
+    def push(self, result: Dict[str, Any], now: Optional[float] = None, meta: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Nhận một kết quả từ STT, trả về kết quả cần gửi cho client hoặc None nếu bỏ qua.
+        meta (ví dụ frame của kết quả) được trả lại cho callback của schedule_flush.
+        """
+        text = result["text"]
+
+        if result["is_final"]:
+            self.pending = None
+            emitted = self._emit(result, text)
+            # Final kết thúc câu hiện tại - câu tiếp theo bắt đầu từ chuỗi rỗng
+            self.acked_text = ""
+            self.last_partial_at = None
+            self.stats["finals_sent"] += 1
+            return emitted
+
+        self.stats["partials_in"] += 1
+
+        if text == self.acked_text:
+            self.pending = None
+            self.stats["duplicates_dropped"] += 1
+            return None
+
+        now = time.monotonic() if now is None else now
+        if self.last_partial_at is not None and now - self.last_partial_at < self.min_interval:
+            self.pending = (result, meta)
+            self.stats["rate_limited"] += 1
+            return None
+
+        self.pending = None
+        return self._emit_partial(result, now)
+
+    def flush_delay(self, now: Optional[float] = None) -> Optional[float]:
+        """Số giây tới khi partial bị giữ lại được phép gửi (None nếu không có partial nào)"""
+        if self.pending is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.last_partial_at + self.min_interval - now)
+
+    def flush(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Trả về partial bị giữ lại nếu cửa sổ giới hạn tần suất đã mở lại, ngược lại None
+        """
+        now = time.monotonic() if now is None else now
+        delay = self.flush_delay(now)
+        if delay is None or delay > 0:
+            return None
+        result, _ = self.pending
+        self.pending = None
+        self.stats["partials_flushed"] += 1
+        return self._emit_partial(result, now)
+
+    def schedule_flush(self, send: Callable[[Dict[str, Any], Any], Awaitable[None]]):
+        """
+        Hẹn gửi partial bị giữ lại khi cửa sổ mở lại: send(emitted, meta) được gọi trong một task nền.
+        Gọi sau mỗi lần push; mỗi stabilizer chỉ có tối đa một task hẹn.
+        """
+        if self.pending is None or (self._flush_task is not None and not self._flush_task.done()):
+            return
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(send))
+
+    async def _flush_later(self, send: Callable[[Dict[str, Any], Any], Awaitable[None]]):
+        while True:
+            delay = self.flush_delay()
+            if delay is None:
+                # Partial đã bị thay bằng kết quả mới hơn được gửi ngay, hoặc bởi final
+                return
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            meta = self.pending[1]
+            emitted = self.flush()
+            try:
+                await send(emitted, meta)
+            except Exception as e:
+                print(f"⚠️ Không gửi được partial bị giữ lại: {e}")
+            return
+
+    def close(self):
+        """Hủy lần gửi đã hẹn (khi phiên kết thúc)"""
+        self.pending = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    def _emit_partial(self, result: Dict[str, Any], now: float) -> Dict[str, Any]:
+        text = result["text"]
+        emitted = self._emit(result, text)
+        self.acked_text = text
+        self.last_partial_at = now
+        self.stats["partials_sent"] += 1
+        return emitted
+
+    def _emit(self, result: Dict[str, Any], text: str) -> Dict[str, Any]:
+        emitted = {
+            "text": text,
+            "confidence": result["confidence"],
+            "is_final": result["is_final"]
+        }
+
+        if self.delta:
+            offset = _common_prefix_length(self.acked_text, text)
+            emitted["offset"] = offset
+            emitted["text"] = text[offset:]
+
+        return emitted
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
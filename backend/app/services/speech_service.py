@@ -1,96 +1,164 @@
 import asyncio
 import io
 import os
+import threading
+import time
 from typing import Dict, Any, Optional
-from google.cloud import speech
-import librosa
-import soundfile as sf
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, check_deadline, current_deadline, run_before_deadline
+from app.core.fair_scheduler import audio_cost, inference_scheduler
+from app.core.metrics import REGISTRY, FAST_LATENCY_BUCKETS
+
+AUDIO_DECODE_SECONDS = REGISTRY.histogram("audio_decode_seconds", "Thời gian đọc / giải mã audio", {"service": "speech"})
+GOOGLE_REQUEST_SECONDS = REGISTRY.histogram("google_speech_request_seconds", "Thời gian gọi Google Cloud Speech API", {"method": "recognize"})
+GOOGLE_ERRORS = REGISTRY.counter("google_speech_errors_total", "Số lần gọi Google Cloud Speech API bị lỗi", {"method": "recognize"})
+STREAM_CHUNK_SECONDS = REGISTRY.histogram("speech_stream_chunk_seconds", "Thời gian xử lý một chunk stream transcription",
+                                          buckets=FAST_LATENCY_BUCKETS)
 
 class SpeechService:
     def __init__(self):
-        self.client = None
-        self._initialize_client()
+        # Google client (và thư viện google-cloud-speech) chỉ được tạo ở lần dùng đầu tiên
+        # hoặc trong warm_up, để không làm chậm lúc khởi động
+        self._client = None
+        self._client_initialized = False
+        # warm_up (thread nền) và request đầu tiên không được cùng tạo client, cũng không được thấy
+        # client None trong lúc client đang được tạo
+        self._client_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        if not self._client_initialized:
+            with self._client_lock:
+                if not self._client_initialized:
+                    self._initialize_client()
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        with self._client_lock:
+            self._client = value
+            self._client_initialized = True
+    
+    def warm_up(self):
+        """
+        Nạp trước các thư viện nặng (librosa, Google client) - gọi trong thread nền lúc khởi động
+        """
+        import librosa  # noqa: F401
+        _ = self.client
     
     def _initialize_client(self):
-        """Khởi tạo Google Cloud Speech client"""
+        """Khởi tạo Google Cloud Speech client (gọi khi đang giữ _client_lock)"""
         try:
+            if settings.google_speech_endpoint:
+                # Endpoint thay thế (emulator cục bộ): kênh gRPC không TLS, không cần credentials
+                import grpc
+                from google.cloud import speech
+                from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+                
+                channel = grpc.insecure_channel(settings.google_speech_endpoint)
+                self._client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+                print(f"✅ Speech client targeting {settings.google_speech_endpoint}")
             # Kiểm tra nếu có credentials
-            if settings.google_credentials_path and os.path.exists(settings.google_credentials_path):
+            elif settings.google_credentials_path and os.path.exists(settings.google_credentials_path):
+                from google.cloud import speech
+                
                 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = settings.google_credentials_path
-                self.client = speech.SpeechClient()
+                self._client = speech.SpeechClient()
                 print("✅ Google Cloud Speech client initialized successfully")
             else:
+                # Không gán lại self._client: client có thể vừa được gán qua setter (benchmark, test)
                 print("⚠️ Google Cloud credentials not found - using mock mode")
-                self.client = None
         except Exception as e:
             print(f"❌ Error initializing Speech client: {e}")
-            self.client = None
+        # Chỉ đánh dấu sau khi _client đã được gán (hoặc chắc chắn là mock mode)
+        self._client_initialized = True
     
     async def transcribe_audio_file(self, file_path: str, language: str = "vi-VN") -> Dict[str, Any]:
         """
         Chuyển đổi file âm thanh thành văn bản
         """
         try:
-            # Đọc và xử lý file âm thanh
-            audio_data, sample_rate = librosa.load(file_path, sr=16000)
+            import librosa
             
-            # Nếu có Google Cloud client, sử dụng API thật
-            if self.client:
-                # Convert audio to bytes
-                audio_bytes = (audio_data * 32767).astype('int16').tobytes()
-                
-                # Configure recognition
-                config = speech.RecognitionConfig(
-                    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                    sample_rate_hertz=16000,
-                    language_code=language,
-                    enable_automatic_punctuation=True,
-                    model='latest_long'
-                )
+            # Chờ slot inference theo lịch công bằng giữa các tenant; phần nặng chạy trong thread
+            async with inference_scheduler.slot(audio_cost(os.path.getsize(file_path))):
+                # Đọc và xử lý file âm thanh
+                check_deadline("decode")
+                with AUDIO_DECODE_SECONDS.time():
+                    audio_data, sample_rate = await asyncio.to_thread(librosa.load, file_path, sr=16000)
                 
-                audio = speech.RecognitionAudio(content=audio_bytes)
-                
-                # Perform recognition
-                response = self.client.recognize(config=config, audio=audio)
-                
-                if response.results:
-                    # Get the first result
-                    result = response.results[0]
-                    transcript = result.alternatives[0].transcript
-                    confidence = result.alternatives[0].confidence
+                # Nếu có Google Cloud client, sử dụng API thật
+                if self.client:
+                    from google.cloud import speech
                     
-                    return {
-                        "transcription": transcript,
-                        "confidence": confidence,
-                        "language": language,
-                        "duration": len(audio_data) / sample_rate,
-                        "source": "google_cloud"
-                    }
+                    # Convert audio to bytes
+                    audio_bytes = (audio_data * 32767).astype('int16').tobytes()
+                    
+                    # Configure recognition
+                    config = speech.RecognitionConfig(
+                        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                        sample_rate_hertz=16000,
+                        language_code=language,
+                        enable_automatic_punctuation=True,
+                        model='latest_long'
+                    )
+                    
+                    audio = speech.RecognitionAudio(content=audio_bytes)
+                    
+                    # Perform recognition - deadline của request thành deadline của RPC
+                    check_deadline("google")
+                    deadline = current_deadline()
+                    try:
+                        with GOOGLE_REQUEST_SECONDS.time():
+                            response = await run_before_deadline("google", asyncio.to_thread(
+                                self.client.recognize, config=config, audio=audio,
+                                timeout=deadline.remaining() if deadline is not None else None
+                            ))
+                    except DeadlineExceeded:
+                        raise
+                    except Exception:
+                        GOOGLE_ERRORS.inc()
+                        raise
+                    
+                    if response.results:
+                        # Get the first result
+                        result = response.results[0]
+                        transcript = result.alternatives[0].transcript
+                        confidence = result.alternatives[0].confidence
+                        
+                        return {
+                            "transcription": transcript,
+                            "confidence": confidence,
+                            "language": language,
+                            "duration": len(audio_data) / sample_rate,
+                            "source": "google_cloud"
+                        }
+                    else:
+                        return {
+                            "transcription": "Không thể nhận diện được âm thanh",
+                            "confidence": 0.0,
+                            "language": language,
+                            "duration": len(audio_data) / sample_rate,
+                            "source": "google_cloud"
+                        }
+                
+                # Fallback to mock response
                 else:
+                    if language == "vi-VN":
+                        mock_transcription = "⚠️ DEMO MODE: Xin chào, đây là bản demo chuyển đổi giọng nói tiếng Việt thành văn bản."
+                    else:
+                        mock_transcription = "⚠️ DEMO MODE: Hello, this is a demo speech-to-text conversion."
+                    
                     return {
-                        "transcription": "Không thể nhận diện được âm thanh",
-                        "confidence": 0.0,
+                        "transcription": mock_transcription,
+                        "confidence": 0.95,
                         "language": language,
                         "duration": len(audio_data) / sample_rate,
-                        "source": "google_cloud"
+                        "source": "mock"
                     }
             
-            # Fallback to mock response
-            else:
-                if language == "vi-VN":
-                    mock_transcription = "⚠️ DEMO MODE: Xin chào, đây là bản demo chuyển đổi giọng nói tiếng Việt thành văn bản."
-                else:
-                    mock_transcription = "⚠️ DEMO MODE: Hello, this is a demo speech-to-text conversion."
-                
-                return {
-                    "transcription": mock_transcription,
-                    "confidence": 0.95,
-                    "language": language,
-                    "duration": len(audio_data) / sample_rate,
-                    "source": "mock"
-                }
-            
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi transcribe audio: {str(e)}")
     
@@ -98,32 +166,39 @@ class SpeechService:
         """
         Chuyển đổi real-time audio stream thành văn bản
         """
+        started = time.perf_counter()
         try:
-            if self.client:
-                # TODO: Implement streaming recognition
-                # config = speech.RecognitionConfig(...)
-                # streaming_config = speech.StreamingRecognitionConfig(...)
-                # requests = [speech.StreamingRecognizeRequest(audio_content=audio_chunk)]
-                # responses = self.client.streaming_recognize(streaming_config, requests)
-                
-                return {
-                    "text": "🔄 Đang xử lý streaming...",
-                    "confidence": 0.8,
-                    "is_final": False,
-                    "language": language,
-                    "source": "google_cloud_streaming"
-                }
-            else:
-                # Mock streaming transcription
-                return {
-                    "text": "⚠️ DEMO: Đang nghe...",
-                    "confidence": 0.8,
-                    "is_final": False,
-                    "language": language,
-                    "source": "mock"
-                }
+            check_deadline("stt")
+            async with inference_scheduler.slot(audio_cost(len(audio_chunk))):
+                if self.client:
+                    # TODO: Implement streaming recognition
+                    # config = speech.RecognitionConfig(...)
+                    # streaming_config = speech.StreamingRecognitionConfig(...)
+                    # requests = [speech.StreamingRecognizeRequest(audio_content=audio_chunk)]
+                    # responses = self.client.streaming_recognize(streaming_config, requests)
+                    
+                    return {
+                        "text": "🔄 Đang xử lý streaming...",
+                        "confidence": 0.8,
+                        "is_final": False,
+                        "language": language,
+                        "source": "google_cloud_streaming"
+                    }
+                else:
+                    # Mock streaming transcription
+                    return {
+                        "text": "⚠️ DEMO: Đang nghe...",
+                        "confidence": 0.8,
+                        "is_final": False,
+                        "language": language,
+                        "source": "mock"
+                    }
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi stream transcription: {str(e)}")
+        finally:
+            STREAM_CHUNK_SECONDS.observe(time.perf_counter() - started)
     
     async def check_service_status(self) -> bool:
         """
@@ -1,16 +1,45 @@
 import asyncio
 import json
+import os
+import sys
+import time
 import uuid
+from collections import OrderedDict, deque
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, check_deadline
+from app.core.fair_scheduler import audio_cost, inference_scheduler
+from app.core.metrics import REGISTRY, FAST_LATENCY_BUCKETS
+from app.services.audio_journal import AudioJournal
+
+CHUNK_SECONDS = REGISTRY.histogram("transcription_chunk_seconds", "Thời gian xử lý một chunk audio live",
+                                   buckets=FAST_LATENCY_BUCKETS)
+CHUNKS = REGISTRY.counter("transcription_chunks_total", "Số chunk audio live đã xử lý")
+CHUNK_BYTES = REGISTRY.counter("transcription_audio_bytes_total", "Tổng số byte audio live đã nhận")
 
 class TranscriptionService:
     def __init__(self):
         self.active_sessions = {}
-        self.session_history = []
+        # session_id -> session, cũ nhất ở đầu; bị giới hạn theo số lượng và tổng bytes
+        self.session_history = OrderedDict()
+        self.history_bytes = 0
+        self.sessions_expired = 0
+        self.sessions_evicted = 0
+        self._reaper_task = None
+        self._retention_task = None
+        self.audio_journal = AudioJournal() if settings.audio_journal_enabled else None
+        
+        REGISTRY.gauge("transcription_active_sessions", "Số phiên transcription đang hoạt động",
+                       function=lambda: len(self.active_sessions))
+        REGISTRY.gauge("transcription_history_sessions", "Số phiên đã kết thúc còn giữ trong bộ nhớ",
+                       function=lambda: len(self.session_history))
+        REGISTRY.gauge("transcription_history_bytes", "Dung lượng ước tính của lịch sử phiên",
+                       function=lambda: self.history_bytes)
+        REGISTRY.counter("transcription_sessions_expired_total", "Số phiên bị kết thúc do không hoạt động",
+                         function=lambda: self.sessions_expired)
     
-    async def start_session(self, language: str = "vi-VN", participants: List[str] = []) -> str:
+    async def start_session(self, language: str = "vi-VN", participants: List[str] = [], journal: bool = True) -> str:
         """
         Bắt đầu phiên transcription mới
         """
@@ -23,41 +52,59 @@ class TranscriptionService:
                 "participants": participants,
                 "start_time": datetime.now(),
                 "end_time": None,
-                "segments": [],
+                "segments": deque(maxlen=settings.session_max_segments),
+                "segments_dropped": 0,
+                "last_activity": time.monotonic(),
                 "status": "active"
             }
             
             self.active_sessions[session_id] = session
+            self._ensure_reaper()
+            
+            if journal and self.audio_journal is not None:
+                self.audio_journal.open_session(session_id, settings.sample_rate, language)
             
             return session_id
             
         except Exception as e:
             raise Exception(f"Lỗi tạo session: {str(e)}")
     
-    async def process_audio_chunk(self, session_id: str, audio_data: bytes) -> Dict[str, Any]:
+    async def process_audio_chunk(self, session_id: str, audio_data: bytes,
+                                  seq: Optional[int] = None, capture_ts_us: Optional[int] = None) -> Dict[str, Any]:
         """
         Xử lý chunk âm thanh và trả về transcription
         """
+        started = time.perf_counter()
         try:
             if session_id not in self.active_sessions:
                 raise Exception("Session không tồn tại")
             
             session = self.active_sessions[session_id]
+            session["last_activity"] = time.monotonic()
+            CHUNKS.inc()
+            CHUNK_BYTES.inc(len(audio_data))
+            
+            if self.audio_journal is not None:
+                self.audio_journal.append(session_id, audio_data, seq, capture_ts_us)
+            
+            # Audio vẫn được ghi journal ở trên; chỉ bỏ phần nhận dạng nếu caption đã quá hạn
+            check_deadline("stt")
             
             # Mock transcription processing
-            # Trong thực tế, đây sẽ gọi Google Cloud Speech API
-            mock_texts = [
-                "Xin chào, tôi đang nói tiếng Việt",
-                "Hôm nay thời tiết rất đẹp",
-                "Bạn có nghe thấy tôi không?",
-                "Đây là bản demo transcription",
-                "Hệ thống đang hoạt động tốt"
-            ]
-            
-            import random
-            text = random.choice(mock_texts)
-            confidence = round(random.uniform(0.8, 0.95), 2)
-            is_final = random.choice([True, False])
+            # Trong thực tế, đây sẽ gọi Google Cloud Speech API (qua slot của lịch công bằng)
+            async with inference_scheduler.slot(audio_cost(len(audio_data))):
+                mock_texts = [
+                    "Xin chào, tôi đang nói tiếng Việt",
+                    "Hôm nay thời tiết rất đẹp",
+                    "Bạn có nghe thấy tôi không?",
+                    "Đây là bản demo transcription",
+                    "Hệ thống đang hoạt động tốt"
+                ]
+                
+                import random
+                text = random.choice(mock_texts)
+                confidence = round(random.uniform(0.8, 0.95), 2)
+                is_final = random.choice([True, False])
             
             # Tạo segment mới
             segment = {
@@ -68,8 +115,10 @@ class TranscriptionService:
                 "speaker": None
             }
             
-            # Lưu segment nếu final
+            # Lưu segment nếu final (deque tự bỏ segment cũ nhất khi vượt giới hạn)
             if is_final:
+                if len(session["segments"]) == session["segments"].maxlen:
+                    session["segments_dropped"] += 1
                 session["segments"].append(segment)
             
             return {
@@ -79,8 +128,12 @@ class TranscriptionService:
                 "session_id": session_id
             }
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi xử lý audio chunk: {str(e)}")
+        finally:
+            CHUNK_SECONDS.observe(time.perf_counter() - started)
     
     async def end_session(self, session_id: str) -> Dict[str, Any]:
         """
@@ -90,26 +143,209 @@ class TranscriptionService:
             if session_id not in self.active_sessions:
                 raise Exception("Session không tồn tại")
             
-            session = self.active_sessions[session_id]
-            session["end_time"] = datetime.now()
-            session["status"] = "completed"
-            
-            # Tính duration
-            duration = (session["end_time"] - session["start_time"]).total_seconds()
-            session["duration"] = duration
-            
-            # Chuyển session sang history
-            self.session_history.append(session)
-            del self.active_sessions[session_id]
+            session = self._close_session(session_id, "completed")
             
             return {
                 "total_segments": len(session["segments"]),
-                "duration": duration
+                "duration": session["duration"]
             }
             
         except Exception as e:
             raise Exception(f"Lỗi kết thúc session: {str(e)}")
     
+    async def replay_session(self, session_id: str, speed: float = 0.0) -> Dict[str, Any]:
+        """
+        Đưa audio đã lưu trong journal của một session qua pipeline hiện tại.
+        speed = 0 chạy nhanh nhất có thể, speed = N chạy nhanh gấp N lần thời gian thực.
+        """
+        try:
+            if self.audio_journal is None:
+                raise Exception("Audio journal chưa được bật")
+            if not self.audio_journal.has_session(session_id):
+                raise Exception("Không có audio cho session này")
+            
+            meta = self.audio_journal.get_meta(session_id)
+            bytes_per_second = meta["sample_rate"] * meta["sample_width"]
+            replay_id = await self.start_session(meta["language"], journal=False)
+            self.active_sessions[replay_id]["replay_of"] = session_id
+            
+            frames = 0
+            audio_seconds = 0.0
+            started = time.perf_counter()
+            
+            try:
+                for frame in self.audio_journal.read_frames(session_id):
+                    await self.process_audio_chunk(replay_id, frame["pcm"], frame["seq"], frame["capture_ts_us"])
+                    frames += 1
+                    audio_seconds += len(frame["pcm"]) / bytes_per_second
+                    
+                    if speed > 0:
+                        # Giữ nhịp theo tốc độ yêu cầu
+                        ahead = audio_seconds / speed - (time.perf_counter() - started)
+                        if ahead > 0:
+                            await asyncio.sleep(ahead)
+                    elif frames % 100 == 0:
+                        # Nhường event loop cho các request khác
+                        await asyncio.sleep(0)
+            except BaseException:
+                # Lỗi / hủy giữa chừng: session replay không được ở lại trong active_sessions
+                if replay_id in self.active_sessions:
+                    self._close_session(replay_id, "failed")
+                raise
+            
+            wall_seconds = time.perf_counter() - started
+            result = await self.end_session(replay_id)
+            
+            return {
+                "replay_session_id": replay_id,
+                "source_session_id": session_id,
+                "frames": frames,
+                "audio_seconds": round(audio_seconds, 3),
+                "wall_seconds": round(wall_seconds, 3),
+                "realtime_factor": round(audio_seconds / wall_seconds, 1) if wall_seconds > 0 else None,
+                "total_segments": result["total_segments"]
+            }
+            
+        except Exception as e:
+            raise Exception(f"Lỗi replay session: {str(e)}")
+    
+    def is_active(self, session_id: str) -> bool:
+        return session_id in self.active_sessions
+    
+    def _close_session(self, session_id: str, status: str) -> Dict[str, Any]:
+        """Chuyển session từ active sang history"""
+        session = self.active_sessions.pop(session_id)
+        self._close_journal(session_id)
+        session["end_time"] = datetime.now()
+        session["status"] = status
+        
+        # Tính duration
+        duration = (session["end_time"] - session["start_time"]).total_seconds()
+        session["duration"] = duration
+        
+        session["approx_bytes"] = _estimate_session_bytes(session)
+        self.session_history[session_id] = session
+        self.history_bytes += session["approx_bytes"]
+        self._enforce_history_limits()
+        
+        return session
+    
+    def _close_journal(self, session_id: str):
+        """Đóng file journal của session; retention (quét đĩa, rmtree) chạy trong thread khi tới lượt"""
+        if self.audio_journal is None:
+            return
+        self.audio_journal.close_session(session_id)
+        if not self.audio_journal.retention_due():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.audio_journal.run_retention()
+            return
+        self._retention_task = loop.create_task(asyncio.to_thread(self.audio_journal.run_retention))
+    
+    def _enforce_history_limits(self):
+        """Bỏ (hoặc lưu trữ ra archive) các session cũ nhất khi history vượt giới hạn"""
+        while self.session_history and (
+            len(self.session_history) > settings.session_history_max_sessions or
+            self.history_bytes > settings.session_history_max_bytes
+        ):
+            _, oldest = self.session_history.popitem(last=False)
+            self.history_bytes -= oldest["approx_bytes"]
+            self.sessions_evicted += 1
+            if settings.session_archive_dir:
+                self._archive_session(oldest)
+    
+    def _archive_session(self, session: Dict[str, Any]):
+        """Ghi session bị đẩy khỏi history ra file JSONL trong archive"""
+        try:
+            os.makedirs(settings.session_archive_dir, exist_ok=True)
+            file_name = f"sessions-{session['start_time'].strftime('%Y%m%d')}.jsonl"
+            record = {
+                "session_id": session["session_id"],
+                "language": session["language"],
+                "participants": session["participants"],
+                "start_time": session["start_time"].isoformat(),
+                "end_time": session["end_time"].isoformat() if session["end_time"] else None,
+                "status": session["status"],
+                "duration": session.get("duration", 0),
+                "segments": [
+                    {**segment, "timestamp": segment["timestamp"].isoformat()}
+                    for segment in session["segments"]
+                ]
+            }
+            with open(os.path.join(settings.session_archive_dir, file_name), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error archiving session {session['session_id']}: {e}")
+    
+    def _ensure_reaper(self):
+        """Khởi động task dọn session idle nếu chưa chạy"""
+        if settings.session_idle_ttl_seconds <= 0:
+            return
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reaper_loop())
+    
+    async def _reaper_loop(self):
+        interval = max(1.0, settings.session_idle_ttl_seconds / 4)
+        while self.active_sessions:
+            await asyncio.sleep(interval)
+            self.reap_idle_sessions()
+    
+    async def stop_reaper(self):
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+    
+    def reap_idle_sessions(self, now: Optional[float] = None) -> List[str]:
+        """
+        Kết thúc các session không nhận audio quá TTL (client crash, quên gọi /end)
+        """
+        now = time.monotonic() if now is None else now
+        expired = [
+            session_id for session_id, session in self.active_sessions.items()
+            if now - session["last_activity"] > settings.session_idle_ttl_seconds
+        ]
+        for session_id in expired:
+            self._close_session(session_id, "expired")
+            self.sessions_expired += 1
+        return expired
+    
+    def get_memory_report(self) -> Dict[str, Any]:
+        """
+        Số session đang chạy và dung lượng bộ nhớ ước lượng của từng session
+        """
+        now = time.monotonic()
+        active = []
+        for session in self.active_sessions.values():
+            active.append({
+                "session_id": session["session_id"],
+                "idle_seconds": round(now - session["last_activity"], 1),
+                "segments": len(session["segments"]),
+                "segments_dropped": session["segments_dropped"],
+                "approx_bytes": _estimate_session_bytes(session)
+            })
+        
+        return {
+            "active_sessions": len(self.active_sessions),
+            "active_bytes": sum(item["approx_bytes"] for item in active),
+            "history_sessions": len(self.session_history),
+            "history_bytes": self.history_bytes,
+            "sessions_expired": self.sessions_expired,
+            "sessions_evicted": self.sessions_evicted,
+            "limits": {
+                "idle_ttl_seconds": settings.session_idle_ttl_seconds,
+                "max_segments": settings.session_max_segments,
+                "history_max_sessions": settings.session_history_max_sessions,
+                "history_max_bytes": settings.session_history_max_bytes
+            },
+            "sessions": active
+        }
+    
     async def get_session_transcript(self, session_id: str) -> Dict[str, Any]:
         """
         Lấy bản transcript đầy đủ của phiên
@@ -121,10 +357,7 @@ class TranscriptionService:
             if session_id in self.active_sessions:
                 session = self.active_sessions[session_id]
             else:
-                for hist_session in self.session_history:
-                    if hist_session["session_id"] == session_id:
-                        session = hist_session
-                        break
+                session = self.session_history.get(session_id)
             
             if not session:
                 raise Exception("Session không tồn tại")
@@ -157,7 +390,7 @@ class TranscriptionService:
         """
         try:
             # Combine active and history sessions
-            all_sessions = list(self.active_sessions.values()) + self.session_history
+            all_sessions = list(self.active_sessions.values()) + list(self.session_history.values())
             
             # Sort by start time (newest first)
             all_sessions.sort(key=lambda x: x["start_time"], reverse=True)
@@ -190,13 +423,14 @@ class TranscriptionService:
             # Xóa từ active sessions
             if session_id in self.active_sessions:
                 del self.active_sessions[session_id]
+                self._close_journal(session_id)
                 return True
             
             # Xóa từ history
-            for i, session in enumerate(self.session_history):
-                if session["session_id"] == session_id:
-                    del self.session_history[i]
-                    return True
+            session = self.session_history.pop(session_id, None)
+            if session is not None:
+                self.history_bytes -= session["approx_bytes"]
+                return True
             
             return False
             
@@ -229,4 +463,14 @@ class TranscriptionService:
             return file_path
             
         except Exception as e:
-            raise Exception(f"Lỗi export transcript: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Lỗi export transcript: {str(e)}") 
+
+
+def _estimate_session_bytes(session: Dict[str, Any]) -> int:
+    """Ước lượng bộ nhớ của một session (dict, segments và text) theo sys.getsizeof"""
+    total = sys.getsizeof(session) + sys.getsizeof(session["segments"])
+    for segment in session["segments"]:
+        total += sys.getsizeof(segment) + sys.getsizeof(segment["text"]) + 96  # datetime + float + bool
+    for participant in session["participants"]:
+        total += sys.getsizeof(participant)
+    return total
@@ -0,0 +1,453 @@
+"""
+Chỉ mục ontology của các class YAMNet (AudioSet), nạp một lần cho mỗi AudioClassifierService.
+
+- id <-> tên <-> vị trí trong vector output 521 chiều của model
+- quan hệ cha / con và bao đóng tổ tiên / con cháu (ontology AudioSet là DAG: một class có thể có nhiều cha)
+- chỉ mục token theo tiền tố trên tên class, cho việc tìm kiếm / phân trang danh sách class
+- ma trận rollup tính sẵn: hàng i đánh dấu các class output là con cháu (hoặc chính) node i, nên điểm
+  của các nhóm rộng như "Alarm" hay "Siren" có được từ một phép tính vector hóa trên output của model
+
+Nguồn dữ liệu:
+- settings.yamnet_class_map_path: yamnet_class_map.csv (index,mid,display_name) - đi kèm model trên TF Hub
+- settings.audioset_ontology_path: ontology.json của AudioSet (id, name, child_ids)
+Thiếu file thì dùng danh sách class của service và cây phân cấp rút gọn DEFAULT_HIERARCHY
+(id của node khi đó là tên đã chuẩn hóa).
+"""
+import bisect
+import csv
+import json
+import os
+import re
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Cây phân cấp rút gọn theo ontology AudioSet: (cha, [các con]) theo tên hiển thị
+DEFAULT_HIERARCHY: List[Tuple[str, List[str]]] = [
+    ("Human sounds", ["Human voice", "Whistling", "Respiratory sounds", "Human locomotion", "Digestive", "Hands",
+                      "Heart sounds, heartbeat", "Human group actions"]),
+    ("Human voice", ["Speech", "Shout", "Screaming", "Whispering", "Laughter", "Crying, sobbing", "Wail, moan",
+                     "Sigh", "Singing", "Humming", "Groan", "Grunt"]),
+    ("Speech", ["Child speech, kid speaking", "Conversation", "Narration, monologue", "Babbling",
+                "Speech synthesizer"]),
+    ("Shout", ["Bellow", "Whoop", "Yell", "Battle cry", "Children shouting"]),
+    ("Laughter", ["Baby laughter", "Giggle", "Snicker", "Belly laugh", "Chuckle, chortle"]),
+    ("Crying, sobbing", ["Baby cry, infant cry", "Whimper"]),
+    ("Singing", ["Choir", "Yodeling", "Chant", "Male singing", "Female singing", "Child singing",
+                 "Synthetic singing", "Rapping"]),
+    ("Chant", ["Mantra"]),
+    ("Respiratory sounds", ["Breathing", "Cough", "Sneeze", "Sniff"]),
+    ("Breathing", ["Wheeze", "Snoring", "Gasp", "Pant", "Snort"]),
+    ("Cough", ["Throat clearing"]),
+    ("Human locomotion", ["Run", "Shuffle", "Walk, footsteps"]),
+    ("Digestive", ["Chewing, mastication", "Biting", "Gargling", "Stomach rumble", "Burping, eructation",
+                   "Hiccup", "Fart"]),
+    ("Hands", ["Finger snapping", "Clapping"]),
+    ("Heart sounds, heartbeat", ["Heart murmur"]),
+    ("Human group actions", ["Cheering", "Applause", "Chatter", "Crowd", "Hubbub, speech noise, speech babble",
+                             "Children playing"]),
+
+    ("Animal", ["Domestic animals, pets", "Livestock, farm animals, working animals", "Wild animals"]),
+    ("Domestic animals, pets", ["Dog", "Cat"]),
+    ("Dog", ["Bark", "Yip", "Howl", "Bow-wow", "Growling", "Whimper (dog)"]),
+    ("Cat", ["Purr", "Meow", "Hiss", "Caterwaul"]),
+    ("Livestock, farm animals, working animals", ["Horse", "Cattle, bovine", "Pig", "Goat", "Sheep", "Fowl"]),
+    ("Horse", ["Clip-clop", "Neigh, whinny"]),
+    ("Cattle, bovine", ["Moo", "Cowbell"]),
+    ("Pig", ["Oink"]),
+    ("Goat", ["Bleat"]),
+    ("Sheep", ["Bleat"]),
+    ("Fowl", ["Chicken, rooster", "Turkey", "Duck", "Goose"]),
+    ("Chicken, rooster", ["Cluck", "Crowing, cock-a-doodle-doo"]),
+    ("Turkey", ["Gobble"]),
+    ("Duck", ["Quack"]),
+    ("Goose", ["Honk"]),
+    ("Wild animals", ["Roaring cats (lions, tigers)", "Bird", "Canidae, dogs, wolves", "Rodents, rats, mice",
+                      "Insect", "Frog", "Snake", "Whale vocalization"]),
+    ("Roaring cats (lions, tigers)", ["Roar"]),
+    ("Bird", ["Bird vocalization, bird call, bird song", "Pigeon, dove", "Crow", "Owl",
+              "Bird flight, flapping wings"]),
+    ("Bird vocalization, bird call, bird song", ["Chirp, tweet", "Squawk"]),
+    ("Pigeon, dove", ["Coo"]),
+    ("Crow", ["Caw"]),
+    ("Owl", ["Hoot"]),
+    ("Rodents, rats, mice", ["Mouse", "Patter"]),
+    ("Insect", ["Cricket", "Mosquito", "Fly, housefly", "Bee, wasp, etc."]),
+    ("Fly, housefly", ["Buzz"]),
+    ("Frog", ["Croak"]),
+    ("Snake", ["Rattle"]),
+
+    ("Music", ["Musical instrument", "Music genre", "Music mood"]),
+    ("Musical instrument", ["Plucked string instrument", "Keyboard (musical)", "Percussion", "Orchestra",
+                            "Brass instrument", "Wind instrument, woodwind instrument", "Harp", "Bell", "Harmonica",
+                            "Accordion", "Bagpipes", "Didgeridoo", "Shofar", "Theremin", "Singing bowl",
+                            "Scratching (performance technique)"]),
+    ("Plucked string instrument", ["Guitar", "Banjo", "Sitar", "Mandolin", "Zither", "Ukulele"]),
+    ("Guitar", ["Electric guitar", "Bass guitar", "Acoustic guitar", "Steel guitar, slide guitar",
+                "Tapping (guitar technique)", "Strum"]),
+    ("Keyboard (musical)", ["Piano", "Organ", "Synthesizer", "Harpsichord"]),
+    ("Piano", ["Electric piano"]),
+    ("Organ", ["Electronic organ", "Hammond organ"]),
+    ("Synthesizer", ["Sampler"]),
+    ("Percussion", ["Drum kit", "Drum", "Cymbal", "Wood block", "Tambourine", "Rattle (instrument)", "Gong",
+                    "Tubular bells", "Mallet percussion"]),
+    ("Drum kit", ["Drum machine"]),
+    ("Drum", ["Snare drum", "Bass drum", "Timpani", "Tabla"]),
+    ("Snare drum", ["Rimshot", "Drum roll"]),
+    ("Cymbal", ["Hi-hat"]),
+    ("Rattle (instrument)", ["Maraca"]),
+    ("Mallet percussion", ["Marimba, xylophone", "Glockenspiel", "Vibraphone", "Steelpan"]),
+    ("Brass instrument", ["French horn", "Trumpet", "Trombone", "Bugle"]),
+    ("Wind instrument, woodwind instrument", ["Flute", "Saxophone", "Clarinet"]),
+    ("Bell", ["Church bell", "Jingle bell", "Bicycle bell", "Tuning fork", "Chime",
+              "Change ringing (campanology)"]),
+    ("Chime", ["Wind chime"]),
+    ("Music genre", ["Pop music", "Hip hop music", "Rock music", "Rhythm and blues", "Soul music", "Reggae",
+                     "Country", "Swing music", "Bluegrass", "Funk", "Disco", "Classical music",
+                     "Electronic music", "Music of Latin America", "Blues", "Music of Africa", "Traditional music",
+                     "Middle Eastern music", "Music of Asia", "Gospel music", "Ska", "Ballad", "Wedding music"]),
+    ("Hip hop music", ["Beatboxing"]),
+    ("Rock music", ["Heavy metal", "Punk rock", "Grunge", "Progressive rock", "Rock and roll",
+                    "Psychedelic rock"]),
+    ("Classical music", ["Opera"]),
+    ("Electronic music", ["House music", "Techno", "Dubstep", "Drum and bass", "Electronica",
+                          "Electronic dance music", "Ambient music", "Trance music"]),
+    ("Music of Latin America", ["Salsa music", "Flamenco"]),
+    ("Music of Africa", ["Afrobeat"]),
+    ("Music of Asia", ["Indian classical music", "Carnatic music", "Music of Bollywood"]),
+    ("Music mood", ["Happy music", "Funny music", "Sad music", "Tender music", "Exciting music", "Angry music",
+                    "Scary music"]),
+
+    ("Natural sounds", ["Wind", "Thunderstorm", "Water", "Fire"]),
+    ("Wind", ["Rustling leaves", "Wind noise (microphone)"]),
+    ("Thunderstorm", ["Thunder"]),
+    ("Water", ["Rain", "Stream", "Waterfall", "Ocean", "Steam", "Gurgling"]),
+    ("Rain", ["Raindrop", "Rain on surface"]),
+    ("Ocean", ["Waves, surf"]),
+    ("Fire", ["Crackle"]),
+
+    ("Sounds of things", ["Vehicle", "Engine", "Domestic sounds, home sounds", "Bell", "Alarm", "Tools"]),
+    ("Vehicle", ["Boat, Water vehicle", "Motor vehicle (road)", "Rail transport", "Aircraft", "Bicycle",
+                 "Skateboard"]),
+    ("Boat, Water vehicle", ["Sailboat, sailing ship", "Rowboat, canoe, kayak", "Motorboat, speedboat", "Ship"]),
+    ("Motor vehicle (road)", ["Car", "Truck", "Bus", "Emergency vehicle", "Motorcycle",
+                              "Traffic noise, roadway noise"]),
+    ("Car", ["Vehicle horn, car horn, honking", "Car alarm", "Power windows, electric windows", "Skidding",
+             "Tire squeal", "Car passing by", "Race car, auto racing"]),
+    ("Vehicle horn, car horn, honking", ["Toot"]),
+    ("Truck", ["Air brake", "Air horn, truck horn", "Reversing beeps", "Ice cream truck, ice cream van"]),
+    ("Emergency vehicle", ["Police car (siren)", "Ambulance (siren)", "Fire engine, fire truck (siren)"]),
+    ("Rail transport", ["Train", "Railroad car, train wagon", "Train wheels squealing",
+                        "Subway, metro, underground"]),
+    ("Train", ["Train whistle", "Train horn"]),
+    ("Aircraft", ["Aircraft engine", "Helicopter", "Fixed-wing aircraft, airplane"]),
+    ("Aircraft engine", ["Jet engine", "Propeller, airscrew"]),
+    ("Engine", ["Light engine (high frequency)", "Lawn mower", "Chainsaw", "Medium engine (mid frequency)",
+                "Heavy engine (low frequency)", "Engine knocking", "Engine starting", "Idling",
+                "Accelerating, revving, vroom"]),
+    ("Light engine (high frequency)", ["Dental drill, dentist's drill"]),
+    ("Domestic sounds, home sounds", ["Door", "Cupboard open or close", "Drawer open or close",
+                                      "Dishes, pots, and pans", "Cutlery, silverware", "Chopping (food)",
+                                      "Frying (food)", "Microwave oven", "Blender", "Water tap, faucet",
+                                      "Sink (filling or washing)", "Bathtub (filling or washing)", "Hair dryer",
+                                      "Toilet flush", "Toothbrush", "Vacuum cleaner", "Zipper (clothing)",
+                                      "Keys jangling", "Coin (dropping)", "Scissors",
+                                      "Electric shaver, electric razor", "Shuffling cards", "Typing", "Writing"]),
+    ("Door", ["Doorbell", "Sliding door", "Slam", "Knock", "Tap", "Squeak"]),
+    ("Doorbell", ["Ding-dong"]),
+    ("Toothbrush", ["Electric toothbrush"]),
+    ("Typing", ["Typewriter", "Computer keyboard"]),
+    ("Alarm", ["Telephone", "Alarm clock", "Siren", "Doorbell", "Buzzer", "Smoke detector, smoke alarm",
+               "Fire alarm", "Foghorn", "Car alarm", "Reversing beeps"]),
+    ("Telephone", ["Telephone bell ringing", "Ringtone", "Telephone dialing, DTMF", "Dial tone", "Busy signal"]),
+    ("Siren", ["Civil defense siren", "Police car (siren)", "Ambulance (siren)", "Fire engine, fire truck (siren)",
+               "Screaming siren", "Air raid siren"]),
+    ("Smoke detector, smoke alarm", ["Smoke detector beep"]),
+    ("Tools", ["Jackhammer", "Dental drill"]),
+
+    ("Channel, environment and background", ["Acoustic environment", "Noise", "Sound reproduction"]),
+    ("Acoustic environment", ["Reverb", "Echo"]),
+    ("Noise", ["Environmental noise", "Static", "Mains hum", "Distortion", "Sidetone", "Cacophony",
+               "White noise", "Pink noise", "Throbbing", "Vibration"]),
+    ("Sound reproduction", ["Television", "Radio", "Field recording"]),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def slugify(name: str) -> str:
+    return "_".join(tokenize(name))
+
+
+class OntologyIndex:
+    """
+    Chỉ mục bất biến của ontology: tạo một lần, dùng chung cho mọi lời gọi (chỉ đọc)
+    """
+
+    def __init__(self, class_ids: Sequence[str], class_names: Sequence[str], nodes: Iterable[Dict[str, Any]]):
+        self.num_classes = len(class_ids)
+        self.class_ids = list(class_ids)
+        self.class_names = list(class_names)
+
+        # id -> {"id", "name", "children", "parents", "index"}; index = vị trí trong output (None nếu không phải class)
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        for node in nodes:
+            self.nodes[node["id"]] = {"id": node["id"], "name": node["name"], "children": list(node.get("child_ids", [])),
+                                      "parents": [], "index": None}
+        for index, (class_id, name) in enumerate(zip(self.class_ids, self.class_names)):
+            node = self.nodes.setdefault(class_id, {"id": class_id, "name": name, "children": [], "parents": [],
+                                                    "index": None})
+            node["index"] = index
+        for node_id, node in self.nodes.items():
+            node["children"] = [child for child in node["children"] if child in self.nodes]
+            for child in node["children"]:
+                self.nodes[child]["parents"].append(node_id)
+
+        self._by_name = {}
+        for node_id, node in self.nodes.items():
+            # Tên trùng: ưu tiên node là class output
+            key = node["name"].lower()
+            if key not in self._by_name or node["index"] is not None:
+                self._by_name[key] = node_id
+
+        self._descendants = {}
+        for node_id in self.nodes:
+            self._collect_descendants(node_id)
+        self._ancestors = {node_id: set() for node_id in self.nodes}
+        for node_id, descendants in self._descendants.items():
+            for descendant in descendants:
+                if descendant != node_id:
+                    self._ancestors[descendant].add(node_id)
+
+        self._build_search_index()
+        self._build_rollup()
+        self._group_cache = {}
+
+    def _collect_descendants(self, root: str) -> frozenset:
+        # DFS hậu thứ tự không đệ quy; node đã tính xong được dùng lại (ontology là DAG)
+        stack, visiting = [(root, False)], set()
+        while stack:
+            node_id, expanded = stack.pop()
+            if node_id in self._descendants:
+                continue
+            children = self.nodes[node_id]["children"]
+            if not expanded:
+                if node_id in visiting:
+                    continue
+                visiting.add(node_id)
+                stack.append((node_id, True))
+                stack.extend((child, False) for child in children
+                             if child not in self._descendants and child not in visiting)
+                continue
+            closure = {node_id}
+            for child in children:
+                # Chu trình (ontology lỗi) - bỏ qua cạnh quay lại
+                closure |= self._descendants.get(child, {child})
+            self._descendants[node_id] = frozenset(closure)
+        return self._descendants[root]
+
+    def _build_search_index(self):
+        postings = {}
+        for node_id, node in self.nodes.items():
+            for token in tokenize(node["name"]):
+                postings.setdefault(token, set()).add(node_id)
+        self._tokens = sorted(postings)
+        self._postings = postings
+
+    def _build_rollup(self):
+        # Chỉ các node có ít nhất một class output trong bao đóng mới có hàng trong ma trận
+        self.rollup_ids = [node_id for node_id in self.nodes if self.class_indices(node_id).size]
+        self.rollup_row = {node_id: row for row, node_id in enumerate(self.rollup_ids)}
+        self.rollup_matrix = np.zeros((len(self.rollup_ids), self.num_classes), dtype=np.float32)
+        for row, node_id in enumerate(self.rollup_ids):
+            self.rollup_matrix[row, self.class_indices(node_id)] = 1.0
+
+    # --- Tra cứu ---
+
+    def resolve(self, key: str) -> Optional[str]:
+        """id node, hoặc tên hiển thị (không phân biệt hoa thường)"""
+        if key in self.nodes:
+            return key
+        return self._by_name.get(key.lower())
+
+    def class_indices(self, node_id: str) -> np.ndarray:
+        """Vị trí trong output của mọi class thuộc node (chính nó và con cháu)"""
+        indices = [self.nodes[d]["index"] for d in self._descendants[node_id] if self.nodes[d]["index"] is not None]
+        return np.array(sorted(indices), dtype=np.int64)
+
+    def descendants(self, node_id: str) -> frozenset:
+        return self._descendants[node_id] - {node_id}
+
+    def ancestors(self, node_id: str) -> frozenset:
+        return frozenset(self._ancestors[node_id])
+
+    def describe(self, node_id: str) -> Dict[str, Any]:
+        node = self.nodes[node_id]
+        return {
+            "id": node_id,
+            "name": node["name"],
+            "index": node["index"],
+            "parents": [self.nodes[parent]["name"] for parent in node["parents"]],
+            "children": len(node["children"]),
+        }
+
+    # --- Tìm kiếm ---
+
+    def _prefix_matches(self, prefix: str) -> set:
+        matches = set()
+        start = bisect.bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._postings[token]
+        return matches
+
+    def search(self, query: Optional[str] = None, parent: Optional[str] = None,
+               classes_only: bool = True) -> List[str]:
+        """
+        Node khớp mọi token của query theo tiền tố ("fire al" khớp "Fire alarm"), nằm dưới parent nếu có.
+        Sắp xếp: trùng tên, tên bắt đầu bằng query, rồi theo thứ tự output của model.
+        """
+        if parent is not None:
+            parent_id = self.resolve(parent)
+            if parent_id is None:
+                return []
+            candidates = set(self.descendants(parent_id))
+        else:
+            candidates = set(self.nodes)
+
+        tokens = tokenize(query) if query else []
+        for token in tokens:
+            candidates &= self._prefix_matches(token)
+            if not candidates:
+                return []
+        if classes_only:
+            candidates = {node_id for node_id in candidates if self.nodes[node_id]["index"] is not None}
+
+        needle = (query or "").strip().lower()
+
+        def rank(node_id):
+            node = self.nodes[node_id]
+            name = node["name"].lower()
+            index = node["index"] if node["index"] is not None else self.num_classes
+            if not needle:
+                return (0, index, name)
+            return (0 if name == needle else 1 if name.startswith(needle) else 2, index, name)
+
+        return sorted(candidates, key=rank)
+
+    def page(self, query: Optional[str] = None, parent: Optional[str] = None, offset: int = 0, limit: int = 50,
+             classes_only: bool = True) -> Dict[str, Any]:
+        matches = self.search(query, parent, classes_only)
+        return {
+            "total": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "items": [self.describe(node_id) for node_id in matches[offset:offset + limit]],
+        }
+
+    # --- Rollup điểm số ---
+
+    def group_matrix(self, groups: Dict[str, Sequence[str]]) -> Tuple[List[str], np.ndarray]:
+        """
+        Ma trận rollup cho các nhóm tự định nghĩa (mỗi nhóm = hợp của nhiều node), được cache.
+        Tên / id không có trong ontology bị bỏ qua.
+        """
+        cache_key = tuple((name, tuple(members)) for name, members in groups.items())
+        cached = self._group_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        matrix = np.zeros((len(groups), self.num_classes), dtype=np.float32)
+        for row, members in enumerate(groups.values()):
+            for member in members:
+                node_id = self.resolve(member)
+                if node_id is not None and node_id in self.rollup_row:
+                    np.maximum(matrix[row], self.rollup_matrix[self.rollup_row[node_id]], out=matrix[row])
+        result = (list(groups), matrix)
+        self._group_cache[cache_key] = result
+        return result
+
+    @staticmethod
+    def apply(matrix: np.ndarray, scores: np.ndarray, mode: str = "max") -> np.ndarray:
+        """
+        scores: [số class] hoặc [số frame, số class] -> [số nhóm] hoặc [số frame, số nhóm].
+        max: điểm của nhóm = điểm cao nhất trong các class của nhóm (điểm YAMNet là sigmoid độc lập);
+        sum: tổng điểm, cắt ở 1 (một phép nhân ma trận).
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if mode == "sum":
+            return np.minimum(scores @ matrix.T, 1.0)
+        return (scores[..., None, :] * matrix).max(axis=-1)
+
+    def rollup(self, scores: np.ndarray, nodes: Optional[Sequence[str]] = None, mode: str = "max") -> Dict[str, float]:
+        """Điểm của các node (mặc định: mọi node có class) từ một vector output, theo tên node"""
+        if nodes is None:
+            names, matrix = [self.nodes[node_id]["name"] for node_id in self.rollup_ids], self.rollup_matrix
+        else:
+            names, matrix = self.group_matrix({node: [node] for node in nodes})
+        return dict(zip(names, self.apply(matrix, scores, mode).tolist()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "classes": self.num_classes,
+            "nodes": len(self.nodes),
+            "rollup_nodes": len(self.rollup_ids),
+            "tokens": len(self._tokens),
+            "roots": sum(1 for node in self.nodes.values() if not node["parents"]),
+        }
+
+
+def _read_class_map(path: str) -> Tuple[List[str], List[str]]:
+    class_ids, class_names = [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            class_ids.append(row["mid"])
+            class_names.append(row["display_name"])
+    return class_ids, class_names
+
+
+def _default_nodes(class_ids: Sequence[str], class_names: Sequence[str]) -> List[Dict[str, Any]]:
+    # Node trùng tên với class output dùng id của class, các node nhóm còn lại dùng tên chuẩn hóa
+    ids = {name.lower(): class_id for class_id, name in zip(class_ids, class_names)}
+    nodes = {}
+    for parent, children in DEFAULT_HIERARCHY:
+        parent_id = ids.get(parent.lower(), slugify(parent))
+        node = nodes.setdefault(parent_id, {"id": parent_id, "name": parent, "child_ids": []})
+        for child in children:
+            child_id = ids.get(child.lower(), slugify(child))
+            nodes.setdefault(child_id, {"id": child_id, "name": child, "child_ids": []})
+            if child_id not in node["child_ids"]:
+                node["child_ids"].append(child_id)
+    return list(nodes.values())
+
+
+def load_ontology(class_names: Optional[Sequence[str]] = None, class_map_path: Optional[str] = None,
+                  ontology_path: Optional[str] = None) -> OntologyIndex:
+    """
+    Tạo OntologyIndex từ class map / ontology.json nếu có, ngược lại từ class_names + DEFAULT_HIERARCHY
+    """
+    try:
+        has_class_map = bool(class_map_path and os.path.exists(class_map_path))
+        if has_class_map:
+            class_ids, class_names = _read_class_map(class_map_path)
+        else:
+            class_names = list(class_names or [])
+            class_ids = [slugify(name) for name in class_names]
+
+        if ontology_path and os.path.exists(ontology_path):
+            with open(ontology_path, encoding="utf-8") as f:
+                nodes = [{"id": node["id"], "name": node["name"], "child_ids": node.get("child_ids", [])}
+                         for node in json.load(f)]
+            if not has_class_map:
+                # Không có class map: ghép class với node của ontology theo tên
+                by_name = {node["name"].lower(): node["id"] for node in nodes}
+                class_ids = [by_name.get(name.lower(), class_id) for class_id, name in zip(class_ids, class_names)]
+        else:
+            nodes = _default_nodes(class_ids, class_names)
+
+        return OntologyIndex(class_ids, class_names, nodes)
+    except Exception as e:
+        raise Exception(f"Lỗi nạp ontology YAMNet: {str(e)}")
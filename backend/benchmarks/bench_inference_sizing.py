@@ -0,0 +1,199 @@
+"""
+Chọn cấu hình inference executor cho host hiện tại.
+
+Với mỗi cách chia (số worker x thread intra-op x thread inter-op), một process con được chạy với
+biến môi trường thread tương ứng (phải đặt trước khi import numpy / TensorFlow), tạo InferenceExecutor
+và gửi liên tục cửa sổ audio 0.975s vào trong --duration giây. Kết quả: throughput (cửa sổ/giây) và
+độ trễ p50 / p95. Cấu hình được đề xuất là cấu hình có throughput cao nhất mà p95 vẫn dưới
+--target-p95-ms (mặc định bằng bước trượt của cửa sổ phân loại live).
+
+Workload:
+- proxy (mặc định): spectrogram log-mel + vài lớp dense bằng numpy, khối lượng tính gần với YAMNet
+- yamnet: model thật từ settings.yamnet_model_url (cần tensorflow và tensorflow_hub)
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.bench_inference_sizing
+    python -m benchmarks.bench_inference_sizing --model yamnet --duration 10 -o bench-results/sizing.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WINDOW_SAMPLES = 15600  # 0.975s ở 16kHz - một khung của YAMNet
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS")
+
+
+def candidate_configs(cpus: int, with_inter_op: bool):
+    """Các cách chia CPU giữa số worker và thread intra-op (tổng không vượt quá số CPU)"""
+    worker_counts = sorted({w for w in (1, 2, 4, 8, 16, 32) if w <= cpus} | {cpus})
+    configs = []
+    for workers in worker_counts:
+        for intra in sorted({max(1, cpus // workers), 1}):
+            for inter in ((1, 2) if with_inter_op else (1,)):
+                configs.append({"workers": workers, "intra_op_threads": intra, "inter_op_threads": inter})
+    return configs
+
+
+def _proxy_model():
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    window = np.hanning(400).astype(np.float32)
+    mel_basis = rng.random((257, 64), dtype=np.float32)
+    layers = [rng.standard_normal(shape, dtype=np.float32) * 0.05 for shape in ((64, 512), (512, 1024), (1024, 521))]
+
+    def predict(waveform):
+        frames = np.lib.stride_tricks.sliding_window_view(waveform, 400)[::160] * window
+        spectrogram = np.abs(np.fft.rfft(frames, n=512)).astype(np.float32)
+        hidden = np.log(spectrogram @ mel_basis + 1e-3)
+        for weights in layers:
+            hidden = np.maximum(hidden @ weights, 0)
+        return hidden.mean(axis=0)
+
+    return predict
+
+
+def _yamnet_model(executor):
+    import tensorflow as tf
+    import tensorflow_hub as hub
+    from app.core.config import settings
+
+    executor.configure_tensorflow(tf)
+    model = hub.load(settings.yamnet_model_url)
+    return lambda waveform: model(waveform)[0].numpy()
+
+
+async def _drive(executor, predict, duration: float, concurrency: int):
+    import asyncio
+    import numpy as np
+
+    waveform = np.random.default_rng(1).standard_normal(WINDOW_SAMPLES).astype(np.float32) * 0.1
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await executor.run(predict, waveform)
+            latencies.append(time.perf_counter() - t0)
+
+    # Khởi động: lần chạy đầu có chi phí khởi tạo
+    await executor.run(predict, waveform)
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+def run_child(args):
+    import asyncio
+    from app.core.inference_executor import InferenceExecutor
+    from benchmarks.bench_suite import summarize
+
+    executor = InferenceExecutor(args.workers, args.intra, args.inter, args.cpu_affinity or "")
+    predict = _yamnet_model(executor) if args.model == "yamnet" else _proxy_model()
+    # Mỗi worker luôn có một việc đang chờ để đo throughput bão hòa
+    latencies, elapsed = asyncio.run(_drive(executor, predict, args.duration, args.workers * 2))
+    executor.shutdown()
+    print(json.dumps(summarize(latencies, elapsed)))
+
+
+def measure(config: dict, args) -> dict:
+    env = dict(os.environ)
+    for name in THREAD_ENV:
+        env[name] = str(config["intra_op_threads"])
+    env["TF_NUM_INTEROP_THREADS"] = str(config["inter_op_threads"])
+    command = [
+        sys.executable, "-m", "benchmarks.bench_inference_sizing", "--child",
+        "--workers", str(config["workers"]), "--intra", str(config["intra_op_threads"]),
+        "--inter", str(config["inter_op_threads"]), "--duration", str(args.duration), "--model", args.model
+    ]
+    if args.cpu_affinity:
+        command += ["--cpu-affinity", args.cpu_affinity]
+    result = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {**config, "error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    return {**config, **json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def recommend(results: list, target_p95_ms: float) -> dict:
+    valid = [r for r in results if "error" not in r and r["count"]]
+    if not valid:
+        return None
+    within = [r for r in valid if r["p95_ms"] <= target_p95_ms]
+    if within:
+        return max(within, key=lambda r: r["throughput_per_s"])
+    # Không cấu hình nào đạt mục tiêu độ trễ: chọn cấu hình có p95 thấp nhất
+    return min(valid, key=lambda r: r["p95_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=("proxy", "yamnet"), default="proxy")
+    parser.add_argument("--duration", type=float, default=3.0, help="Thời gian đo mỗi cấu hình (giây)")
+    parser.add_argument("--target-p95-ms", type=float, default=None,
+                        help="Độ trễ p95 tối đa (mặc định settings.ingest_classify_hop_ms)")
+    parser.add_argument("--cpu-affinity", help="Nhóm CPU dành cho inference, ví dụ 2-7")
+    parser.add_argument("--output", "-o")
+    # Tham số nội bộ của process con
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--intra", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--inter", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from app.core.config import settings
+    from app.core.inference_executor import available_cpus, parse_cpu_list
+
+    target = args.target_p95_ms or settings.ingest_classify_hop_ms
+    cpus = len(parse_cpu_list(args.cpu_affinity)) if args.cpu_affinity else len(available_cpus())
+    results = []
+    for config in candidate_configs(cpus, with_inter_op=args.model == "yamnet"):
+        result = measure(config, args)
+        results.append(result)
+        if "error" in result:
+            print(f"  workers={config['workers']} intra={config['intra_op_threads']} "
+                  f"inter={config['inter_op_threads']}: ❌ {result['error']}", file=sys.stderr)
+        else:
+            print(f"  workers={config['workers']} intra={config['intra_op_threads']} "
+                  f"inter={config['inter_op_threads']}: {result['throughput_per_s']}/s "
+                  f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms", file=sys.stderr)
+
+    best = recommend(results, target)
+    report = {
+        "model": args.model,
+        "cpus": cpus,
+        "target_p95_ms": target,
+        "results": results,
+        "recommended": best,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if best is None:
+        print("❌ No configuration could be measured")
+        sys.exit(1)
+    print("\n# Recommended configuration")
+    print(f"INFERENCE_WORKERS={best['workers']}")
+    print(f"INFERENCE_INTRA_OP_THREADS={best['intra_op_threads']}")
+    print(f"INFERENCE_INTER_OP_THREADS={best['inter_op_threads']}")
+    if args.cpu_affinity:
+        print(f"INFERENCE_CPU_AFFINITY=\"{args.cpu_affinity}\"")
+
+
+if __name__ == "__main__":
+    main()
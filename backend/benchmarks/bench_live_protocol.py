@@ -0,0 +1,105 @@
+"""
+So sánh giao thức JSON (cũ) và binary-v1 của WebSocket live transcription.
+
+Đo số byte trên đường truyền (cả hai chiều) và CPU phía server dành cho việc
+giải mã frame + tuần tự hóa kết quả, quy đổi trên mỗi phút audio.
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.bench_live_protocol --frame-ms 100 --minutes 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.live_protocol import (  # noqa: E402
+    LiveProtocol, PROTOCOL_BINARY_V1, PROTOCOL_JSON, encode_frame
+)
+
+
+# Header của một WebSocket frame (RFC 6455), frame client -> server có thêm 4 byte mask
+def _ws_overhead(payload_size: int, masked: bool = False) -> int:
+    if payload_size < 126:
+        header = 2
+    elif payload_size < 65536:
+        header = 4
+    else:
+        header = 10
+    return header + (4 if masked else 0)
+
+
+def _client_frames(protocol: str, seconds: float, frame_ms: int, sample_rate: int):
+    samples_per_frame = sample_rate * frame_ms // 1000
+    pcm = os.urandom(samples_per_frame * 2)
+    frames = []
+    for seq in range(int(seconds * 1000 // frame_ms)):
+        if protocol == PROTOCOL_BINARY_V1:
+            frames.append(encode_frame(seq, pcm, sample_rate=sample_rate))
+        else:
+            frames.append(pcm)
+    return frames
+
+
+def _results(count: int, final_every: int):
+    text = "Xin chào, tôi đang nói tiếng Việt"
+    for i in range(count):
+        words = text.split()
+        partial = " ".join(words[: 1 + i % len(words)])
+        yield {
+            "text": partial,
+            "confidence": 0.87,
+            "is_final": (i + 1) % final_every == 0,
+        }
+
+
+def run(protocol_name: str, minutes: float, frame_ms: int, sample_rate: int, final_every: int):
+    protocol = LiveProtocol(protocol_name, sample_rate)
+    frames = _client_frames(protocol_name, minutes * 60, frame_ms, sample_rate)
+
+    bytes_in = 0
+    bytes_out = 0
+    cpu_start = time.process_time()
+
+    for frame_bytes, result in zip(frames, _results(len(frames), final_every)):
+        bytes_in += len(frame_bytes) + _ws_overhead(len(frame_bytes), masked=True)
+        frame = protocol.decode_audio(frame_bytes)
+        message = protocol.transcription_message(result, frame)
+        if protocol.is_binary:
+            payload = protocol.encode_message(message)
+        else:
+            # Giống Starlette send_json
+            payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        bytes_out += len(payload) + _ws_overhead(len(payload))
+
+    cpu_seconds = time.process_time() - cpu_start
+
+    return {
+        "protocol": protocol_name,
+        "frames": len(frames),
+        "bytes_in_per_min": round(bytes_in / minutes),
+        "bytes_out_per_min": round(bytes_out / minutes),
+        "server_cpu_ms_per_min": round(cpu_seconds * 1000 / minutes, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=5.0)
+    parser.add_argument("--frame-ms", type=int, default=100)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--final-every", type=int, default=10, help="Cứ N kết quả thì có một kết quả final")
+    args = parser.parse_args()
+
+    report = [
+        run(name, args.minutes, args.frame_ms, args.sample_rate, args.final_every)
+        for name in (PROTOCOL_JSON, PROTOCOL_BINARY_V1)
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Đo chi phí của lớp metrics trên đường xử lý nóng.
+
+Với mỗi thao tác (counter.inc, histogram.observe, `with histogram.time()`, tra cứu label)
+đo số nanosecond trên mỗi lần gọi so với vòng lặp rỗng, và thời gian render `/metrics`
+cho một registry cỡ thực tế. Cuối cùng chạy TranscriptionService.process_audio_chunk
+có và không có metrics để thấy tỉ lệ overhead thực tế.
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.bench_metrics --iterations 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import MetricsRegistry  # noqa: E402
+
+
+def _ns_per_op(fn, iterations: int) -> float:
+    started = time.perf_counter_ns()
+    fn(iterations)
+    return (time.perf_counter_ns() - started) / iterations
+
+
+def micro(iterations: int):
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", "bench")
+    histogram = registry.histogram("bench_seconds", "bench")
+
+    def baseline(n):
+        for _ in range(n):
+            pass
+
+    def counter_inc(n):
+        inc = counter.inc
+        for _ in range(n):
+            inc()
+
+    def histogram_observe(n):
+        observe = histogram.observe
+        for _ in range(n):
+            observe(0.0042)
+
+    def histogram_timer(n):
+        for _ in range(n):
+            with histogram.time():
+                pass
+
+    def label_lookup(n):
+        for _ in range(n):
+            registry.counter("bench_labeled_total", "bench", {"channel": "socketio"}).inc()
+
+    base = _ns_per_op(baseline, iterations)
+    results = {"baseline_loop_ns": round(base, 1)}
+    for name, fn in (("counter_inc", counter_inc), ("histogram_observe", histogram_observe),
+                     ("histogram_timer", histogram_timer), ("label_lookup_inc", label_lookup)):
+        results[f"{name}_ns"] = round(_ns_per_op(fn, iterations) - base, 1)
+    return results
+
+
+def render(series: int, repeats: int = 20):
+    registry = MetricsRegistry()
+    for i in range(series):
+        registry.histogram("bench_stage_seconds", "bench", {"stage": f"s{i}"}).observe(0.01)
+        registry.counter("bench_events_total", "bench", {"kind": f"k{i}"}).inc()
+        registry.gauge("bench_depth", "bench", {"queue": f"q{i}"}, function=lambda: 3)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        text = registry.render()
+    return {
+        "series": series * 3,
+        "render_ms": round((time.perf_counter() - started) * 1000 / repeats, 3),
+        "bytes": len(text.encode())
+    }
+
+
+class _Noop:
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def hot_path(chunks: int):
+    """TranscriptionService.process_audio_chunk có và không có metrics (A/B trong cùng process)"""
+    from app.services import transcription_service as module
+
+    async def _run():
+        service = module.TranscriptionService()
+        session_id = await service.start_session(journal=False)
+        pcm = b"\x00" * 3200
+        started = time.perf_counter()
+        for seq in range(chunks):
+            await service.process_audio_chunk(session_id, pcm, seq)
+        elapsed = time.perf_counter() - started
+        await service.end_session(session_id)
+        return elapsed * 1e9 / chunks
+
+    instrumented = min(asyncio.run(_run()) for _ in range(3))
+    originals = (module.CHUNK_SECONDS, module.CHUNKS, module.CHUNK_BYTES)
+    module.CHUNK_SECONDS = module.CHUNKS = module.CHUNK_BYTES = _Noop()
+    try:
+        bare = min(asyncio.run(_run()) for _ in range(3))
+    finally:
+        module.CHUNK_SECONDS, module.CHUNKS, module.CHUNK_BYTES = originals
+
+    return {
+        "chunks": chunks,
+        "chunk_ns_instrumented": round(instrumented, 1),
+        "chunk_ns_without_metrics": round(bare, 1),
+        "overhead_pct": round((instrumented - bare) * 100 / bare, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--series", type=int, default=100, help="Số series mỗi loại metric khi đo render")
+    parser.add_argument("--chunks", type=int, default=20000)
+    args = parser.parse_args()
+
+    report = {
+        "micro": micro(args.iterations),
+        "render": render(args.series),
+        "hot_path": hot_path(args.chunks)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Đo thời gian khởi động của backend và so với ngân sách cho phép.
+
+- import: thời gian `import main` trong một interpreter mới (trừ thời gian khởi động Python)
+- health: từ lúc spawn `uvicorn main:socket_app` tới khi GET /health trả về 200
+- top_imports: các module tốn thời gian import nhất (theo `python -X importtime`)
+
+Mỗi phép đo chạy nhiều lần và lấy trung vị. Thoát với mã 1 nếu vượt --max-import-ms /
+--max-health-ms, hoặc chậm hơn file baseline (--baseline) quá --threshold phần trăm.
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.bench_startup --runs 5 -o bench-results/startup.json
+    python -m benchmarks.bench_startup --baseline bench-results/startup.json --threshold 20
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python_ms(code: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_import(runs: int) -> dict:
+    baseline = statistics.median(_python_ms("pass") for _ in range(runs))
+    total = statistics.median(_python_ms("import main") for _ in range(runs))
+    return {
+        "interpreter_ms": round(baseline, 1),
+        "import_main_ms": round(total - baseline, 1)
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _time_to_health(timeout: float) -> float:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:socket_app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=0.5) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/health not ready after {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def measure_health(runs: int, timeout: float) -> dict:
+    samples = [_time_to_health(timeout) for _ in range(runs)]
+    return {
+        "time_to_health_ms": round(statistics.median(samples), 1),
+        "samples_ms": [round(sample, 1) for sample in samples]
+    }
+
+
+def top_imports(limit: int) -> list:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        name = module.strip()
+        # Chỉ tính các module main import trực tiếp (thụt 2 ký tự) để không đếm trùng module con
+        if len(module) - len(module.lstrip(" ")) == 3:
+            rows.append({"module": name, "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:limit]
+
+
+def check(report: dict, args) -> list:
+    failures = []
+    import_ms = report["import"]["import_main_ms"]
+    health_ms = report["health"]["time_to_health_ms"]
+    if args.max_import_ms and import_ms > args.max_import_ms:
+        failures.append(f"import main {import_ms}ms > {args.max_import_ms}ms")
+    if args.max_health_ms and health_ms > args.max_health_ms:
+        failures.append(f"time to /health {health_ms}ms > {args.max_health_ms}ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        for section, key in (("import", "import_main_ms"), ("health", "time_to_health_ms")):
+            old, new = base[section][key], report[section][key]
+            if old and (new - old) * 100 / old > args.threshold:
+                failures.append(f"{key} {old}ms -> {new}ms (+{(new - old) * 100 / old:.1f}% > {args.threshold}%)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Thời gian chờ /health tối đa mỗi lần (giây)")
+    parser.add_argument("--max-import-ms", type=float, default=1500.0, help="Ngân sách import main (0 = bỏ qua)")
+    parser.add_argument("--max-health-ms", type=float, default=3000.0, help="Ngân sách tới /health đầu tiên (0 = bỏ qua)")
+    parser.add_argument("--baseline", help="File kết quả trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Phần trăm chậm đi tối đa so với baseline")
+    parser.add_argument("--output", "-o")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import": measure_import(args.runs),
+        "health": measure_health(args.runs, args.timeout),
+        "top_imports": top_imports(10)
+    }
+    failures = check(report, args)
+    report["budget_failures"] = failures
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if failures:
+        print("❌ Startup budget exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("✅ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Bộ benchmark / load test cho toàn bộ API, chạy hoàn toàn trong process.
+
+- micro: từng method của service (SpeechService, AudioClassifierService, TranscriptionService,
+  AlertService, LiveProtocol) trên audio tổng hợp
+- http: tải đồng thời vào /api/speech/upload, /api/audio/classify, /api/alerts/test
+  qua ASGI transport (không mở socket)
+- websocket: nhiều kết nối /api/transcription/live gửi frame binary-v1 theo kiểu lockstep
+
+Google Cloud Speech được thay bằng client giả (độ trễ cấu hình được), hoặc trỏ tới emulator gRPC
+cục bộ bằng --google-endpoint (xem benchmarks.speech_emulator) để đo cả chi phí gRPC / serialization.
+Kết quả (throughput, p50 / p95 / p99) ghi ra JSON để so sánh giữa các lần chạy bằng
+`python -m benchmarks.compare`.
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.bench_suite --output bench-results/run.json
+    python -m benchmarks.bench_suite --only http --concurrency 16 --requests 500
+    python -m benchmarks.bench_suite --google-endpoint localhost:50051
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from benchmarks import synthetic_audio  # noqa: E402
+from benchmarks.stubs import build_app, install_fake_google  # noqa: E402
+
+SECTIONS = ("micro", "http", "websocket")
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    """Thống kê độ trễ (ms) và throughput của một kịch bản"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(q):
+        if not ordered:
+            return None
+        return round(ordered[min(count - 1, int(q * count))] * 1000, 3)
+
+    return {
+        "count": count,
+        "errors": errors,
+        "throughput_per_s": round(count / elapsed, 2) if elapsed > 0 else None,
+        "mean_ms": round(sum(ordered) * 1000 / count, 3) if count else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+
+
+async def _time_async(fn: Callable, iterations: int, warmup: int = 3) -> Dict[str, float]:
+    # Vài lần gọi đầu (import lười, JIT của librosa, cấp phát) không được tính
+    for i in range(warmup):
+        try:
+            await fn(i)
+        except Exception:
+            pass
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        try:
+            await fn(i)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def streaming_recognize_chunk(client, pcm: bytes, language: str = "vi-VN", sample_rate: int = 16000) -> List:
+    """Gửi một chunk PCM16 trong một RPC streaming_recognize riêng và đọc hết các response"""
+    from google.cloud import speech
+
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language
+        ),
+        interim_results=True
+    )
+    requests = [speech.StreamingRecognizeRequest(audio_content=pcm)]
+    return list(client.streaming_recognize(streaming_config, requests))
+
+
+async def run_micro(main, wav_files: Dict[str, str], pcm_frames: List[bytes], iterations: int) -> Dict[str, Dict]:
+    from app.core.dependencies import audio_classifier_for
+    from app.core.live_protocol import LiveProtocol, PROTOCOL_BINARY_V1, encode_frame
+
+    state = main.app.state
+    classifier = await audio_classifier_for(state)
+    results = {}
+    for kind, path in wav_files.items():
+        results[f"speech.transcribe_audio_file[{kind}]"] = await _time_async(
+            lambda i: state.speech_service.transcribe_audio_file(path), max(1, iterations // 10))
+        results[f"classifier.classify_audio_file[{kind}]"] = await _time_async(
+            lambda i: classifier.classify_audio_file(path), max(1, iterations // 10))
+
+    # Một RPC streaming_recognize cho mỗi chunk - chỉ để đo chi phí RPC (client giả hoặc emulator),
+    # gọi thẳng client, không qua slot của scheduler
+    client = state.speech_service.client
+    if client is not None:
+        results["google.streaming_recognize"] = await _time_async(
+            lambda i: asyncio.to_thread(streaming_recognize_chunk, client, pcm_frames[i % len(pcm_frames)]),
+            iterations)
+
+    results["classifier.detect_critical_sounds"] = await _time_async(
+        lambda i: classifier.detect_critical_sounds(pcm_frames[i % len(pcm_frames)]), iterations)
+
+    service = state.transcription_service
+    session_id = await service.start_session(journal=False)
+    results["transcription.process_audio_chunk"] = await _time_async(
+        lambda i: service.process_audio_chunk(session_id, pcm_frames[i % len(pcm_frames)], i), iterations)
+    await service.end_session(session_id)
+
+    alert_service = state.alert_service
+    sound_types = list(alert_service.alert_settings)
+    results["alerts.trigger_alert"] = await _time_async(
+        lambda i: alert_service.trigger_alert(sound_types[i % len(sound_types)], 0.95, device_id=f"bench_{i % 64}"),
+        iterations)
+
+    protocol = LiveProtocol(PROTOCOL_BINARY_V1)
+    encoded = [encode_frame(i, frame) for i, frame in enumerate(pcm_frames)]
+
+    async def decode(i):
+        protocol.decode_audio(encoded[i % len(encoded)])
+
+    results["live_protocol.decode_audio"] = await _time_async(decode, iterations)
+    return results
+
+
+async def run_http(main, wav_bytes: Dict[str, bytes], requests: int, concurrency: int) -> Dict[str, Dict]:
+    import httpx
+
+    scenarios = {
+        "POST /api/speech/upload": lambda client, i: client.post(
+            "/api/speech/upload", files={"file": ("bench.wav", wav_bytes[_pick(wav_bytes, i)], "audio/wav")}),
+        "POST /api/audio/classify": lambda client, i: client.post(
+            "/api/audio/classify", files={"file": ("bench.wav", wav_bytes[_pick(wav_bytes, i)], "audio/wav")}),
+        "POST /api/alerts/test": lambda client, i: client.post("/api/alerts/test"),
+        "GET /api/alerts/statistics": lambda client, i: client.get("/api/alerts/statistics"),
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, request in scenarios.items():
+            latencies = []
+            errors = 0
+            counter = iter(range(requests))
+
+            async def worker():
+                nonlocal errors
+                for i in counter:
+                    t0 = time.perf_counter()
+                    try:
+                        response = await request(client, i)
+                        if response.status_code >= 400:
+                            errors += 1
+                            continue
+                    except Exception:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - t0)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            results[name] = summarize(latencies, time.perf_counter() - started, errors)
+    return results
+
+
+def _pick(options: Dict[str, bytes], i: int) -> str:
+    keys = sorted(options)
+    return keys[i % len(keys)]
+
+
+def run_websocket(client, pcm_frames: List[bytes], connections: int, frames: int) -> Dict[str, Dict]:
+    """
+    Mỗi kết nối gửi một frame rồi một frame sentinel không hợp lệ; server xử lý tuần tự nên
+    message lỗi của sentinel đến sau kết quả của frame - thời gian tới lúc nhận được nó là
+    độ trễ xử lý một frame, kể cả khi kết quả partial bị stabilizer bỏ qua.
+    """
+    import msgpack
+    from app.core.live_protocol import PROTOCOL_BINARY_V1, encode_frame
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def session(client):
+        local = []
+        try:
+            with client.websocket_connect("/api/transcription/live") as ws:
+                ws.send_json({"protocol": PROTOCOL_BINARY_V1})
+                ws.receive_json()
+                for seq in range(frames):
+                    frame = encode_frame(seq, pcm_frames[seq % len(pcm_frames)])
+                    t0 = time.perf_counter()
+                    ws.send_bytes(frame)
+                    ws.send_bytes(b"\x00")
+                    while msgpack.unpackb(ws.receive_bytes())["t"] != "er":
+                        pass
+                    local.append(time.perf_counter() - t0)
+        except Exception:
+            with lock:
+                errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=session, args=(client,)) for _ in range(connections)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {"WS /api/transcription/live (frame round trip)": summarize(latencies, elapsed, errors[0])}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", "-o", help="File JSON kết quả (mặc định in ra stdout)")
+    parser.add_argument("--only", help=f"Chỉ chạy một số phần, phân tách bằng dấu phẩy: {','.join(SECTIONS)}")
+    parser.add_argument("--iterations", type=int, default=2000, help="Số lần gọi cho mỗi micro-benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="Số request cho mỗi kịch bản HTTP")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=4, help="Số kết nối WebSocket đồng thời")
+    parser.add_argument("--frames", type=int, default=200, help="Số frame mỗi kết nối WebSocket")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Độ dài file audio upload")
+    parser.add_argument("--frame-ms", type=int, default=100)
+    parser.add_argument("--google-latency-ms", type=float, default=0.0, help="Độ trễ giả lập của Google API")
+    parser.add_argument("--google-endpoint", help="Dùng Speech API tại host:port (emulator) thay cho client giả")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sections = args.only.split(",") if args.only else list(SECTIONS)
+    if args.google_endpoint:
+        from app.core.config import settings
+        settings.google_speech_endpoint = args.google_endpoint
+    main_module = build_app()
+
+    signals = {kind: synthetic_audio.generate(kind, args.audio_seconds, seed=args.seed)
+               for kind in synthetic_audio.SIGNALS}
+    wav_bytes = {kind: synthetic_audio.to_wav_bytes(audio) for kind, audio in signals.items()}
+    frame_samples = synthetic_audio.SAMPLE_RATE * args.frame_ms // 1000
+    speech_pcm = synthetic_audio.to_pcm16(synthetic_audio.speech_like(args.audio_seconds, seed=args.seed))
+    pcm_frames = [speech_pcm[i:i + frame_samples * 2]
+                  for i in range(0, len(speech_pcm) - frame_samples * 2 + 1, frame_samples * 2)]
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": vars(args),
+        }
+    }
+
+    # Mọi phần chạy trong event loop của TestClient để lifespan của app (dispatcher, bus, log)
+    # khởi động và dừng đúng như khi chạy thật
+    with TestClient(main_module.socket_app) as client, tempfile.TemporaryDirectory(prefix="bench-audio-") as wav_dir:
+        if not args.google_endpoint:
+            install_fake_google(main_module.app.state, args.google_latency_ms)
+        if "micro" in sections:
+            wav_files = {}
+            for kind, data in wav_bytes.items():
+                wav_files[kind] = os.path.join(wav_dir, f"{kind}.wav")
+                with open(wav_files[kind], "wb") as f:
+                    f.write(data)
+            report["micro"] = client.portal.call(run_micro, main_module, wav_files, pcm_frames, args.iterations)
+        if "http" in sections:
+            report["http"] = client.portal.call(run_http, main_module, wav_bytes, args.requests, args.concurrency)
+        if "websocket" in sections:
+            report["websocket"] = run_websocket(client, pcm_frames, args.connections, args.frames)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Benchmark results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
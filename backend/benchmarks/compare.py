@@ -0,0 +1,78 @@
+"""
+So sánh hai file kết quả của bench_suite và đánh dấu các kịch bản bị chậm đi.
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.compare bench-results/base.json bench-results/new.json --threshold 10
+
+Thoát với mã 1 nếu có kịch bản nào có p50 / p95 / p99 tăng (hoặc throughput giảm) quá ngưỡng.
+"""
+import argparse
+import json
+import sys
+
+SECTIONS = ("micro", "http", "websocket")
+# metric -> True nếu giá trị lớn hơn là tốt hơn
+METRICS = {
+    "throughput_per_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+def compare(base: dict, new: dict, threshold: float):
+    rows = []
+    regressions = []
+    for section in SECTIONS:
+        for name, new_stats in new.get(section, {}).items():
+            base_stats = base.get(section, {}).get(name)
+            if base_stats is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                old, cur = base_stats.get(metric), new_stats.get(metric)
+                if not old or cur is None:
+                    continue
+                change = (cur - old) * 100 / old
+                worse = -change if higher_is_better else change
+                row = (section, name, metric, old, cur, change)
+                rows.append(row)
+                if worse > threshold:
+                    regressions.append(row)
+    return rows, regressions
+
+
+def _format(row) -> str:
+    section, name, metric, old, cur, change = row
+    return f"{section:<9} {name:<55} {metric:<17} {old:>12} {cur:>12} {change:>+8.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Phần trăm thay đổi tối đa cho phép")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    rows, regressions = compare(base, new, args.threshold)
+    print(f"{'section':<9} {'scenario':<55} {'metric':<17} {'base':>12} {'new':>12} {'change':>9}")
+    for row in rows:
+        print(_format(row))
+
+    print()
+    print(f"base: {base.get('meta', {}).get('git_commit')}  new: {new.get('meta', {}).get('git_commit')}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) vượt ngưỡng {args.threshold}%:")
+        for row in regressions:
+            print("  " + _format(row))
+        sys.exit(1)
+    print(f"✅ Không có regression vượt ngưỡng {args.threshold}%")
+
+
+if __name__ == "__main__":
+    main()
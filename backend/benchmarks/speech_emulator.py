@@ -0,0 +1,313 @@
+"""
+Emulator cục bộ của Google Cloud Speech API (gRPC google.cloud.speech.v1.Speech), để đo năng lực và
+độ trễ đuôi của SpeechService mà không cần credentials hay mạng.
+
+- Recognize / StreamingRecognize trả về transcript tất định: cùng audio luôn cho cùng kết quả
+  (chọn từ trong một bộ từ vựng theo hash của audio, số từ tỉ lệ với độ dài audio)
+- độ trễ: phân phối log-normal cho bởi median và p99, cộng thêm một phần tỉ lệ với độ dài audio
+- lỗi: tỉ lệ lỗi và mã lỗi gRPC cấu hình được (mặc định UNAVAILABLE)
+- giới hạn độ dài stream như API thật (OUT_OF_RANGE khi audio của một stream vượt quá giới hạn)
+- throttling: số RPC đồng thời tối đa và số request / giây (RESOURCE_EXHAUSTED khi vượt)
+
+Trỏ SpeechService vào emulator bằng GOOGLE_SPEECH_ENDPOINT=localhost:50051 (kết nối không TLS).
+
+Chạy từ thư mục backend:
+
+    python -m benchmarks.speech_emulator --port 50051 --latency-ms 120 --latency-p99-ms 900
+    python -m benchmarks.speech_emulator --error-rate 0.02 --max-concurrent 8 --rate-limit 50
+    python -m benchmarks.bench_suite --google-endpoint localhost:50051
+"""
+import argparse
+import hashlib
+import math
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent import futures
+from typing import Dict, Any, List, Optional
+
+import grpc
+from google.cloud.speech_v1 import types
+
+SERVICE_NAME = "google.cloud.speech.v1.Speech"
+# Giới hạn của Google cho một streaming_recognize (giây audio)
+DEFAULT_MAX_STREAM_SECONDS = 305
+# Tốc độ nói ước lượng để chọn số từ của transcript
+WORDS_PER_SECOND = 2.5
+
+VOCABULARY = {
+    "vi": ("xin", "chào", "hôm", "nay", "trời", "đẹp", "tôi", "muốn", "đi", "chợ", "cảm", "ơn",
+           "bạn", "có", "khỏe", "không", "chúng", "ta", "cùng", "ăn", "cơm", "nhé", "mẹ", "ơi"),
+    "en": ("hello", "this", "is", "a", "test", "of", "the", "speech", "emulator", "please", "call",
+           "me", "back", "when", "you", "can", "thank", "good", "morning", "door", "is", "open"),
+}
+
+# Số byte mỗi mẫu theo encoding (các encoding nén được tính như LINEAR16)
+ENCODING_SAMPLE_WIDTH = {
+    types.RecognitionConfig.AudioEncoding.LINEAR16: 2,
+    types.RecognitionConfig.AudioEncoding.MULAW: 1,
+}
+
+
+def audio_seconds(config: types.RecognitionConfig, num_bytes: int) -> float:
+    width = ENCODING_SAMPLE_WIDTH.get(config.encoding, 2)
+    channels = max(1, config.audio_channel_count or 1)
+    return num_bytes / (max(1, config.sample_rate_hertz or 16000) * width * channels)
+
+
+def deterministic_transcript(content: bytes, seconds: float, language: str) -> Dict[str, Any]:
+    """Transcript và độ tin cậy chỉ phụ thuộc vào nội dung audio"""
+    digest = hashlib.sha256(content).digest()
+    words = VOCABULARY["vi" if language.startswith("vi") else "en"]
+    count = max(1, round(seconds * WORDS_PER_SECOND))
+    text = " ".join(words[digest[i % len(digest)] % len(words)] for i in range(count))
+    return {"transcript": text, "confidence": round(0.80 + digest[0] / 255 * 0.19, 3)}
+
+
+class TokenBucket:
+    """Giới hạn số request / giây (cho phép dồn tối đa `burst` request)"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class SpeechEmulator:
+    """
+    Cài đặt RPC Recognize / StreamingRecognize với độ trễ, lỗi và throttling cấu hình được
+    """
+
+    def __init__(self, latency_ms: float = 100.0, latency_p99_ms: Optional[float] = None,
+                 latency_per_audio_second_ms: float = 0.0, error_rate: float = 0.0,
+                 error_code: str = "UNAVAILABLE", max_stream_seconds: float = DEFAULT_MAX_STREAM_SECONDS,
+                 max_concurrent: int = 0, rate_limit: float = 0.0, interim_every: int = 1, seed: int = 0):
+        self.latency = latency_ms / 1000
+        # sigma của log-normal sao cho p99 = median * exp(2.326 * sigma)
+        p99 = latency_p99_ms / 1000 if latency_p99_ms else self.latency
+        self.sigma = math.log(p99 / self.latency) / 2.326 if self.latency > 0 and p99 > self.latency else 0.0
+        self.latency_per_audio_second = latency_per_audio_second_ms / 1000
+        self.error_rate = error_rate
+        self.error_code = grpc.StatusCode[error_code]
+        self.max_stream_seconds = max_stream_seconds
+        self.max_concurrent = max_concurrent
+        self.bucket = TokenBucket(rate_limit) if rate_limit > 0 else None
+        self.interim_every = max(1, interim_every)
+
+        # Độ trễ / lỗi được rút từ cùng một chuỗi ngẫu nhiên có seed - lặp lại được giữa các lần chạy
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.stats = {
+            "recognize": 0,
+            "streaming_recognize": 0,
+            "audio_seconds": 0.0,
+            "injected_errors": 0,
+            "throttled": 0,
+            "stream_limit_exceeded": 0,
+        }
+
+    # --- RPC ---
+
+    def recognize(self, request: types.RecognizeRequest, context) -> types.RecognizeResponse:
+        self._admit(context, "recognize")
+        try:
+            content = request.audio.content
+            seconds = audio_seconds(request.config, len(content))
+            self._count_audio(seconds)
+            self._fail_randomly(context)
+            self._sleep(self._sample_latency(seconds), context)
+            return types.RecognizeResponse(
+                results=[self._result(content, seconds, request.config.language_code)],
+                total_billed_time={"seconds": math.ceil(seconds)},
+            )
+        finally:
+            self._leave()
+
+    def streaming_recognize(self, requests, context):
+        self._admit(context, "streaming_recognize")
+        try:
+            first = next(requests, None)
+            if first is None or "streaming_config" not in first:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT,
+                              "The first request must contain only streaming_config")
+            streaming_config = first.streaming_config
+            config = streaming_config.config
+            self._fail_randomly(context)
+
+            audio = bytearray()
+            chunks = 0
+            for request in requests:
+                audio.extend(request.audio_content)
+                chunks += 1
+                seconds = audio_seconds(config, len(audio))
+                if seconds > self.max_stream_seconds:
+                    with self._lock:
+                        self.stats["stream_limit_exceeded"] += 1
+                    context.abort(grpc.StatusCode.OUT_OF_RANGE,
+                                  f"Exceeded maximum allowed stream duration of {self.max_stream_seconds:g} seconds.")
+                if streaming_config.interim_results and chunks % self.interim_every == 0:
+                    self._sleep(self._sample_latency(0.0), context)
+                    yield types.StreamingRecognizeResponse(results=[
+                        self._streaming_result(bytes(audio), seconds, config.language_code, is_final=False)
+                    ])
+
+            seconds = audio_seconds(config, len(audio))
+            self._count_audio(seconds)
+            self._sleep(self._sample_latency(seconds), context)
+            yield types.StreamingRecognizeResponse(
+                results=[self._streaming_result(bytes(audio), seconds, config.language_code, is_final=True)],
+                total_billed_time={"seconds": math.ceil(seconds)},
+            )
+        finally:
+            self._leave()
+
+    # --- Mô phỏng hành vi của API ---
+
+    def _admit(self, context, method: str):
+        with self._lock:
+            throttled = (
+                (self.max_concurrent and self.active >= self.max_concurrent)
+                or (self.bucket is not None and not self.bucket.take())
+            )
+            if throttled:
+                self.stats["throttled"] += 1
+            else:
+                self.active += 1
+                self.stats[method] += 1
+        if throttled:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Quota exceeded (emulated)")
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def _fail_randomly(self, context):
+        with self._lock:
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.stats["injected_errors"] += 1
+        if failed:
+            context.abort(self.error_code, "Injected failure (emulated)")
+
+    def _sample_latency(self, seconds: float) -> float:
+        with self._lock:
+            jitter = self._random.lognormvariate(0.0, self.sigma) if self.sigma else 1.0
+        return self.latency * jitter + self.latency_per_audio_second * seconds
+
+    def _count_audio(self, seconds: float):
+        with self._lock:
+            self.stats["audio_seconds"] += seconds
+
+    @staticmethod
+    def _sleep(seconds: float, context):
+        # Không ngủ quá deadline của client - client đã nhận DEADLINE_EXCEEDED từ phía nó
+        remaining = context.time_remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(0.0, remaining))
+        if seconds > 0:
+            time.sleep(seconds)
+
+    @staticmethod
+    def _alternative(content: bytes, seconds: float, language: str) -> types.SpeechRecognitionAlternative:
+        return types.SpeechRecognitionAlternative(**deterministic_transcript(content, seconds, language or "en-US"))
+
+    def _result(self, content: bytes, seconds: float, language: str) -> types.SpeechRecognitionResult:
+        return types.SpeechRecognitionResult(
+            alternatives=[self._alternative(content, seconds, language)],
+            result_end_time={"seconds": int(seconds), "nanos": int(seconds % 1 * 1e9)},
+            language_code=language,
+        )
+
+    def _streaming_result(self, content: bytes, seconds: float, language: str,
+                          is_final: bool) -> types.StreamingRecognitionResult:
+        return types.StreamingRecognitionResult(
+            alternatives=[self._alternative(content, seconds, language)],
+            is_final=is_final,
+            stability=0.0 if is_final else 0.8,
+            result_end_time={"seconds": int(seconds), "nanos": int(seconds % 1 * 1e9)},
+            language_code=language,
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "audio_seconds": round(self.stats["audio_seconds"], 3), "active": self.active}
+
+
+def serve(emulator: SpeechEmulator, port: int = 50051, host: str = "127.0.0.1", workers: int = 32):
+    """
+    Khởi động gRPC server (không TLS) cho emulator; trả về (server, port thực tế).
+    port = 0 chọn cổng trống - dùng khi chạy emulator trong cùng process với benchmark.
+    """
+    handlers = {
+        "Recognize": grpc.unary_unary_rpc_method_handler(
+            emulator.recognize,
+            request_deserializer=types.RecognizeRequest.deserialize,
+            response_serializer=types.RecognizeResponse.serialize,
+        ),
+        "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+            emulator.streaming_recognize,
+            request_deserializer=types.StreamingRecognizeRequest.deserialize,
+            response_serializer=types.StreamingRecognizeResponse.serialize,
+        ),
+    }
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speech-emulator"))
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE_NAME, handlers),))
+    bound = server.add_insecure_port(f"{host}:{port}")
+    server.start()
+    return server, bound
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50051)
+    parser.add_argument("--workers", type=int, default=32, help="Số thread xử lý RPC của server")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Độ trễ median")
+    parser.add_argument("--latency-p99-ms", type=float, help="Độ trễ p99 (mặc định bằng median: không dao động)")
+    parser.add_argument("--latency-per-audio-second-ms", type=float, default=0.0,
+                        help="Độ trễ thêm cho mỗi giây audio của request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ RPC bị lỗi (0-1)")
+    parser.add_argument("--error-code", default="UNAVAILABLE", choices=[code.name for code in grpc.StatusCode])
+    parser.add_argument("--max-stream-seconds", type=float, default=DEFAULT_MAX_STREAM_SECONDS,
+                        help="Độ dài audio tối đa của một stream")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Số RPC đồng thời tối đa (0 = không giới hạn)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Số RPC / giây tối đa (0 = không giới hạn)")
+    parser.add_argument("--interim-every", type=int, default=1, help="Gửi kết quả interim sau mỗi N chunk stream")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    emulator = SpeechEmulator(
+        latency_ms=args.latency_ms, latency_p99_ms=args.latency_p99_ms,
+        latency_per_audio_second_ms=args.latency_per_audio_second_ms, error_rate=args.error_rate,
+        error_code=args.error_code, max_stream_seconds=args.max_stream_seconds,
+        max_concurrent=args.max_concurrent, rate_limit=args.rate_limit,
+        interim_every=args.interim_every, seed=args.seed,
+    )
+    server, port = serve(emulator, args.port, args.host, args.workers)
+    print(f"✅ Speech emulator listening on {args.host}:{port} (GOOGLE_SPEECH_ENDPOINT={args.host}:{port})")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    stopped.wait()
+    server.stop(grace=1).wait()
+    print(f"🛑 Speech emulator stopped: {emulator.get_stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Thay thế các phụ thuộc ngoài khi benchmark: Google Cloud Speech client giả lập độ trễ,
+để đo được code của chính ứng dụng mà không cần mạng hay credentials.
+(YAMNet hiện vẫn là model mock nên không cần thay.)
+"""
+import time
+from types import SimpleNamespace
+
+
+class FakeSpeechClient:
+    """SpeechClient.recognize / streaming_recognize giả: chờ latency_ms rồi trả về một kết quả cố định"""
+
+    def __init__(self, latency_ms: float = 0.0, transcript: str = "xin chào đây là benchmark"):
+        self.latency = latency_ms / 1000
+        self.transcript = transcript
+        self.calls = 0
+
+    def recognize(self, config=None, audio=None, timeout=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        alternative = SimpleNamespace(transcript=self.transcript, confidence=0.92)
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+    def streaming_recognize(self, config=None, requests=None, timeout=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        alternative = SimpleNamespace(transcript=self.transcript, confidence=0.92)
+        result = SimpleNamespace(alternatives=[alternative], is_final=True, stability=0.0)
+        return iter([SimpleNamespace(results=[result])])
+
+
+def build_app():
+    """
+    Module main với app FastAPI đầy đủ router (import lười để không tạo app khi chỉ dùng client giả)
+    """
+    import main
+
+    return main
+
+
+def install_fake_google(state, latency_ms: float = 0.0) -> FakeSpeechClient:
+    """Thay Google client của SpeechService (sau khi lifespan đã tạo service)"""
+    client = FakeSpeechClient(latency_ms)
+    state.speech_service.client = client
+    return client
@@ -1,15 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import socketio
-from app.api import speech, alerts, transcription  # audio_classifier tạm thời bỏ
+from app.api import speech, audio_classifier, alerts, transcription, profiling
+from app.core.admission import AdmissionMiddleware, admission_controller, LIVE
+from app.core.config import settings
+from app.core import deadline
+from app.core.deadline import DeadlineMiddleware
+from app.core.dependencies import create_services, warm_up
+from app.core.fair_scheduler import WorkContextMiddleware, inference_scheduler
+from app.core.security import verify_device_token
+from app.core.metrics import REGISTRY
+from app.core.profiling import ProfilingMiddleware, request_profiler
+from app.services.alert_dispatcher import device_room, socketio_channel
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Tạo service, khởi động / dừng các thành phần nền"""
+    state = app.state
+    create_services(state)
+    
+    # Alert được push tới thiết bị qua Socket.IO
+    state.alert_service.dispatcher.register_channel(
+        "socketio", socketio_channel(sio),
+        workers=settings.alert_socketio_workers, max_queue=settings.alert_dispatch_max_queue
+    )
+    await state.alert_service.start()
+    
+    # Nạp thư viện / model nặng ở nền - app phục vụ request ngay, không chờ warm-up
+    warm_task = asyncio.get_running_loop().create_task(warm_up(state)) if settings.warm_up_on_startup else None
+    
+    yield
+    
+    if warm_task is not None:
+        await asyncio.gather(warm_task, return_exceptions=True)
+    for sid in list(state.ingestion.pipelines):
+        await stop_ingestion(sid)
+    await state.alert_service.close()
+    await state.transcription_service.stop_reaper()
+    state.inference_executor.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
     title="AI Companion - Hỗ trợ người khiếm thính",
     description="Hệ thống AI hỗ trợ người khiếm thính với Speech-to-Text và Audio Classification",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Admission control theo lớp ưu tiên - thêm trước CORS để response 503 vẫn có header CORS
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Gắn tenant / lớp ưu tiên cho request để lịch inference chia năng lực công bằng giữa các client
+app.add_middleware(WorkContextMiddleware)
+
+# Deadline từ header X-Deadline / X-Timeout-Ms được truyền tới các service
+app.add_middleware(DeadlineMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -19,10 +69,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Socket.IO server
+# Profiling theo request - chỉ cài khi bật, để không tốn gì khi tắt
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
+# Socket.IO server - với nhiều worker, Redis manager giúp emit tới client đang kết nối ở worker khác
 sio = socketio.AsyncServer(
     async_mode='asgi',
-    cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000"]
+    cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    client_manager=socketio.AsyncRedisManager(settings.redis_url) if settings.alert_bus_backend == "redis" else None
 )
 
 # Combine FastAPI and Socket.IO
@@ -30,32 +85,89 @@ socket_app = socketio.ASGIApp(sio, app)
 
 # Include API routes
 app.include_router(speech.router, prefix="/api/speech", tags=["speech"])
-# app.include_router(audio_classifier.router, prefix="/api/audio", tags=["audio"])  # Tạm thời comment
+app.include_router(audio_classifier.router, prefix="/api/audio", tags=["audio"])
 app.include_router(alerts.router, prefix="/api/alerts", tags=["alerts"])
 app.include_router(transcription.router, prefix="/api/transcription", tags=["transcription"])
+app.include_router(profiling.router, prefix="/api/profiling", tags=["profiling"])
 
 # Socket.IO event handlers
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     print(f"Client {sid} connected")
+    # Thiết bị chỉ được định danh bằng token do server ký (auth {"device_token": ...});
+    # kết nối không có token là một thiết bị ẩn danh riêng (device_id = sid)
+    device_id = verify_device_token(auth.get("device_token")) if isinstance(auth, dict) else None
+    await sio.save_session(sid, {"device_id": device_id})
+    if device_id:
+        # Nhận alert của thiết bị ngay, kể cả khi chưa gửi audio
+        await join_device_room(sid, device_id)
     await sio.emit('connected', {'message': 'Kết nối thành công!'}, room=sid)
 
 @sio.event
 async def disconnect(sid):
     print(f"Client {sid} disconnected")
+    await stop_ingestion(sid)
+
+async def join_device_room(sid, device_id):
+    """Chuyển kết nối vào room của device_id (rời room thiết bị cũ nếu có)"""
+    room = device_room(device_id)
+    for joined in sio.rooms(sid):
+        if joined.startswith("device:") and joined != room:
+            await sio.leave_room(sid, joined)
+    await sio.enter_room(sid, room)
+
+async def stop_ingestion(sid):
+    """Dừng pipeline của kết nối và trả slot stream cho admission control"""
+    summary = await app.state.ingestion.stop(sid)
+    if summary is not None and settings.admission_enabled:
+        admission_controller.release(LIVE)
+    return summary
 
 @sio.event
 async def start_transcription(sid, data):
     """Bắt đầu phiên transcription real-time"""
     print(f"Starting transcription for client {sid}")
-    # TODO: Implement real-time transcription logic
-    await sio.emit('transcription_started', {'status': 'started'}, room=sid)
+    
+    async def emit(event, payload):
+        await sio.emit(event, payload, room=sid)
+    
+    # Bắt đầu lại phiên trên cùng kết nối thì dùng lại slot cũ
+    restarting = sid in app.state.ingestion.pipelines
+    if settings.admission_enabled and not restarting and not admission_controller.try_acquire(LIVE):
+        retry_after = admission_controller.retry_after(LIVE)
+        await sio.emit('error', {'message': "Server đang quá tải, vui lòng thử lại sau",
+                                 'retry_after': retry_after}, room=sid)
+        return
+    
+    try:
+        # device_id trong cấu hình của client bị bỏ qua - chỉ dùng thiết bị đã xác thực khi kết nối
+        session = await sio.get_session(sid)
+        config = {**(data or {}), "device_id": session.get("device_id")}
+        started = await app.state.ingestion.start(sid, config, emit)
+        # Alert phát hiện trên luồng audio này chỉ được push tới các kết nối của cùng thiết bị
+        await join_device_room(sid, started["device_id"])
+        await sio.emit('transcription_started', started, room=sid)
+    except Exception as e:
+        # Pipeline cũ (nếu có) đã bị dừng, pipeline mới không được tạo
+        if settings.admission_enabled:
+            admission_controller.release(LIVE)
+        await sio.emit('error', {'message': f"Lỗi bắt đầu transcription: {str(e)}"}, room=sid)
+
+@sio.event
+async def audio_frame(sid, data):
+    """Frame audio từ client (raw PCM16 hoặc frame binary-v1 tùy giao thức đã chọn)"""
+    try:
+        if not await app.state.ingestion.feed(sid, data):
+            await sio.emit('error', {'message': "Chưa bắt đầu phiên transcription"}, room=sid)
+    except Exception as e:
+        await sio.emit('error', {'message': f"Lỗi xử lý audio: {str(e)}"}, room=sid)
 
 @sio.event
 async def stop_transcription(sid, data):
     """Dừng phiên transcription"""
     print(f"Stopping transcription for client {sid}")
-    await sio.emit('transcription_stopped', {'status': 'stopped'}, room=sid)
+    summary = await stop_ingestion(sid)
+    await sio.emit('transcription_stopped', {'status': 'stopped', 'summary': summary}, room=sid)
 
 # Health check endpoint
 @app.get("/")
@@ -70,6 +182,36 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics theo định dạng text của Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/pipeline/stats")
+async def pipeline_stats():
+    """Thống kê pipeline Socket.IO: số kết nối, độ trễ từng giai đoạn (decode, stt, classify, alert, emit)"""
+    return app.state.ingestion.get_stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Thống kê admission control: số request đang chạy / đang chờ / bị từ chối theo từng lớp ưu tiên"""
+    return admission_controller.get_stats()
+
+@app.get("/inference/stats")
+async def inference_stats():
+    """Cấu hình và thống kê inference executor (worker, thread TF, affinity, độ trễ)"""
+    return app.state.inference_executor.get_stats()
+
+@app.get("/deadline/stats")
+async def deadline_stats():
+    """Số việc bị bỏ vì quá deadline theo từng giai đoạn (queue, decode, inference, google, stt, emit)"""
+    return deadline.get_stats()
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Thống kê lịch inference: slot đang chạy theo tenant, hàng đợi theo (tenant, lớp), thời gian chờ"""
+    return inference_scheduler.get_stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:socket_app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file